@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Script para alinhar as séries de dados_historicos em um calendário mestre
+
+dados_historicos mistura tickers da B3, câmbio (USDBRL=X) e séries de taxa
+(CDI). Este passo monta o calendário mestre de dias úteis da B3 e grava em
+dados_alinhados um nível por série e dia útil:
+
+- preço: último fechamento (ajustado) conhecido até o dia (forward-fill);
+  observações fora do calendário (câmbio em feriado) valem a partir do
+  próximo dia útil
+- taxa: a taxa (%) é repetida em cada dia útil do calendário mestre até a
+  próxima observação e capitalizada dia a dia em um índice base 100; taxas
+  mensais e anuais são convertidas na taxa equivalente por dia útil
+
+O alinhamento é vetorizado sobre o lote de tickers (searchsorted em chaves
+ticker+posição), sem laço por ticker ou por dia.
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+from data_access import get_postgres_connection
+from trading_calendar import business_days, get_rate_tickers
+from scan_quality import iter_ticker_frames, shifted
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Colunas lidas de dados_historicos (preço ajustado quando houver)
+ALIGN_COLUMNS = ['ticker', 'data', 'COALESCE(fechamento_ajustado, fechamento) AS fechamento']
+
+# Base dos índices capitalizados a partir de séries de taxa
+RATE_INDEX_BASE = 100.0
+
+# Dias úteis por ano na conversão de taxas anuais (convenção 252)
+BUSINESS_DAYS_PER_YEAR = 252
+
+def get_max_fill():
+    """Dias úteis repetidos após a última observação de uma série (ALIGN_MAX_FILL)"""
+    return max(0, int(os.getenv('ALIGN_MAX_FILL', 10)))
+
+def get_batch_tickers():
+    """Tickers alinhados por lote (ALIGN_BATCH_TICKERS)"""
+    return max(1, int(os.getenv('ALIGN_BATCH_TICKERS', 200)))
+
+def create_alignment_tables(conn):
+    """Cria as tabelas do calendário mestre e das séries alinhadas"""
+    cursor = conn.cursor()
+    
+    sql_commands = [
+        # Dias úteis da B3 cobrindo todo dados_historicos
+        """
+        CREATE TABLE IF NOT EXISTS calendario_mestre (
+            data DATE PRIMARY KEY,
+            indice INTEGER NOT NULL
+        )
+        """,
+        
+        # Uma linha por série alinhada (id compacto usado em dados_alinhados)
+        """
+        CREATE TABLE IF NOT EXISTS series_alinhadas (
+            id SERIAL PRIMARY KEY,
+            ticker VARCHAR(20) UNIQUE NOT NULL,
+            tipo VARCHAR(10) NOT NULL CHECK (tipo IN ('preco', 'taxa')),
+            alinhado_em TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        
+        # Nível por série e dia útil; preenchido = sem observação no dia
+        """
+        CREATE TABLE IF NOT EXISTS dados_alinhados (
+            serie_id INTEGER NOT NULL,
+            data DATE NOT NULL,
+            nivel DOUBLE PRECISION NOT NULL,
+            preenchido BOOLEAN NOT NULL DEFAULT false,
+            PRIMARY KEY (serie_id, data)
+        )
+        """,
+        
+        # Watermark próprio do alinhamento: pendente_desde é limpo pelo
+        # refresh dos resumos, que pode rodar antes deste passo
+        """
+        ALTER TABLE controle_carga ADD COLUMN IF NOT EXISTS alinhado_em TIMESTAMP WITH TIME ZONE
+        """,
+        
+        """
+        CREATE OR REPLACE VIEW vw_dados_alinhados AS
+        SELECT s.ticker, s.tipo, a.data, a.nivel, a.preenchido
+        FROM dados_alinhados a
+        JOIN series_alinhadas s ON s.id = a.serie_id
+        """
+    ]
+    
+    try:
+        for command in sql_commands:
+            cursor.execute(command)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def build_master_calendar(cursor):
+    """Recria calendario_mestre do primeiro ao último dia de dados_historicos"""
+    cursor.execute("SELECT MIN(data), MAX(data) FROM dados_historicos")
+    first, last = cursor.fetchone()
+    
+    if first is None:
+        return np.array([], dtype='datetime64[D]')
+    
+    calendar = business_days(first, last, 'b3')
+    
+    buffer = io.StringIO()
+    pd.DataFrame({'data': calendar, 'indice': np.arange(len(calendar))}).to_csv(
+        buffer, index=False, header=False, date_format='%Y-%m-%d')
+    buffer.seek(0)
+    
+    cursor.execute("TRUNCATE calendario_mestre")
+    cursor.copy_expert("COPY calendario_mestre (data, indice) FROM STDIN WITH (FORMAT csv)", buffer)
+    return calendar
+
+def month_business_days(calendar):
+    """Dias úteis da B3 no mês de cada data do calendário (meses completos)"""
+    months = calendar.astype('datetime64[M]')
+    full = business_days(months.min().astype('datetime64[D]'),
+                         (months.max() + 1).astype('datetime64[D]') - 1, 'b3')
+    labels, counts = np.unique(full.astype('datetime64[M]'), return_counts=True)
+    return counts[np.searchsorted(labels, months)]
+
+def compound_rate_levels(codes, rates, periods=1, overnight=True, base=RATE_INDEX_BASE):
+    """Capitaliza taxas (%) em níveis de índice por ticker, um passo por dia útil
+    
+    codes/rates têm uma linha por dia útil (taxa já repetida nos dias sem
+    observação) e periods é o número de dias úteis do período da taxa. O
+    nível do primeiro dia é `base`. Com overnight a taxa de um dia rende até
+    o seguinte (CDI); sem ele rende no próprio dia, e o nível no último dia
+    útil de um mês fecha a taxa mensal exata.
+    """
+    logs = np.log1p(rates / 100) / periods
+    accrued = np.cumsum(logs) - np.where(overnight, logs, 0.0)
+    
+    starts = codes != shifted(codes, -1)
+    group = np.cumsum(starts) - 1
+    return base * np.exp(accrued - accrued[starts][group])
+
+def align_frame(frame, calendar, rate_tickers=None, max_fill=None, presorted=False):
+    """Alinha um lote de séries (ticker, data, fechamento) ao calendário mestre
+    
+    rate_tickers é {ticker: periodo} (ver get_rate_tickers). Retorna um dict
+    com os tickers, o tipo de cada um e as colunas alinhadas (codigo, data,
+    nivel, preenchido), onde codigo indexa a lista de tickers.
+    """
+    rate_tickers = get_rate_tickers() if rate_tickers is None else rate_tickers
+    max_fill = get_max_fill() if max_fill is None else max_fill
+    
+    if not presorted:
+        frame = frame.sort_values(['ticker', 'data'], kind='stable')
+    
+    codes, tickers = pd.factorize(frame['ticker'], sort=True)
+    kinds = np.array(['taxa' if t in rate_tickers else 'preco' for t in tickers], dtype=object)
+    result = {'tickers': list(tickers), 'tipos': kinds.tolist()}
+    empty = dict(result, codigo=np.array([], dtype=np.int64), data=calendar[:0],
+                 nivel=np.array([]), preenchido=np.array([], dtype=bool))
+    
+    if frame.empty:
+        return empty
+    
+    dates = frame['data'].to_numpy().astype('datetime64[D]')
+    values = frame['fechamento'].to_numpy(dtype=np.float64)
+    
+    # Uma observação por ticker e data (a última), sem valores nulos
+    keep = np.isfinite(values) & ~((codes == np.roll(codes, -1)) & (dates == np.roll(dates, -1)))
+    keep[-1] = np.isfinite(values[-1])
+    codes, dates, values = codes[keep], dates[keep], values[keep].copy()
+    
+    # Taxa diária com mediana acima de 1% ao dia não é taxa diária (índice
+    # acumulado ou taxa anual cadastrada sem período): falha em vez de adivinhar
+    periods = np.array([rate_tickers.get(t) for t in tickers], dtype=object)
+    for code in np.flatnonzero(periods == 'diaria'):
+        rows = codes == code
+        if rows.any() and np.median(values[rows]) > 1:
+            raise ValueError(f"{tickers[code]}: mediana de {np.median(values[rows]):.4g}% ao dia nao e "
+                             f"uma taxa diaria; informe o periodo em ALIGN_RATE_TICKERS "
+                             f"(ex.: {tickers[code]}:anual) ou remova o ticker")
+    
+    # Primeiro dia útil >= data; observações após o fim do calendário são ignoradas
+    effective = np.searchsorted(calendar, dates)
+    inside = effective < len(calendar)
+    codes, dates, values, effective = codes[inside], dates[inside], values[inside], effective[inside]
+    
+    if not len(codes):
+        return empty
+    
+    # Intervalo de saída por ticker: da primeira observação até a última + max_fill
+    present, first_rows = np.unique(codes, return_index=True)
+    last_rows = np.append(first_rows[1:], len(codes)) - 1
+    start = effective[first_rows]
+    stop = np.minimum(effective[last_rows] + max_fill, len(calendar) - 1)
+    
+    # A última taxa mensal vale até o fim do seu mês
+    months = calendar.astype('datetime64[M]')
+    month_ends = np.searchsorted(months, months[effective[last_rows]], side='right') - 1
+    stop = np.where(periods[present] == 'mensal', np.maximum(stop, month_ends), stop)
+    lengths = stop - start + 1
+    
+    out_codes = np.repeat(present, lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    out_positions = np.repeat(start, lengths) + offsets
+    
+    # Última observação com (ticker, posição) <= (ticker, dia) em chaves combinadas
+    span = np.int64(len(calendar) + 1)
+    source = np.searchsorted(codes.astype(np.int64) * span + effective,
+                             out_codes.astype(np.int64) * span + out_positions, side='right') - 1
+    out_dates = calendar[out_positions]
+    levels = values[source]
+    
+    # Taxas: repetidas em cada dia útil e capitalizadas dia a dia
+    out_periods = periods[out_codes]
+    rate_rows = kinds[out_codes] == 'taxa'
+    if rate_rows.any():
+        steps = np.where(out_periods == 'anual', BUSINESS_DAYS_PER_YEAR, 1).astype(np.float64)
+        monthly = out_periods == 'mensal'
+        if monthly.any():
+            steps[monthly] = month_business_days(out_dates[monthly])
+        levels[rate_rows] = compound_rate_levels(out_codes[rate_rows], levels[rate_rows], steps[rate_rows],
+                                                 out_periods[rate_rows] == 'diaria')
+    
+    return dict(result, codigo=out_codes, data=out_dates, nivel=levels,
+                preenchido=dates[source] != out_dates)
+
+def build_level_matrix(frame, tickers, rate_tickers=None):
+    """Matriz de níveis (dias úteis da B3 x tickers) de um lote (ticker, data, fechamento)
+    
+    Usa align_frame: preços ficam como fechamento e taxas viram índice
+    capitalizado, então a variação entre linhas é sempre um retorno. Dias
+    fora do histórico de cada ticker ficam NaN.
+    """
+    tickers = list(tickers)
+    if frame.empty:
+        return np.array([], dtype='datetime64[D]'), np.empty((0, len(tickers)))
+    
+    rate_tickers = get_rate_tickers() if rate_tickers is None else rate_tickers
+    last = np.datetime64(frame['data'].max(), 'D')
+    
+    # A última taxa mensal rende até o fim do seu mês
+    if any(rate_tickers.get(ticker) == 'mensal' for ticker in frame['ticker'].unique()):
+        last = (last.astype('datetime64[M]') + 1).astype('datetime64[D]') - 1
+    
+    calendar = business_days(frame['data'].min(), last, 'b3')
+    aligned = align_frame(frame, calendar, rate_tickers, max_fill=0)
+    
+    columns = np.array([tickers.index(ticker) for ticker in aligned['tickers']], dtype=np.int64)
+    matrix = np.full((len(calendar), len(tickers)), np.nan)
+    matrix[np.searchsorted(calendar, aligned['data']), columns[aligned['codigo']]] = aligned['nivel']
+    return calendar, matrix
+
+def load_level_matrix(conn, tickers, rate_tickers=None):
+    """Lê os tickers de dados_historicos como matriz de níveis (build_level_matrix)"""
+    tickers = list(tickers)
+    frames = list(iter_ticker_frames(conn, tickers, max(len(tickers), 1), ALIGN_COLUMNS))
+    conn.rollback()
+    
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['ticker', 'data', 'fechamento'])
+    return build_level_matrix(frame, tickers, rate_tickers)
+
+def load_align_tickers(cursor, full_align=False):
+    """Tickers a alinhar: carregados depois do último alinhamento ou todos (--full)"""
+    if full_align:
+        cursor.execute("SELECT DISTINCT ticker FROM dados_historicos ORDER BY ticker")
+    else:
+        cursor.execute("""
+            SELECT ticker FROM controle_carga
+            WHERE alinhado_em IS NULL OR alinhado_em < carregado_em
+            ORDER BY ticker
+        """)
+    return [row[0] for row in cursor.fetchall()]
+
+def mark_aligned(cursor, tickers):
+    """Registra em controle_carga o alinhamento dos tickers (início da transação)"""
+    cursor.execute("""
+        UPDATE controle_carga SET alinhado_em = CURRENT_TIMESTAMP
+        WHERE ticker = ANY(%s)
+    """, (list(tickers),))
+    return cursor.rowcount
+
+def register_series(cursor, tickers, kinds):
+    """Cadastra as séries em series_alinhadas e retorna {ticker: id}"""
+    rows = psycopg2.extras.execute_values(cursor, """
+        INSERT INTO series_alinhadas (ticker, tipo, alinhado_em)
+        VALUES %s
+        ON CONFLICT (ticker) DO UPDATE SET
+            tipo = EXCLUDED.tipo,
+            alinhado_em = EXCLUDED.alinhado_em
+        RETURNING ticker, id
+    """, [(ticker, kind, datetime.now().astimezone()) for ticker, kind in zip(tickers, kinds)],
+        fetch=True)
+    return dict(rows)
+
+def write_aligned(cursor, aligned, series_ids):
+    """Substitui em dados_alinhados as linhas das séries do lote (COPY)"""
+    ids = np.array([series_ids[ticker] for ticker in aligned['tickers']], dtype=np.int64)
+    cursor.execute("DELETE FROM dados_alinhados WHERE serie_id = ANY(%s)", (ids.tolist(),))
+    
+    if not len(aligned['codigo']):
+        return 0
+    
+    buffer = io.StringIO()
+    pd.DataFrame({
+        'serie_id': ids[aligned['codigo']],
+        'data': aligned['data'],
+        'nivel': aligned['nivel'],
+        'preenchido': aligned['preenchido'],
+    }).to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d')
+    buffer.seek(0)
+    
+    cursor.copy_expert(
+        "COPY dados_alinhados (serie_id, data, nivel, preenchido) FROM STDIN WITH (FORMAT csv)", buffer)
+    return len(aligned['codigo'])
+
+def align_series(conn, full_align=False, batch_size=None):
+    """Alinha os tickers carregados desde o último alinhamento (ou todos) em uma transação"""
+    batch_size = batch_size or get_batch_tickers()
+    rate_tickers, max_fill = get_rate_tickers(), get_max_fill()
+    create_alignment_tables(conn)
+    cursor = conn.cursor()
+    
+    try:
+        calendar = build_master_calendar(cursor)
+        tickers = load_align_tickers(cursor, full_align)
+        
+        if not tickers or not len(calendar):
+            print("OK: Nenhuma serie pendente para alinhar")
+            conn.commit()
+            return 0
+        
+        print(f"Alinhando {len(tickers)} series em {len(calendar)} dias uteis "
+              f"({calendar[0]} a {calendar[-1]})...")
+        start = time.time()
+        rows_in = rows_out = 0
+        
+        for frame in iter_ticker_frames(conn, tickers, batch_size, ALIGN_COLUMNS):
+            aligned = align_frame(frame, calendar, rate_tickers, max_fill, presorted=True)
+            series_ids = register_series(cursor, aligned['tickers'], aligned['tipos'])
+            rows_out += write_aligned(cursor, aligned, series_ids)
+            rows_in += len(frame)
+        
+        mark_aligned(cursor, tickers)
+        conn.commit()
+        elapsed = time.time() - start
+        print(f"OK: {rows_in} linhas -> {rows_out} linhas alinhadas em {elapsed:.2f}s "
+              f"({rows_in / max(elapsed, 1e-9):,.0f} linhas/s)")
+        return rows_out
+    
+    except Exception as e:
+        conn.rollback()
+        print(f"ERRO: Erro ao alinhar series: {e}")
+        raise
+    finally:
+        cursor.close()
+
+def main(argv=None):
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Alinha as series de dados_historicos no calendario mestre')
+    parser.add_argument('--full', action='store_true',
+                        help='Realinhar todos os tickers, ignorando controle_carga')
+    args = parser.parse_args(argv if argv is not None else [])
+    
+    try:
+        print("Iniciando alinhamento das series...")
+        
+        conn = get_postgres_connection()
+        print("OK: Conectado ao PostgreSQL")
+        
+        align_series(conn, args.full)
+        
+        conn.close()
+        print("OK: Series alinhadas!")
+    
+    except Exception as e:
+        print(f"ERRO: Erro no alinhamento: {e}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
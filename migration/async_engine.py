@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Motor assíncrono de extração e carga
+
+Pagina a API PostgREST do Supabase com httpx (várias páginas em paralelo)
+e grava no PostgreSQL com asyncpg via COPY, sobrepondo extração e carga
+entre as tabelas. Os limites de concorrência são configuráveis por
+ASYNC_HTTP_CONCURRENCY e ASYNC_DB_CONCURRENCY.
+
+A carga usa staging + COPY deduplicado, a mesma do modo bulk de
+insert_data, então funciona com ou sem constraints (BULK_LOAD). A carga
+idempotente (IDEMPOTENT_LOAD) não é suportada e é recusada.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+import httpx
+import asyncpg
+from dotenv import load_dotenv
+
+# Adicionar diretório migration ao path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from insert_data import (
+    load_json_data, prepare_data_for_postgres, build_staging_insert_query,
+    compute_watermark_ranges, ensure_ticker_partitions, get_postgres_connection,
+    build_sequence_reset_query
+)
+from data_access import get_connection_params
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+TABLES = [
+    'ativos',
+    'dados_historicos',
+    'cestas',
+    'transacoes',
+    'investment_funds',
+    'cash_balance'
+]
+
+def get_concurrency_limits():
+    """Retorna (requisições HTTP simultâneas, conexões PostgreSQL)"""
+    return (
+        int(os.getenv('ASYNC_HTTP_CONCURRENCY', 8)),
+        int(os.getenv('ASYNC_DB_CONCURRENCY', 4))
+    )
+
+def get_rest_client(base_url=None, key=None, timeout=60.0):
+    """Cria cliente httpx para a API REST (PostgREST) do Supabase"""
+    url = base_url or os.getenv('SUPABASE_URL')
+    key = key or os.getenv('SUPABASE_KEY')
+    
+    if not url or not key:
+        raise ValueError("SUPABASE_URL e SUPABASE_KEY devem estar definidas")
+    
+    http_limit, _ = get_concurrency_limits()
+    
+    return httpx.AsyncClient(
+        base_url=f"{url.rstrip('/')}/rest/v1",
+        headers={'apikey': key, 'Authorization': f"Bearer {key}"},
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=http_limit, max_keepalive_connections=http_limit)
+    )
+
+async def create_postgres_pool(server_settings=None):
+    """Cria pool asyncpg com o tamanho de ASYNC_DB_CONCURRENCY"""
+    _, db_limit = get_concurrency_limits()
+    params = get_connection_params()
+    params['port'] = int(params['port'])
+    
+    return await asyncpg.create_pool(
+        **params,
+        min_size=1,
+        max_size=db_limit,
+        server_settings=server_settings
+    )
+
+def parse_content_range_total(content_range):
+    """Extrai o total de 'Content-Range: 0-999/13065' (None se desconhecido)"""
+    if not content_range or '/' not in content_range:
+        return None
+    
+    total = content_range.rsplit('/', 1)[1]
+    return int(total) if total.isdigit() else None
+
+async def fetch_range(client, semaphore, table, start, end, with_count=False, retries=3):
+    """Busca as linhas [start, end] de uma tabela, com novas tentativas"""
+    headers = {'Range-Unit': 'items', 'Range': f"{start}-{end}"}
+    if with_count:
+        headers['Prefer'] = 'count=exact'
+    
+    # Ordenar por id garante páginas estáveis entre requisições paralelas
+    params = {'select': '*', 'order': 'id.asc'}
+    
+    for attempt in range(retries):
+        try:
+            async with semaphore:
+                response = await client.get(f"/{table}", params=params, headers=headers)
+            response.raise_for_status()
+            break
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if attempt == retries - 1:
+                raise
+            print(f"AVISO: {table} [{start}-{end}] falhou ({e}), nova tentativa...")
+            await asyncio.sleep(0.5 * 2 ** attempt)
+    
+    total = parse_content_range_total(response.headers.get('content-range')) if with_count else None
+    return response.json(), total
+
+def plan_pages(start, total, page_size):
+    """Intervalos [início, fim] das páginas de start até total (exclusivo)"""
+    return [(offset, min(offset + page_size, total) - 1) for offset in range(start, total, page_size)]
+
+async def fetch_complete_range(client, semaphore, table, start, end):
+    """Busca [start, end] inteiro, repaginando quando a resposta vem curta
+    
+    O PostgREST corta cada resposta em max-rows sem erro; uma página vazia
+    antes do fim do intervalo interrompe a extração.
+    """
+    rows = []
+    while start <= end:
+        page, _ = await fetch_range(client, semaphore, table, start, end)
+        if not page:
+            raise ValueError(f"{table}: pagina [{start}-{end}] veio vazia "
+                             f"(esperadas {end - start + 1} linhas)")
+        rows.extend(page)
+        start += len(page)
+    return rows
+
+async def extract_table(client, semaphore, table, batch_size):
+    """Extrai uma tabela: 1ª página com contagem, restantes em paralelo
+    
+    A 1ª página revela o tamanho efetivo das respostas (max-rows do
+    PostgREST abaixo de BATCH_SIZE); ao final o total extraído precisa
+    bater com o Content-Range.
+    """
+    start_time = time.time()
+    first_page, total = await fetch_range(client, semaphore, table, 0, batch_size - 1, with_count=True)
+    rows = list(first_page)
+    
+    if total is not None:
+        if not first_page and total:
+            raise ValueError(f"{table}: primeira pagina vazia com {total} linhas no Content-Range")
+        
+        page_size = min(len(first_page), batch_size) or batch_size
+        pages = await asyncio.gather(*(
+            fetch_complete_range(client, semaphore, table, start, end)
+            for start, end in plan_pages(len(first_page), total, page_size)
+        ))
+        for page in pages:
+            rows.extend(page)
+        
+        if len(rows) != total:
+            raise ValueError(f"{table}: {len(rows)} linhas extraidas, Content-Range indica {total}")
+    else:
+        # Sem contagem: paginação sequencial até uma página vazia (as
+        # respostas podem vir menores que batch_size)
+        page = first_page
+        while page:
+            page, _ = await fetch_range(client, semaphore, table, len(rows), len(rows) + batch_size - 1)
+            rows.extend(page)
+    
+    print(f"OK: Total extraido de '{table}': {len(rows)} registros em {time.time() - start_time:.2f}s")
+    return rows
+
+def save_data_to_json(data, table_name, output_dir="migration/data"):
+    """Salva dados extraídos em arquivo JSON (mesmo formato de extract_data)"""
+    os.makedirs(output_dir, exist_ok=True)
+    filename = f"{output_dir}/{table_name}.json"
+    
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+    
+    return filename
+
+def build_converter(data_type):
+    """Retorna função que converte um valor JSON para o tipo esperado pelo asyncpg"""
+    def to_date(value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        return date.fromisoformat(str(value)[:10])
+    
+    def to_timestamp(value):
+        if isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    
+    def to_json(value):
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    
+    converters = {
+        'numeric': lambda value: Decimal(str(value)),
+        'integer': int,
+        'bigint': int,
+        'smallint': int,
+        'double precision': float,
+        'real': float,
+        'boolean': bool,
+        'date': to_date,
+        'timestamp with time zone': to_timestamp,
+        'timestamp without time zone': lambda value: to_timestamp(value).replace(tzinfo=None),
+        'jsonb': to_json,
+        'json': to_json,
+    }
+    convert = converters.get(data_type, str)
+    
+    return lambda value: None if value is None else convert(value)
+
+async def get_column_types(conn, table):
+    """Retorna {coluna: tipo} da tabela de destino"""
+    rows = await conn.fetch("""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = $1
+    """, table)
+    return {row['column_name']: row['data_type'] for row in rows}
+
+def build_copy_records(prepared_data, columns, column_types):
+    """Converte registros preparados em tuplas tipadas para o COPY binário"""
+    converters = [build_converter(column_types[col]) for col in columns]
+    return [
+        tuple(convert(record.get(col)) for col, convert in zip(columns, converters))
+        for record in prepared_data
+    ]
+
+async def update_load_watermarks(conn, data):
+    """Versão asyncpg de insert_data.update_load_watermarks"""
+    ranges = compute_watermark_ranges(data)
+    if not ranges:
+        return 0
+    
+    tickers = list(ranges)
+    await conn.execute("""
+        INSERT INTO controle_carga (ticker, data_min, data_max, versao, pendente_desde, carregado_em)
+        SELECT ticker, data_min, data_max, 1, data_min, CURRENT_TIMESTAMP
+        FROM unnest($1::varchar[], $2::date[], $3::date[]) AS w(ticker, data_min, data_max)
+        ON CONFLICT (ticker) DO UPDATE SET
+            data_min = LEAST(controle_carga.data_min, EXCLUDED.data_min),
+            data_max = GREATEST(controle_carga.data_max, EXCLUDED.data_max),
+            versao = controle_carga.versao + 1,
+            pendente_desde = LEAST(controle_carga.pendente_desde, EXCLUDED.pendente_desde),
+            carregado_em = EXCLUDED.carregado_em
+    """, tickers,
+        [date.fromisoformat(ranges[t][0]) for t in tickers],
+        [date.fromisoformat(ranges[t][1]) for t in tickers])
+    
+    return len(tickers)
+
+def create_load_partitions(data):
+    """Cria (em conexão psycopg2 própria) as partições por ticker do layout list"""
+    conn = get_postgres_connection()
+    try:
+        return ensure_ticker_partitions(conn, {r['ticker'] for r in data if r.get('ticker')})
+    finally:
+        conn.close()
+
+async def load_table(pool, table, data):
+    """Carrega uma tabela via COPY binário em staging + INSERT deduplicado"""
+    if not data:
+        print(f"AVISO: Nenhum dado para inserir na tabela {table}")
+        return 0
+    
+    start_time = time.time()
+    staging = f"{table}_staging"
+    
+    if table == 'dados_historicos':
+        await asyncio.to_thread(create_load_partitions, data)
+    
+    async with pool.acquire() as conn:
+        column_types = await get_column_types(conn, table)
+        
+        prepared_data = await asyncio.to_thread(prepare_data_for_postgres, data, table)
+        columns = [col for col in prepared_data[0] if col in column_types]
+        ignored = [col for col in prepared_data[0] if col not in column_types]
+        if ignored:
+            print(f"AVISO: Colunas ignoradas em '{table}' (ausentes no destino): {', '.join(ignored)}")
+        
+        records = await asyncio.to_thread(build_copy_records, prepared_data, columns, column_types)
+        
+        async with conn.transaction():
+            await conn.execute(f"DROP TABLE IF EXISTS {staging}")
+            await conn.execute(f"CREATE UNLOGGED TABLE {staging} (LIKE {table} INCLUDING DEFAULTS)")
+            await conn.execute(f"ALTER TABLE {staging} ADD COLUMN _load_order BIGSERIAL")
+            
+            await conn.copy_records_to_table(staging, records=records, columns=columns)
+            
+            status = await conn.execute(build_staging_insert_query(table, staging, columns))
+            inserted_count = int(status.split()[-1])
+            
+            await conn.execute(f"DROP TABLE {staging}")
+            
+            # Ids preservados da origem não avançam a sequence SERIAL
+            if 'id' in columns:
+                await conn.execute(build_sequence_reset_query(table))
+            
+            if table == 'dados_historicos':
+                await update_load_watermarks(conn, data)
+    
+    print(f"OK: {inserted_count} registros inseridos em '{table}' em {time.time() - start_time:.2f}s")
+    return inserted_count
+
+async def run_pipeline(extract=True, load=True, tables=None, save_json=True):
+    """Extrai e/ou carrega as tabelas concorrentemente
+    
+    Cada tabela segue extração -> JSON -> carga assim que sua extração
+    termina, sem esperar as demais.
+    """
+    tables = tables or TABLES
+    http_limit, db_limit = get_concurrency_limits()
+    batch_size = int(os.getenv('BATCH_SIZE', 1000))
+    semaphore = asyncio.Semaphore(http_limit)
+    
+    print(f"Motor async: {http_limit} requisicoes HTTP, {db_limit} conexoes PostgreSQL")
+    
+    client = get_rest_client() if extract else None
+    pool = await create_postgres_pool() if load else None
+    
+    async def process(table):
+        if extract:
+            data = await extract_table(client, semaphore, table, batch_size)
+            if save_json and data:
+                await asyncio.to_thread(save_data_to_json, data, table)
+        else:
+            data = await asyncio.to_thread(load_json_data, table)
+        
+        inserted = await load_table(pool, table, data) if load else None
+        return len(data), inserted
+    
+    try:
+        results = await asyncio.gather(*(process(table) for table in tables), return_exceptions=True)
+    finally:
+        if client is not None:
+            await client.aclose()
+        if pool is not None:
+            await pool.close()
+    
+    summary = {}
+    for table, result in zip(tables, results):
+        if isinstance(result, Exception):
+            print(f"ERRO: Erro ao processar tabela '{table}': {result}")
+        else:
+            summary[table] = result
+    
+    if extract and save_json and summary:
+        with open('migration/data/extraction_summary.json', 'w') as f:
+            json.dump({
+                'extraction_date': datetime.now().isoformat(),
+                'tables_extracted': len(summary),
+                'total_records': sum(count for count, _ in summary.values()),
+                'table_counts': {table: count for table, (count, _) in summary.items()}
+            }, f, indent=2)
+    
+    return summary
+
+def is_idempotent_load():
+    """Indica se a carga idempotente foi pedida (IDEMPOTENT_LOAD), sem suporte aqui"""
+    return os.getenv('IDEMPOTENT_LOAD', 'false').strip().lower() == 'true'
+
+def run(extract, load):
+    """Executa o pipeline e converte o resultado em código de saída"""
+    if load and is_idempotent_load():
+        print("ERRO: O motor async nao suporta a carga idempotente (IDEMPOTENT_LOAD); "
+              "use a insercao padrao: python migrate.py insert --idempotent")
+        return 1
+    
+    try:
+        start_time = time.time()
+        summary = asyncio.run(run_pipeline(extract=extract, load=load))
+        
+        print(f"\nOK: Motor async concluido em {time.time() - start_time:.2f}s")
+        print(f"   Tabelas processadas: {len(summary)}/{len(TABLES)}")
+        
+        if load and os.getenv('BULK_LOAD', 'false').strip().lower() == 'true':
+            print("AVISO: Constraints e indices ainda nao existem: python migrate.py indexes")
+        
+        return 0 if summary else 1
+    
+    except Exception as e:
+        print(f"ERRO: Erro no motor async: {e}")
+        return 1
+
+def extract_main():
+    """Somente extração (equivalente assíncrono de extract_data.main)"""
+    return run(extract=True, load=False)
+
+def insert_main():
+    """Somente carga dos JSON (equivalente assíncrono de insert_data.main)"""
+    return run(extract=False, load=True)
+
+def main():
+    """Extração e carga sobrepostas"""
+    return run(extract=True, load=True)
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,1096 @@
+#!/usr/bin/env python3
+"""
+Benchmarks do toolkit de migração
+
+Executar contra um PostgreSQL de testes: cada benchmark cria e remove
+seus próprios schemas (bench_*) e não toca nas tabelas da aplicação.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+import subprocess
+import statistics
+from datetime import date, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Adicionar diretório migration ao path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+def business_days(start, end):
+    """Gera os dias úteis (seg-sex) entre start e end"""
+    current = start
+    while current <= end:
+        if current.weekday() < 5:
+            yield current
+        current += timedelta(days=1)
+
+def generate_historical_records(num_tickers=50, num_years=10, seed=42):
+    """Gera registros sintéticos de dados_historicos (passeio aleatório por ticker)"""
+    rng = random.Random(seed)
+    end = date.today()
+    start = end - timedelta(days=365 * num_years)
+    days = list(business_days(start, end))
+    
+    records = []
+    for t in range(num_tickers):
+        ticker = f"BENCH{t:03d}.SA"
+        price = 100.0
+        for day in days:
+            ret = rng.gauss(0.0003, 0.015)
+            price *= 1 + ret
+            opening = price * (1 - ret / 2)
+            records.append({
+                'ticker': ticker,
+                'nome_ativo': ticker,
+                'data': day.isoformat(),
+                'abertura': round(opening, 8),
+                'maxima': round(max(opening, price) * 1.005, 8),
+                'minima': round(min(opening, price) * 0.995, 8),
+                'fechamento': round(price, 8),
+                'fechamento_ajustado': round(price, 8),
+                'volume': rng.randint(1000, 1000000),
+                'retorno_diario': round(ret, 8),
+            })
+    
+    return records
+
+def generate_historical_frame(num_tickers=100, num_years=20, seed=42):
+    """Gera dados_historicos sintéticos em colunas (NumPy), sem objetos por linha"""
+    import numpy as np
+    import pandas as pd
+    from trading_calendar import business_days as trading_days
+    
+    rng = np.random.default_rng(seed)
+    end = date.today()
+    days = trading_days(end - timedelta(days=365 * num_years), end)
+    
+    returns = rng.normal(0.0003, 0.015, (num_tickers, len(days)))
+    close = 100.0 * np.cumprod(1 + returns, axis=1)
+    opening = close * (1 - returns / 2)
+    
+    # Faixa do dia sempre contém abertura e fechamento (dados limpos sem OHLC inconsistente)
+    return pd.DataFrame({
+        'ticker': np.repeat(np.array([f"BENCH{t:04d}.SA" for t in range(num_tickers)], dtype=object), len(days)),
+        'data': np.tile(days, num_tickers),
+        'abertura': opening.ravel(),
+        'maxima': (np.maximum(opening, close) * 1.005).ravel(),
+        'minima': (np.minimum(opening, close) * 0.995).ravel(),
+        'fechamento': close.ravel(),
+        'retorno_diario': returns.ravel(),
+    })
+
+def inject_anomalies(frame, rate=0.0001, seed=7):
+    """Injeta anomalias conhecidas e retorna (frame, esperado por verificação)"""
+    import numpy as np
+    
+    rng = np.random.default_rng(seed)
+    count = max(1, int(len(frame) * rate))
+    # Evita as bordas de cada ticker: uma lacuna só aparece entre duas linhas
+    first_rows = np.flatnonzero(frame['ticker'].to_numpy() != np.roll(frame['ticker'].to_numpy(), 1))
+    edges = np.concatenate([first_rows, first_rows + 1, first_rows - 1])
+    candidates = np.setdiff1d(np.arange(len(frame)), edges)
+    rows = rng.choice(candidates, size=count * 4, replace=False)
+    invalid_close, inconsistent, outlier, gaps = np.split(rows, 4)
+    
+    frame = frame.copy()
+    frame.loc[invalid_close, ['fechamento', 'minima']] = -1.0
+    frame.loc[inconsistent, 'minima'] = frame.loc[inconsistent, 'maxima'] * 1.05
+    frame.loc[outlier, 'retorno_diario'] = 0.9
+    frame = frame.drop(index=gaps).reset_index(drop=True)
+    
+    expected = {
+        'fechamento_invalido': count,
+        'ohlc_inconsistente': count,
+        'outlier_retorno': count,
+        'lacuna': count,
+    }
+    return frame, expected
+
+def reset_bench_schema(conn, schema_name):
+    """Recria um schema isolado e o coloca no search_path"""
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {schema_name}")
+    cursor.execute(f"SET search_path TO {schema_name}")
+    conn.commit()
+    cursor.close()
+
+def drop_bench_schema(conn, schema_name):
+    """Remove um schema de benchmark"""
+    cursor = conn.cursor()
+    cursor.execute("SET search_path TO public")
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema_name} CASCADE")
+    conn.commit()
+    cursor.close()
+
+def measure_queries(conn, queries, repeat=50):
+    """Executa cada consulta `repeat` vezes e retorna (mediana, p95) em ms"""
+    cursor = conn.cursor()
+    timings = []
+    
+    for i in range(repeat):
+        query, params = queries[i % len(queries)]
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    
+    cursor.close()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+def get_relation_size(conn, schema_name, prefix):
+    """Soma o tamanho (tabela + índices) das relações com o prefixo informado"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COALESCE(SUM(pg_total_relation_size(c.oid)), 0)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind = 'r' AND c.relname LIKE %s
+    """, (schema_name, prefix + '%'))
+    size = cursor.fetchone()[0]
+    cursor.close()
+    return size
+
+def build_range_queries(records, count=20, window_days=90, seed=7):
+    """Monta consultas típicas por intervalo de datas (por ticker e transversal)"""
+    rng = random.Random(seed)
+    tickers = sorted({r['ticker'] for r in records})
+    first = date.fromisoformat(min(r['data'] for r in records))
+    last = date.fromisoformat(max(r['data'] for r in records))
+    span = max((last - first).days - window_days, 1)
+    
+    queries = []
+    for _ in range(count):
+        start = first + timedelta(days=rng.randrange(span))
+        end = start + timedelta(days=window_days)
+        queries.append((
+            "SELECT data, fechamento FROM dados_historicos "
+            "WHERE ticker = %s AND data BETWEEN %s AND %s ORDER BY data",
+            (rng.choice(tickers), start, end)
+        ))
+        queries.append((
+            "SELECT ticker, data, fechamento FROM dados_historicos "
+            "WHERE data BETWEEN %s AND %s",
+            (start, end)
+        ))
+    
+    return queries
+
+def benchmark_schema(args):
+    """Compara carga e latência de consultas entre os layouts de dados_historicos"""
+    from create_schema import (
+        SCHEMA_LAYOUTS, get_postgres_connection, create_database_schema, create_indexes
+    )
+    from insert_data import insert_table_data
+    
+    print(f"Gerando dados sinteticos: {args.tickers} tickers x {args.years} anos...")
+    records = generate_historical_records(args.tickers, args.years)
+    tickers = sorted({r['ticker'] for r in records})
+    queries = build_range_queries(records)
+    print(f"OK: {len(records)} registros gerados")
+    
+    # Garantir partições anuais cobrindo todo o período gerado
+    os.environ['PARTITION_START_YEAR'] = min(r['data'] for r in records)[:4]
+    os.environ['PARTITION_END_YEAR'] = max(r['data'] for r in records)[:4]
+    
+    results = []
+    conn = get_postgres_connection()
+    
+    try:
+        for layout in args.layouts or SCHEMA_LAYOUTS:
+            schema_name = f"bench_{layout}"
+            print(f"\n{'='*20} LAYOUT {layout.upper()} {'='*20}")
+            reset_bench_schema(conn, schema_name)
+            
+            create_database_schema(conn, layout, tickers=tickers)
+            
+            start = time.perf_counter()
+            insert_table_data(conn, 'dados_historicos', records)
+            load_time = time.perf_counter() - start
+            
+            # Layouts particionados constroem os índices após a carga
+            index_time = 0.0
+            if layout != 'heap':
+                start = time.perf_counter()
+                create_indexes(conn, layout)
+                index_time = time.perf_counter() - start
+            
+            # Estatísticas pós-carga em todos os layouts (o heap foi
+            # analisado no schema, ainda vazio)
+            cursor = conn.cursor()
+            cursor.execute("ANALYZE dados_historicos")
+            conn.commit()
+            cursor.close()
+            
+            median_ms, p95_ms = measure_queries(conn, queries, args.repeat)
+            size_mb = get_relation_size(conn, schema_name, 'dados_historicos') / 1024 / 1024
+            
+            results.append((layout, load_time, index_time, median_ms, p95_ms, size_mb))
+            
+            if not args.keep:
+                drop_bench_schema(conn, schema_name)
+    finally:
+        conn.close()
+    
+    print("\n" + "=" * 78)
+    print(f"{'Layout':<8} {'Carga (s)':>10} {'Indices (s)':>12} {'Total (s)':>10} "
+          f"{'Mediana (ms)':>13} {'p95 (ms)':>10} {'Tam. (MB)':>10}")
+    print("-" * 78)
+    for layout, load_time, index_time, median_ms, p95_ms, size_mb in results:
+        print(f"{layout:<8} {load_time:>10.2f} {index_time:>12.2f} {load_time + index_time:>10.2f} "
+              f"{median_ms:>13.2f} {p95_ms:>10.2f} {size_mb:>10.1f}")
+    print("=" * 78)
+    
+    return 0
+
+def benchmark_bulkload(args):
+    """Compara a carga padrão com o modo bulk (constraints/índices ao final)"""
+    from create_schema import (
+        get_postgres_connection, create_database_schema, build_constraints_and_indexes
+    )
+    from insert_data import insert_table_data, bulk_load_table
+    
+    print(f"Gerando dados sinteticos: {args.tickers} tickers x {args.years} anos...")
+    records = generate_historical_records(args.tickers, args.years)
+    # Duplicatas para exercitar a deduplicação do staging
+    rng = random.Random(1)
+    records += rng.sample(records, int(len(records) * args.duplicates))
+    print(f"OK: {len(records)} registros gerados ({args.duplicates:.0%} duplicados)")
+    
+    modes = [
+        ('padrao', False),
+        ('bulk', True),
+    ]
+    results = []
+    
+    for mode, bulk in modes:
+        schema_name = f"bench_load_{mode}"
+        print(f"\n{'='*20} MODO {mode.upper()} {'='*20}")
+        
+        # Conexões abertas em threads também precisam enxergar o schema isolado
+        os.environ['PGOPTIONS'] = f"-c search_path={schema_name}"
+        conn = get_postgres_connection()
+        
+        try:
+            reset_bench_schema(conn, schema_name)
+            
+            start = time.perf_counter()
+            create_database_schema(conn, 'heap', with_constraints=not bulk)
+            
+            if bulk:
+                bulk_load_table(conn, 'dados_historicos', records)
+                load_time = time.perf_counter() - start
+                build_constraints_and_indexes('heap')
+            else:
+                insert_table_data(conn, 'dados_historicos', records)
+                load_time = time.perf_counter() - start
+            
+            total_time = time.perf_counter() - start
+            results.append((mode, load_time, total_time - load_time, total_time))
+            
+            if not args.keep:
+                drop_bench_schema(conn, schema_name)
+        finally:
+            conn.close()
+            os.environ.pop('PGOPTIONS', None)
+    
+    print("\n" + "=" * 60)
+    print(f"{'Modo':<8} {'Carga (s)':>12} {'Constr./Ind. (s)':>18} {'Total (s)':>12}")
+    print("-" * 60)
+    for mode, load_time, build_time, total_time in results:
+        print(f"{mode:<8} {load_time:>12.2f} {build_time:>18.2f} {total_time:>12.2f}")
+    print("-" * 60)
+    baseline, bulk_total = results[0][3], results[1][3]
+    print(f"Ganho do modo bulk: {baseline / bulk_total:.1f}x ({baseline - bulk_total:.2f}s)")
+    print("=" * 60)
+    
+    return 0
+
+def benchmark_analytics(args):
+    """Compara consultas sobre dados_historicos com as tabelas de resumo"""
+    from create_schema import get_postgres_connection, create_database_schema
+    from insert_data import insert_table_data, update_load_watermarks
+    from refresh_analytics import refresh_analytics, get_volatility_window
+    
+    print(f"Gerando dados sinteticos: {args.tickers} tickers x {args.years} anos...")
+    records = generate_historical_records(args.tickers, args.years)
+    print(f"OK: {len(records)} registros gerados")
+    
+    window = get_volatility_window()
+    questions = [
+        ("Ultimo preco por ticker",
+         "SELECT DISTINCT ON (ticker) ticker, data, fechamento FROM dados_historicos "
+         "ORDER BY ticker, data DESC",
+         "SELECT ticker, data, fechamento FROM resumo_ultimo_preco"),
+        ("Retornos mensais",
+         "SELECT ticker, mes, fechamento / LAG(fechamento) OVER (PARTITION BY ticker ORDER BY mes) - 1 "
+         "FROM (SELECT DISTINCT ON (ticker, date_trunc('month', data)) ticker, "
+         "date_trunc('month', data) AS mes, fechamento FROM dados_historicos "
+         "ORDER BY ticker, date_trunc('month', data), data DESC) m",
+         "SELECT ticker, mes, retorno FROM resumo_retorno_mensal"),
+        ("Volatilidade movel (ultima)",
+         "SELECT DISTINCT ON (ticker) ticker, data, vol FROM ("
+         "SELECT ticker, data, stddev_samp(retorno_diario) OVER (PARTITION BY ticker ORDER BY data "
+         f"ROWS BETWEEN {window - 1} PRECEDING AND CURRENT ROW) * sqrt(252) AS vol "
+         "FROM dados_historicos) v ORDER BY ticker, data DESC",
+         "SELECT DISTINCT ON (ticker) ticker, data, volatilidade FROM resumo_volatilidade "
+         "ORDER BY ticker, janela, data DESC"),
+    ]
+    
+    schema_name = "bench_analytics"
+    conn = get_postgres_connection()
+    
+    try:
+        reset_bench_schema(conn, schema_name)
+        create_database_schema(conn, 'heap')
+        insert_table_data(conn, 'dados_historicos', records)
+        update_load_watermarks(conn, records)
+        
+        start = time.perf_counter()
+        refresh_analytics(conn)
+        full_refresh = time.perf_counter() - start
+        
+        # Carga incremental: último mês de cada ticker recarregado
+        cutoff = (date.today() - timedelta(days=30)).isoformat()
+        update_load_watermarks(conn, [r for r in records if r['data'] >= cutoff])
+        start = time.perf_counter()
+        refresh_analytics(conn)
+        incremental_refresh = time.perf_counter() - start
+        
+        results = []
+        for name, raw_query, summary_query in questions:
+            raw_median, _ = measure_queries(conn, [(raw_query, None)], args.repeat)
+            summary_median, _ = measure_queries(conn, [(summary_query, None)], args.repeat)
+            results.append((name, raw_median, summary_median))
+        
+        if not args.keep:
+            drop_bench_schema(conn, schema_name)
+    finally:
+        conn.close()
+    
+    print("\n" + "=" * 70)
+    print(f"Refresh completo: {full_refresh:.2f}s | incremental (30 dias): {incremental_refresh:.2f}s")
+    print("-" * 70)
+    print(f"{'Consulta':<30} {'Bruto (ms)':>12} {'Resumo (ms)':>12} {'Ganho':>10}")
+    print("-" * 70)
+    for name, raw_median, summary_median in results:
+        print(f"{name:<30} {raw_median:>12.2f} {summary_median:>12.2f} "
+              f"{raw_median / summary_median:>9.1f}x")
+    print("=" * 70)
+    
+    return 0
+
+def start_stand_in_postgrest(tables_rows, latency=0.0):
+    """Sobe um servidor local que imita a paginação do PostgREST
+    
+    Aceita tanto o cabeçalho Range quanto offset/limit na query string e
+    atrasa cada resposta em `latency` segundos para simular a rede.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            rows = tables_rows.get(parsed.path.rstrip('/').rsplit('/', 1)[-1])
+            if rows is None:
+                self.send_error(404)
+                return
+            
+            query = parse_qs(parsed.query)
+            if 'offset' in query or 'limit' in query:
+                start = int(query.get('offset', ['0'])[0])
+                end = start + int(query.get('limit', [len(rows)])[0]) - 1
+            elif self.headers.get('Range'):
+                start, end = (int(v) for v in self.headers['Range'].split('-'))
+            else:
+                start, end = 0, len(rows) - 1
+            
+            time.sleep(latency)
+            page = rows[start:end + 1]
+            body = json.dumps(page).encode()
+            
+            total = len(rows) if 'count=exact' in self.headers.get('Prefer', '') else '*'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Content-Range', f"{start}-{start + len(page) - 1}/{total}" if page else f"*/{total}")
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def build_stand_in_tables(num_tickers, num_years):
+    """Tabelas sintéticas com id, no formato retornado pelo Supabase"""
+    historical = generate_historical_records(num_tickers, num_years)
+    for i, record in enumerate(historical, 1):
+        record['id'] = i
+    
+    tickers = sorted({r['ticker'] for r in historical})
+    return {
+        'ativos': [{'id': i, 'ticker': t, 'nome': t} for i, t in enumerate(tickers, 1)],
+        'dados_historicos': historical,
+        'cestas': [{'id': 1, 'nome': 'Bench', 'ativos': {t: 1 for t in tickers[:5]}}],
+        'transacoes': [{'id': i, 'type': 'buy', 'ativo_id': 1, 'quantity': 1, 'price': 10.0,
+                        'date': '2024-01-02'} for i in range(1, 51)],
+        'investment_funds': [],
+        'cash_balance': [{'id': 1, 'value': 0.0}],
+    }
+
+def benchmark_extract(args):
+    """Compara extração serial, por threads e assíncrona contra um PostgREST local"""
+    from extract_data import get_supabase_client, extract_table_data
+    from async_engine import run_pipeline
+    
+    tables_rows = build_stand_in_tables(args.tickers, args.years)
+    total_rows = sum(len(rows) for rows in tables_rows.values())
+    server = start_stand_in_postgrest(tables_rows, args.latency / 1000)
+    
+    os.environ['SUPABASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}"
+    # Chave no formato JWT aceito pela validação do cliente supabase
+    os.environ['SUPABASE_KEY'] = 'bench.bench.bench'
+    os.environ['BATCH_SIZE'] = str(args.batch_size)
+    os.environ['ASYNC_HTTP_CONCURRENCY'] = str(args.concurrency)
+    tables = list(tables_rows)
+    
+    print(f"PostgREST local: {total_rows} registros, latencia {args.latency}ms/pagina, "
+          f"paginas de {args.batch_size}")
+    
+    def serial():
+        client = get_supabase_client()
+        return sum(len(extract_table_data(client, table, args.batch_size)) for table in tables)
+    
+    def threaded():
+        client = get_supabase_client()
+        with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+            return sum(executor.map(lambda table: len(extract_table_data(client, table, args.batch_size)),
+                                    tables))
+    
+    def asynchronous():
+        summary = asyncio.run(run_pipeline(extract=True, load=False, tables=tables, save_json=False))
+        return sum(count for count, _ in summary.values())
+    
+    results = []
+    try:
+        for name, function in [('serial', serial), ('threads', threaded), ('async', asynchronous)]:
+            print(f"\n{'='*20} {name.upper()} {'='*20}")
+            start = time.perf_counter()
+            extracted = function()
+            elapsed = time.perf_counter() - start
+            if extracted != total_rows:
+                print(f"AVISO: {name} extraiu {extracted} de {total_rows} registros")
+            results.append((name, elapsed, extracted / elapsed))
+    finally:
+        server.shutdown()
+    
+    print("\n" + "=" * 50)
+    print(f"{'Modo':<10} {'Tempo (s)':>12} {'Registros/s':>14} {'Ganho':>10}")
+    print("-" * 50)
+    for name, elapsed, rate in results:
+        print(f"{name:<10} {elapsed:>12.2f} {rate:>14.0f} {results[0][1] / elapsed:>9.1f}x")
+    print("=" * 50)
+    
+    return 0
+
+def get_wal_position(conn):
+    """Posição atual do WAL (para medir bytes escritos)"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_current_wal_lsn()")
+    position = cursor.fetchone()[0]
+    cursor.close()
+    return position
+
+def get_wal_bytes_since(conn, position):
+    """Bytes de WAL gerados desde `position`"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (position,))
+    written = cursor.fetchone()[0]
+    cursor.close()
+    return int(written)
+
+def benchmark_rerun(args):
+    """Mede o custo de reexecutar a carga idempotente sem e com mudanças na origem"""
+    from create_schema import get_postgres_connection, create_database_schema
+    from insert_data import upsert_table_data
+    
+    print(f"Gerando dados sinteticos: {args.tickers} tickers x {args.years} anos...")
+    historical = generate_historical_records(args.tickers, args.years)
+    transactions = [
+        {'id': i, 'type': 'buy', 'ativo_id': 1, 'asset': r['ticker'], 'quantity': 1,
+         'price': r['fechamento'], 'date': r['data']}
+        for i, r in enumerate(historical[::10], 1)
+    ]
+    print(f"OK: {len(historical)} registros historicos, {len(transactions)} transacoes")
+    
+    def modified(records, fraction, field):
+        rng = random.Random(3)
+        changed = [dict(r) for r in records]
+        for record in rng.sample(changed, int(len(changed) * fraction)):
+            record[field] = round(record[field] * 1.01, 8)
+        return changed
+    
+    runs = [
+        ('1a carga', historical, transactions),
+        ('reexecucao', historical, transactions),
+        (f'{args.changed:.0%} alterado', modified(historical, args.changed, 'fechamento'),
+         modified(transactions, args.changed, 'price')),
+    ]
+    
+    schema_name = "bench_rerun"
+    conn = get_postgres_connection()
+    results = []
+    
+    try:
+        reset_bench_schema(conn, schema_name)
+        create_database_schema(conn, 'heap')
+        
+        for name, historical_run, transactions_run in runs:
+            print(f"\n{'='*20} {name.upper()} {'='*20}")
+            wal_start = get_wal_position(conn)
+            start = time.perf_counter()
+            
+            changed = len(upsert_table_data(conn, 'dados_historicos', historical_run))
+            changed += len(upsert_table_data(conn, 'transacoes', transactions_run))
+            
+            elapsed = time.perf_counter() - start
+            results.append((name, elapsed, changed, get_wal_bytes_since(conn, wal_start)))
+        
+        if not args.keep:
+            drop_bench_schema(conn, schema_name)
+    finally:
+        conn.close()
+    
+    print("\n" + "=" * 62)
+    print(f"{'Execucao':<16} {'Tempo (s)':>10} {'Linhas gravadas':>16} {'WAL (MB)':>12}")
+    print("-" * 62)
+    for name, elapsed, changed, wal_bytes in results:
+        print(f"{name:<16} {elapsed:>10.2f} {changed:>16} {wal_bytes / 1024 / 1024:>12.2f}")
+    print("=" * 62)
+    
+    return 0
+
+def benchmark_quality(args):
+    """Mede a vazão da varredura de qualidade em tamanhos crescentes"""
+    from scan_quality import scan_frame, new_report
+    
+    results = []
+    for num_tickers in args.tickers:
+        frame = generate_historical_frame(num_tickers, args.years)
+        frame, expected = inject_anomalies(frame, args.anomalies)
+        
+        start = time.perf_counter()
+        report = scan_frame(frame, new_report(args.zscore), args.zscore, presorted=True)
+        elapsed = time.perf_counter() - start
+        
+        found = {check: report['verificacoes'][check]['total'] for check in expected}
+        results.append((num_tickers, len(frame), elapsed, expected, found))
+        print(f"OK: {num_tickers} tickers, {len(frame)} linhas em {elapsed:.2f}s")
+    
+    print("\n" + "=" * 70)
+    print(f"{'Tickers':>8} {'Linhas':>12} {'Tempo (s)':>10} {'Linhas/s':>12} {'s por 1M':>10}")
+    print("-" * 70)
+    for num_tickers, rows, elapsed, _, _ in results:
+        print(f"{num_tickers:>8} {rows:>12} {elapsed:>10.2f} {rows / elapsed:>12,.0f} "
+              f"{elapsed / rows * 1e6:>10.3f}")
+    print("-" * 70)
+    print("Anomalias detectadas / injetadas (maior tamanho):")
+    _, _, _, expected, found = results[-1]
+    for check in expected:
+        print(f"  {check}: {found[check]} / {expected[check]}")
+    print("=" * 70)
+    
+    mismatched = [(num_tickers, check, found[check], expected[check])
+                  for num_tickers, _, _, expected, found in results
+                  for check in expected if found[check] != expected[check]]
+    if mismatched:
+        for num_tickers, check, detected, injected in mismatched:
+            print(f"ERRO: {num_tickers} tickers: {check} detectou {detected}, injetadas {injected}")
+        return 1
+    
+    return 0
+
+def benchmark_covariance(args):
+    """Compara o cubo de covariância ingênuo, incremental e EWMA, e o cache em disco"""
+    import tempfile
+    import numpy as np
+    from covariance_cube import (rolling_covariance, ewma_covariance, covariance_to_correlation,
+                                 save_cached_cube, load_cached_cube)
+    
+    # Retornos sintéticos com um fator comum (correlações realistas)
+    rng = np.random.default_rng(42)
+    num_dates = 252 * args.years
+    market = rng.normal(0.0003, 0.01, (num_dates, 1))
+    betas = rng.uniform(0.5, 1.5, (1, args.tickers))
+    returns = market * betas + rng.normal(0, 0.012, (num_dates, args.tickers))
+    tickers = [f"BENCH{t:04d}.SA" for t in range(args.tickers)]
+    print(f"OK: {num_dates} pregoes x {args.tickers} ativos")
+    
+    results = []
+    for window in args.windows:
+        start = time.perf_counter()
+        ends = np.arange(window - 1, num_dates)
+        naive = np.empty((len(ends), args.tickers, args.tickers))
+        for i, end in enumerate(ends):
+            naive[i] = np.cov(returns[end - window + 1:end + 1], rowvar=False)
+        naive_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        cube, _ = rolling_covariance(returns, window)
+        incremental_time = time.perf_counter() - start
+        
+        error = float(np.max(np.abs(cube - naive)))
+        results.append((f"janela {window}", naive_time, incremental_time, error))
+        del naive
+    
+    start = time.perf_counter()
+    ewma, ends = ewma_covariance(returns, args.decay)
+    ewma_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    covariance_to_correlation(ewma)
+    correlation_time = time.perf_counter() - start
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        save_cached_cube('bench', np.arange(len(ends)), tickers, ewma, {'metodo': 'ewma'}, cache_dir)
+        write_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        _, _, cached = load_cached_cube('bench', cache_dir)
+        float(cached[-1].sum())
+        read_time = time.perf_counter() - start
+        size_mb = ewma.nbytes / 1024 / 1024
+        del cached
+    
+    print("\n" + "=" * 70)
+    print(f"{'Variante':<16} {'Ingenuo (s)':>12} {'Incremental (s)':>16} {'Ganho':>8} {'Erro max':>12}")
+    print("-" * 70)
+    for name, naive_time, incremental_time, error in results:
+        print(f"{name:<16} {naive_time:>12.2f} {incremental_time:>16.2f} "
+              f"{naive_time / incremental_time:>7.1f}x {error:>12.2e}")
+    print("-" * 70)
+    print(f"EWMA (decay {args.decay}): {ewma_time:.2f}s | correlacao: {correlation_time:.2f}s")
+    print(f"Cache ({size_mb:.0f} MB): gravacao {write_time:.2f}s | leitura mmap {read_time * 1000:.1f}ms")
+    print("=" * 70)
+    
+    return 0
+
+def benchmark_montecarlo(args):
+    """Mede caminhos/s da simulação de Monte Carlo por método e número de processos"""
+    import numpy as np
+    from monte_carlo import build_return_model, run_simulation
+    
+    # Histórico sintético: 20 anos de retornos mensais de 5 ativos correlacionados
+    rng = np.random.default_rng(42)
+    market = rng.normal(0.008, 0.04, (240, 1))
+    monthly_returns = market * rng.uniform(0.3, 1.2, (1, 5)) + rng.normal(0.002, 0.02, (240, 5))
+    weights = np.full(5, 0.2)
+    plan = {
+        'idade_atual': 30, 'idade_aposentadoria': 65, 'periodo_usufruir': 30,
+        'patrimonio_inicial': 50000.0, 'aporte_mensal': 2000.0,
+        'renda_anual': 60000.0, 'inflacao_anual': 4.0,
+    }
+    
+    results = []
+    for method in args.methods:
+        model = build_return_model(monthly_returns, weights, method)
+        medians = set()
+        for workers in args.workers:
+            start = time.perf_counter()
+            summary = run_simulation(model, plan, args.paths, seed=7, workers=workers)
+            elapsed = time.perf_counter() - start
+            medians.add(tuple(summary['percentis']['50']))
+            results.append((method, workers, elapsed, summary['probabilidade_sucesso']))
+            print(f"OK: {method}, {workers} processo(s): {elapsed:.2f}s")
+        
+        # Mesma semente, mesmo resultado com qualquer número de processos
+        if len(medians) != 1:
+            print(f"ERRO: {method}: resultado muda com o numero de processos")
+            return 1
+    
+    print("\n" + "=" * 70)
+    print(f"{args.paths} caminhos x {12 * 65} meses")
+    print(f"{'Metodo':<14} {'Processos':>10} {'Tempo (s)':>10} {'Caminhos/s':>14} {'Sucesso':>10}")
+    print("-" * 70)
+    for method, workers, elapsed, success in results:
+        print(f"{method:<14} {workers:>10} {elapsed:>10.2f} {args.paths / elapsed:>14,.0f} {success * 100:>9.1f}%")
+    print("=" * 70)
+    
+    return 0
+
+def benchmark_align(args):
+    """Mede a vazão do alinhamento ao calendário mestre para muitos tickers"""
+    import numpy as np
+    import pandas as pd
+    from trading_calendar import business_days as trading_days
+    from align_series import align_frame
+    
+    results = []
+    for num_tickers in args.tickers:
+        frame = generate_historical_frame(num_tickers, args.years)
+        
+        # Lacunas aleatórias e uma série de taxa diária (%) no estilo do CDI
+        rng = np.random.default_rng(3)
+        frame = frame[rng.random(len(frame)) >= args.gaps]
+        rate_days = frame['data'].drop_duplicates().sort_values().to_numpy()
+        rate = pd.DataFrame({'ticker': 'CDI', 'data': rate_days,
+                             'fechamento': rng.uniform(0.02, 0.05, len(rate_days))})
+        frame = pd.concat([rate, frame[['ticker', 'data', 'fechamento']]], ignore_index=True)
+        calendar = trading_days(frame['data'].min(), frame['data'].max())
+        
+        start = time.perf_counter()
+        aligned = align_frame(frame, calendar, {'CDI': 'diaria'}, max_fill=10)
+        elapsed = time.perf_counter() - start
+        
+        rows_out = len(aligned['codigo'])
+        results.append((num_tickers, len(frame), rows_out, int(aligned['preenchido'].sum()), elapsed))
+        print(f"OK: {num_tickers} tickers: {len(frame)} -> {rows_out} linhas em {elapsed:.2f}s")
+    
+    print("\n" + "=" * 78)
+    print(f"{'Tickers':>8} {'Entrada':>12} {'Saida':>12} {'Preenchidas':>12} {'Tempo (s)':>10} {'Linhas/s':>14}")
+    print("-" * 78)
+    for num_tickers, rows_in, rows_out, filled, elapsed in results:
+        print(f"{num_tickers:>8} {rows_in:>12} {rows_out:>12} {filled:>12} {elapsed:>10.2f} "
+              f"{rows_in / elapsed:>14,.0f}")
+    print("=" * 78)
+    
+    return 0
+
+def benchmark_cache(args):
+    """Compara leituras por intervalo com e sem o cache de data_access"""
+    from create_schema import get_postgres_connection, create_database_schema
+    from insert_data import insert_table_data, update_load_watermarks
+    from data_access import DataAccess
+    
+    print(f"Gerando dados sinteticos: {args.tickers} tickers x {args.years} anos...")
+    records = generate_historical_records(args.tickers, args.years)
+    
+    # Conjunto fixo de leituras distintas, acessadas com popularidade desigual
+    rng = random.Random(11)
+    tickers = sorted({r['ticker'] for r in records})
+    first = date.fromisoformat(min(r['data'] for r in records))
+    span = (date.fromisoformat(max(r['data'] for r in records)) - first).days - args.window
+    distinct = []
+    for _ in range(args.distinct):
+        start = first + timedelta(days=rng.randrange(max(span, 1)))
+        distinct.append((rng.choice(tickers), start.isoformat(),
+                         (start + timedelta(days=args.window)).isoformat()))
+    reads = [distinct[min(int(rng.paretovariate(1.2)) - 1, len(distinct) - 1)] for _ in range(args.reads)]
+    
+    schema_name = "bench_cache"
+    os.environ['PGOPTIONS'] = f"-c search_path={schema_name}"
+    conn = get_postgres_connection()
+    results = []
+    
+    def run(name, data):
+        start = time.perf_counter()
+        for ticker, first_day, last_day in reads:
+            data.read_range(ticker, first_day, last_day)
+        elapsed = time.perf_counter() - start
+        stats = data.stats()
+        results.append((name, elapsed, stats))
+        print(f"OK: {name}: {len(reads)} leituras em {elapsed:.2f}s")
+        return stats
+    
+    try:
+        reset_bench_schema(conn, schema_name)
+        create_database_schema(conn, 'heap')
+        insert_table_data(conn, 'dados_historicos', records)
+        update_load_watermarks(conn, records)
+        
+        uncached = DataAccess(max_bytes=0)
+        run("sem cache", uncached)
+        uncached.close()
+        
+        cached = DataAccess(max_bytes=int(args.cache_mb * 1024 * 1024))
+        run("com cache", cached)
+        
+        # Nova carga de 10% dos tickers: versao muda e as entradas caem
+        reloaded = set(tickers[:max(1, len(tickers) // 10)])
+        update_load_watermarks(conn, [r for r in records if r['ticker'] in reloaded])
+        invalidated = cached.refresh_versions(force=True)
+        print(f"OK: {len(reloaded)} tickers recarregados, {invalidated} entradas invalidadas")
+        run("apos recarga", cached)
+        cached.close()
+        
+        if not args.keep:
+            drop_bench_schema(conn, schema_name)
+    finally:
+        conn.close()
+        os.environ.pop('PGOPTIONS', None)
+    
+    def ms(value):
+        return f"{value:.3f}" if value is not None else "-"
+    
+    print("\n" + "=" * 78)
+    print(f"{'Modo':<14} {'Tempo (s)':>10} {'Acertos':>9} {'Acerto p50':>12} {'Falta p50':>12} {'Falta p95':>12}")
+    print("-" * 78)
+    for name, elapsed, stats in results:
+        hit_rate = f"{stats['taxa_acerto'] * 100:.1f}%" if stats['taxa_acerto'] is not None else "-"
+        print(f"{name:<14} {elapsed:>10.2f} {hit_rate:>9} {ms(stats['latencia_acerto_p50_ms']):>12} "
+              f"{ms(stats['latencia_falta_p50_ms']):>12} {ms(stats['latencia_falta_p95_ms']):>12}")
+    print("-" * 78)
+    print("Latencias em ms; contadores acumulados desde a criacao de cada DataAccess")
+    print("=" * 78)
+    
+    return 0
+
+def benchmark_fanout(args):
+    """Compara cargas sequenciais por destino com a carga em leque de uma extração"""
+    import tempfile
+    from create_schema import get_postgres_connection, create_database_schema
+    from insert_data import get_target_configs, fan_out_insert, print_fan_out_summary
+    
+    print(f"Gerando dados sinteticos: {args.tickers} tickers x {args.years} anos...")
+    records = generate_historical_records(args.tickers, args.years)
+    
+    # Destinos simulados por schemas isolados no mesmo servidor
+    base_config = get_target_configs(['local'])[0][1]
+    schema_names = [f"bench_fanout_{i}" for i in range(args.targets)]
+    targets = [(name, dict(base_config, options=f"-c search_path={name}")) for name in schema_names]
+    if args.failing:
+        targets.append(("indisponivel", dict(base_config, port='1', connect_timeout=2)))
+    
+    conn = get_postgres_connection()
+    
+    def reset_targets():
+        for name in schema_names:
+            reset_bench_schema(conn, name)
+            create_database_schema(conn, 'heap')
+    
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            with open(f"{data_dir}/dados_historicos.json", 'w', encoding='utf-8') as f:
+                json.dump(records, f)
+            del records
+            
+            # Uma leitura do JSON e uma carga por destino, um após o outro
+            reset_targets()
+            print(f"\n{'='*20} SEQUENCIAL {'='*20}")
+            start = time.perf_counter()
+            sequential = {}
+            for target in targets:
+                sequential.update(fan_out_insert(['dados_historicos'], [target], data_dir, args.retries))
+            sequential_time = time.perf_counter() - start
+            
+            # Uma leitura do JSON entregue a todos os destinos ao mesmo tempo
+            reset_targets()
+            print(f"\n{'='*20} EM LEQUE {'='*20}")
+            start = time.perf_counter()
+            fanned = fan_out_insert(['dados_historicos'], targets, data_dir, args.retries)
+            fanout_time = time.perf_counter() - start
+        
+        if not args.keep:
+            for name in schema_names:
+                drop_bench_schema(conn, name)
+    finally:
+        conn.close()
+    
+    print("\nSequencial:")
+    print_fan_out_summary(sequential)
+    print("Em leque:")
+    print_fan_out_summary(fanned)
+    
+    slowest = max(elapsed for _, elapsed in fanned.values())
+    print("\n" + "=" * 60)
+    print(f"{'Modo':<12} {'Destinos':>10} {'Total (s)':>12}")
+    print("-" * 60)
+    print(f"{'sequencial':<12} {len(targets):>10} {sequential_time:>12.2f}")
+    print(f"{'em leque':<12} {len(targets):>10} {fanout_time:>12.2f}")
+    print("-" * 60)
+    print(f"Destino mais lento (em leque): {slowest:.2f}s")
+    print(f"Ganho da carga em leque: {sequential_time / fanout_time:.1f}x")
+    print("=" * 60)
+    
+    return 0
+
+def parse_importtime(stderr):
+    """Lê a saída de -X importtime: (total em ms, [(ms, módulo)] de 1º nível)"""
+    top_level = []
+    
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = (part for part in line[len('import time:'):].split('|'))
+        # Módulos importados diretamente têm o nome sem recuo extra
+        if name.startswith(' ') and not name.startswith('  '):
+            top_level.append((int(cumulative) / 1000, name.strip()))
+    
+    return sum(ms for ms, _ in top_level), sorted(top_level, reverse=True)
+
+# Interpreta os argumentos com o parser de migrate.py e só importa os passos
+STARTUP_IMPORT_ONLY = """
+import sys
+import migrate
+args = migrate.build_parser().parse_args(sys.argv[1:])
+migrate.load_step_function(migrate.get_step_target(args.step or args.command, args.use_async))
+"""
+
+def benchmark_startup(args):
+    """Mede o custo de import de cada subcomando de migrate.py com -X importtime"""
+    from migrate import STEPS
+    
+    migration_dir = os.path.dirname(os.path.abspath(__file__))
+    
+    commands = [
+        ("eager (antigo)", ['-c', 'import create_schema, extract_data, insert_data']),
+    ] + [
+        (command, ['-c', STARTUP_IMPORT_ONLY, command])
+        for command in STEPS
+    ] + [
+        ("extract --async", ['-c', STARTUP_IMPORT_ONLY, 'extract', '--async']),
+    ]
+    
+    results = []
+    for name, command in commands:
+        import_times, wall_times = [], []
+        
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, '-X', 'importtime'] + command,
+                cwd=migration_dir, capture_output=True, text=True
+            )
+            wall_times.append((time.perf_counter() - start) * 1000)
+            
+            if completed.returncode != 0:
+                print(f"ERRO: {name}: {completed.stderr.strip().splitlines()[-1]}")
+                break
+            
+            total_ms, modules = parse_importtime(completed.stderr)
+            import_times.append(total_ms)
+        else:
+            heaviest = ', '.join(f"{module} {ms:.0f}ms" for ms, module in modules[:3])
+            results.append((name, statistics.median(import_times), statistics.median(wall_times), heaviest))
+    
+    print("\n" + "=" * 100)
+    print(f"{'Subcomando':<18} {'Imports (ms)':>13} {'Processo (ms)':>14}  Mais pesados")
+    print("-" * 100)
+    for name, import_ms, wall_ms, heaviest in results:
+        print(f"{name:<18} {import_ms:>13.1f} {wall_ms:>14.1f}  {heaviest}")
+    print("=" * 100)
+    
+    return 0
+
+def main():
+    """Função principal com argumentos de linha de comando"""
+    parser = argparse.ArgumentParser(description='Benchmarks da migração')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    
+    schema_parser = subparsers.add_parser('schema', help='Layouts de dados_historicos (heap/range/list)')
+    schema_parser.add_argument('--tickers', type=int, default=50, help='Quantidade de tickers sinteticos')
+    schema_parser.add_argument('--years', type=int, default=10, help='Anos de historico por ticker')
+    schema_parser.add_argument('--repeat', type=int, default=200, help='Execucoes de consulta por layout')
+    schema_parser.add_argument('--layouts', nargs='+', choices=['heap', 'range', 'list'],
+                               help='Layouts a comparar (padrao: todos)')
+    schema_parser.add_argument('--keep', action='store_true', help='Manter os schemas bench_* ao final')
+    schema_parser.set_defaults(func=benchmark_schema)
+    
+    bulk_parser = subparsers.add_parser('bulkload', help='Carga padrao vs modo bulk')
+    bulk_parser.add_argument('--tickers', type=int, default=50, help='Quantidade de tickers sinteticos')
+    bulk_parser.add_argument('--years', type=int, default=10, help='Anos de historico por ticker')
+    bulk_parser.add_argument('--duplicates', type=float, default=0.01, help='Fracao de linhas duplicadas')
+    bulk_parser.add_argument('--keep', action='store_true', help='Manter os schemas bench_* ao final')
+    bulk_parser.set_defaults(func=benchmark_bulkload)
+    
+    analytics_parser = subparsers.add_parser('analytics', help='Consultas brutas vs tabelas de resumo')
+    analytics_parser.add_argument('--tickers', type=int, default=50, help='Quantidade de tickers sinteticos')
+    analytics_parser.add_argument('--years', type=int, default=10, help='Anos de historico por ticker')
+    analytics_parser.add_argument('--repeat', type=int, default=20, help='Execucoes de cada consulta')
+    analytics_parser.add_argument('--keep', action='store_true', help='Manter o schema bench_analytics ao final')
+    analytics_parser.set_defaults(func=benchmark_analytics)
+    
+    extract_parser = subparsers.add_parser('extract', help='Extracao serial vs threads vs async (PostgREST local)')
+    extract_parser.add_argument('--tickers', type=int, default=20, help='Quantidade de tickers sinteticos')
+    extract_parser.add_argument('--years', type=int, default=5, help='Anos de historico por ticker')
+    extract_parser.add_argument('--batch-size', type=int, default=1000, help='Registros por pagina')
+    extract_parser.add_argument('--latency', type=float, default=50, help='Latencia simulada por pagina (ms)')
+    extract_parser.add_argument('--concurrency', type=int, default=8, help='Requisicoes simultaneas no modo async')
+    extract_parser.set_defaults(func=benchmark_extract)
+    
+    rerun_parser = subparsers.add_parser('rerun', help='Custo de reexecutar a carga idempotente')
+    rerun_parser.add_argument('--tickers', type=int, default=50, help='Quantidade de tickers sinteticos')
+    rerun_parser.add_argument('--years', type=int, default=10, help='Anos de historico por ticker')
+    rerun_parser.add_argument('--changed', type=float, default=0.01, help='Fracao de linhas alteradas na 3a execucao')
+    rerun_parser.add_argument('--keep', action='store_true', help='Manter o schema bench_rerun ao final')
+    rerun_parser.set_defaults(func=benchmark_rerun)
+    
+    quality_parser = subparsers.add_parser('quality', help='Vazao da varredura de qualidade (linhas/s)')
+    quality_parser.add_argument('--tickers', type=int, nargs='+', default=[100, 200, 400],
+                                help='Quantidades de tickers sinteticos (uma execucao por valor)')
+    quality_parser.add_argument('--years', type=int, default=20, help='Anos de historico por ticker')
+    quality_parser.add_argument('--anomalies', type=float, default=0.0001,
+                                help='Fracao de linhas com cada tipo de anomalia')
+    quality_parser.add_argument('--zscore', type=float, default=6.0, help='Limite de |z-score|')
+    quality_parser.set_defaults(func=benchmark_quality)
+    
+    covariance_parser = subparsers.add_parser('covariance', help='Cubo de covariancia: ingenuo vs incremental, EWMA e cache')
+    covariance_parser.add_argument('--tickers', type=int, default=120, help='Quantidade de ativos sinteticos')
+    covariance_parser.add_argument('--years', type=int, default=20, help='Anos de pregoes')
+    covariance_parser.add_argument('--windows', type=int, nargs='+', default=[21, 63, 252],
+                                   help='Janelas deslizantes em pregoes')
+    covariance_parser.add_argument('--decay', type=float, default=0.94, help='Decaimento da EWMA')
+    covariance_parser.set_defaults(func=benchmark_covariance)
+    
+    montecarlo_parser = subparsers.add_parser('montecarlo', help='Caminhos/s da simulacao de Monte Carlo')
+    montecarlo_parser.add_argument('--paths', type=int, default=50000, help='Caminhos por execucao')
+    montecarlo_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                                   help='Numeros de processos a comparar')
+    montecarlo_parser.add_argument('--methods', nargs='+', choices=['bootstrap', 'parametrico'],
+                                   default=['bootstrap', 'parametrico'], help='Metodos de amostragem')
+    montecarlo_parser.set_defaults(func=benchmark_montecarlo)
+    
+    align_parser = subparsers.add_parser('align', help='Vazao do alinhamento ao calendario mestre')
+    align_parser.add_argument('--tickers', type=int, nargs='+', default=[100, 500, 1000],
+                              help='Quantidades de tickers sinteticos (uma execucao por valor)')
+    align_parser.add_argument('--years', type=int, default=10, help='Anos de historico por ticker')
+    align_parser.add_argument('--gaps', type=float, default=0.01, help='Fracao de pregoes removidos')
+    align_parser.set_defaults(func=benchmark_align)
+    
+    cache_parser = subparsers.add_parser('cache', help='Leituras por intervalo com e sem cache local')
+    cache_parser.add_argument('--tickers', type=int, default=50, help='Quantidade de tickers sinteticos')
+    cache_parser.add_argument('--years', type=int, default=10, help='Anos de historico por ticker')
+    cache_parser.add_argument('--distinct', type=int, default=200, help='Leituras distintas (ticker + janela)')
+    cache_parser.add_argument('--reads', type=int, default=5000, help='Total de leituras')
+    cache_parser.add_argument('--window', type=int, default=365, help='Dias por janela de leitura')
+    cache_parser.add_argument('--cache-mb', type=float, default=64, help='Tamanho do cache (MB)')
+    cache_parser.add_argument('--keep', action='store_true', help='Manter o schema bench_cache ao final')
+    cache_parser.set_defaults(func=benchmark_cache)
+    
+    fanout_parser = subparsers.add_parser('fanout', help='Uma extracao carregada em varios destinos')
+    fanout_parser.add_argument('--tickers', type=int, default=50, help='Quantidade de tickers sinteticos')
+    fanout_parser.add_argument('--years', type=int, default=10, help='Anos de historico por ticker')
+    fanout_parser.add_argument('--targets', type=int, default=3, help='Destinos (schemas bench_fanout_N)')
+    fanout_parser.add_argument('--retries', type=int, default=2, help='Tentativas por tabela em cada destino')
+    fanout_parser.add_argument('--failing', action='store_true',
+                               help='Incluir um destino inacessivel para exercitar o isolamento de falhas')
+    fanout_parser.add_argument('--keep', action='store_true', help='Manter os schemas bench_fanout_N ao final')
+    fanout_parser.set_defaults(func=benchmark_fanout)
+    
+    startup_parser = subparsers.add_parser('startup', help='Tempo de import por subcomando (-X importtime)')
+    startup_parser.add_argument('--repeat', type=int, default=5, help='Execucoes por subcomando')
+    startup_parser.set_defaults(func=benchmark_startup)
+    
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Cubo de covariância/correlação móvel entre ativos (data x ativo x ativo)
+
+A janela deslizante é atualizada de forma incremental: a cada pregão entra
+o produto externo do retorno novo e sai o do retorno mais antigo, O(ativos²)
+por data em vez de O(janela x ativos²). A variante EWMA usa a recursão
+exponencial com média móvel.
+
+Os retornos vêm dos níveis alinhados ao calendário da B3 (align_series):
+séries de taxa como o CDI são capitalizadas em índice antes, então suas
+linhas no cubo são covariâncias de retornos e não de variações da taxa.
+
+Os cubos ficam em cache no disco (arquivos .npy abertos com mmap), com
+chave derivada do conjunto de tickers, do método/janela e da versão dos
+dados em controle_carga: uma nova carga dos tickers invalida o cache.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+
+from data_access import get_postgres_connection
+from align_series import get_rate_tickers, load_level_matrix
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Atualizações incrementais entre recálculos exatos das somas da janela
+# (limita o acúmulo de erro de ponto flutuante)
+RESYNC_INTERVAL = 500
+
+# Decaimento padrão da EWMA (RiskMetrics, dados diários)
+DEFAULT_EWMA_DECAY = 0.94
+
+def get_cache_dir():
+    """Diretório do cache de cubos (COV_CACHE_DIR)"""
+    return os.getenv('COV_CACHE_DIR', 'migration/cache/covariancia')
+
+def compute_returns(levels):
+    """Retornos simples da matriz de níveis (align_series.load_level_matrix)
+    
+    Os níveis já vêm repetidos nos dias sem observação; antes do início e
+    depois do fim de cada série eles são NaN, e os retornos também.
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = levels[1:] / levels[:-1] - 1
+    
+    returns[~np.isfinite(returns)] = np.nan
+    return returns
+
+def pairwise_covariance(pairs, sums, cross, min_periods):
+    """Covariância amostral por par a partir das somas das datas em comum
+    
+    pairs[i, j] conta as datas em que i e j têm retorno, sums[i, j] soma os
+    retornos de i nessas datas e cross[i, j] os produtos. Pares com menos de
+    min_periods datas em comum ficam NaN.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = (cross - sums * sums.T / pairs) / (pairs - 1)
+    return np.where(pairs >= min_periods, covariance, np.nan)
+
+def rolling_covariance(returns, window, step=1, min_periods=None):
+    """Cubo de covariâncias amostrais em janela deslizante
+    
+    Retornos NaN (fora do histórico de um ticker) ficam fora das somas:
+    cada par usa só as datas em que os dois têm retorno, e pares com menos
+    de min_periods (padrão: a janela inteira) datas em comum saem NaN.
+    Retorna (cubo, fins) com o índice da última linha de cada janela.
+    """
+    num_dates, num_assets = returns.shape
+    min_periods = window if min_periods is None else max(min_periods, 2)
+    ends = np.arange(window - 1, num_dates, step)
+    cube = np.empty((len(ends), num_assets, num_assets))
+    
+    if not len(ends):
+        return cube, ends
+    
+    # Covariância não muda com deslocamento: centrar reduz o cancelamento
+    # numérico em (Σrrᵀ - ΣrΣrᵀ/n). Retornos ausentes viram 0 com máscara 0
+    valid = np.isfinite(returns)
+    mean = np.where(valid, returns, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    centered = np.where(valid, returns - mean, 0.0)
+    mask = valid.astype(np.float64)
+    complete = valid.all(axis=1)
+    gaps = np.concatenate([[0], np.cumsum(~complete)])
+    
+    def window_sums(end):
+        block, block_mask = centered[end - window + 1:end + 1], mask[end - window + 1:end + 1]
+        return block_mask.T @ block_mask, block.T @ block_mask, block.T @ block
+    
+    # Saltos longos entre saídas: recalcular cada janela sai mais barato
+    if step * 2 >= window:
+        for i, end in enumerate(ends):
+            cube[i] = pairwise_covariance(*window_sums(end), min_periods)
+        return cube, ends
+    
+    pairs, sums, cross = window_sums(window - 1)
+    output = 0
+    
+    for end in range(window - 1, num_dates):
+        if end >= window:
+            if (end - window + 1) % RESYNC_INTERVAL == 0:
+                pairs, sums, cross = window_sums(end)
+            else:
+                entering, leaving = centered[end], centered[end - window]
+                
+                # Linhas completas não mudam as contagens por par
+                if complete[end] and complete[end - window]:
+                    sums += (entering - leaving)[:, None]
+                else:
+                    entering_mask, leaving_mask = mask[end], mask[end - window]
+                    pairs += np.outer(entering_mask, entering_mask)
+                    pairs -= np.outer(leaving_mask, leaving_mask)
+                    sums += np.outer(entering, entering_mask)
+                    sums -= np.outer(leaving, leaving_mask)
+                
+                cross += np.outer(entering, entering)
+                cross -= np.outer(leaving, leaving)
+        
+        if (end - window + 1) % step == 0:
+            # Janela sem lacunas: todos os pares têm `window` datas em comum
+            if gaps[end + 1] == gaps[end - window + 1]:
+                total = sums[:, 0]
+                cube[output] = (cross - np.outer(total, total) / window) / (window - 1)
+            else:
+                cube[output] = pairwise_covariance(pairs, sums, cross, min_periods)
+            output += 1
+    
+    return cube, ends
+
+def ewma_covariance(returns, decay=DEFAULT_EWMA_DECAY, step=1, warmup=None):
+    """Cubo de covariâncias EWMA (média também exponencial)
+    
+    Cada ticker entra na recursão a partir do seu primeiro retorno; um par
+    só é emitido depois de `warmup` atualizações em comum (padrão:
+    1/(1-decay)) e sai NaN antes disso.
+    """
+    num_dates, num_assets = returns.shape
+    warmup = warmup if warmup is not None else int(np.ceil(1 / (1 - decay)))
+    ends = np.arange(max(warmup, 1), num_dates, step)
+    cube = np.empty((len(ends), num_assets, num_assets))
+    
+    if not len(ends):
+        return cube, ends
+    
+    mean = np.full(num_assets, np.nan)
+    covariance = np.zeros((num_assets, num_assets))
+    updates = np.zeros((num_assets, num_assets), dtype=np.int64)
+    output = 0
+    
+    for t in range(num_dates):
+        valid = np.isfinite(returns[t])
+        started = valid & np.isfinite(mean)
+        
+        if started.all():
+            delta = returns[t] - mean
+            mean += (1 - decay) * delta
+            covariance *= decay
+            covariance += decay * (1 - decay) * np.outer(delta, delta)
+            updates += 1
+        else:
+            delta = np.where(started, returns[t] - mean, 0.0)
+            pairs = np.outer(started, started)
+            covariance = np.where(pairs, decay * covariance + decay * (1 - decay) * np.outer(delta, delta),
+                                  covariance)
+            updates += pairs
+            mean = np.where(started, mean + (1 - decay) * delta, np.where(valid, returns[t], mean))
+        
+        if output < len(ends) and t == ends[output]:
+            cube[output] = np.where(updates >= warmup, covariance, np.nan)
+            output += 1
+    
+    return cube, ends
+
+def covariance_to_correlation(cube):
+    """Converte um cubo de covariâncias em correlações (NaN sem variância)"""
+    deviation = np.sqrt(np.diagonal(cube, axis1=1, axis2=2))
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = cube / (deviation[:, :, None] * deviation[:, None, :])
+    
+    correlation[~np.isfinite(correlation)] = np.nan
+    return correlation
+
+def get_data_version(conn, tickers):
+    """Versão dos dados dos tickers (versao e data_max de controle_carga)
+    
+    Tickers sem controle_carga entram com a contagem e a última data de
+    dados_historicos.
+    """
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("""
+            SELECT ticker, versao, data_max::text FROM controle_carga
+            WHERE ticker = ANY(%s)
+        """, (list(tickers),))
+        versions = {ticker: [versao, data_max] for ticker, versao, data_max in cursor.fetchall()}
+        
+        untracked = [t for t in tickers if t not in versions]
+        if untracked:
+            cursor.execute("""
+                SELECT ticker, COUNT(*), MAX(data)::text FROM dados_historicos
+                WHERE ticker = ANY(%s)
+                GROUP BY ticker
+            """, (untracked,))
+            versions.update({ticker: ['n', rows, last] for ticker, rows, last in cursor.fetchall()})
+        
+        conn.rollback()
+    finally:
+        cursor.close()
+    
+    payload = json.dumps(sorted(versions.items()), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def get_cache_key(tickers, method, parameter, step, data_version):
+    """Chave do cubo no cache"""
+    payload = json.dumps({
+        'tickers': sorted(tickers),
+        'metodo': method,
+        'parametro': parameter,
+        'passo': step,
+        'versao': data_version,
+        'taxas': get_rate_tickers(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+def save_cached_cube(key, dates, tickers, cube, metadata, cache_dir=None):
+    """Grava o cubo no cache (diretório temporário + rename atômico)"""
+    path = os.path.join(cache_dir or get_cache_dir(), key)
+    staging = f"{path}.tmp{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+    
+    np.save(os.path.join(staging, 'covariancia.npy'), cube)
+    np.save(os.path.join(staging, 'datas.npy'), dates)
+    with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(metadata, tickers=list(tickers)), f, ensure_ascii=False, indent=2)
+    
+    try:
+        os.rename(staging, path)
+    except OSError:
+        # Outro processo gravou a mesma chave primeiro
+        shutil.rmtree(staging, ignore_errors=True)
+    
+    return path
+
+def load_cached_cube(key, cache_dir=None):
+    """Abre um cubo do cache com mmap: (datas, tickers, cubo) ou None"""
+    path = os.path.join(cache_dir or get_cache_dir(), key)
+    
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        metadata = json.load(f)
+    
+    cube = np.load(os.path.join(path, 'covariancia.npy'), mmap_mode='r')
+    dates = np.load(os.path.join(path, 'datas.npy'))
+    return dates, metadata['tickers'], cube
+
+def clear_cache(cache_dir=None):
+    """Remove todos os cubos do cache"""
+    cache_dir = cache_dir or get_cache_dir()
+    removed = len(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else 0
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return removed
+
+def get_covariance_cube(conn, tickers, window=None, decay=None, step=1, use_cache=True):
+    """Cubo de covariâncias (datas, tickers, cubo) de uma janela ou EWMA
+    
+    Informe `window` (janela deslizante, em pregões) ou `decay` (EWMA).
+    """
+    if (window is None) == (decay is None):
+        raise ValueError("Informe window ou decay (exatamente um)")
+    
+    tickers = sorted(set(tickers))
+    method, parameter = ('janela', int(window)) if window is not None else ('ewma', float(decay))
+    
+    key = None
+    if use_cache:
+        key = get_cache_key(tickers, method, parameter, step, get_data_version(conn, tickers))
+        cached = load_cached_cube(key)
+        if cached is not None:
+            return cached
+    
+    dates, levels = load_level_matrix(conn, tickers)
+    returns = compute_returns(levels)
+    
+    if method == 'janela':
+        cube, ends = rolling_covariance(returns, parameter, step)
+    else:
+        cube, ends = ewma_covariance(returns, parameter, step)
+    
+    # Retorno i vai de dates[i] a dates[i + 1]
+    cube_dates = dates[1:][ends]
+    
+    if use_cache:
+        save_cached_cube(key, cube_dates, tickers, cube, {'metodo': method, 'parametro': parameter, 'passo': step})
+    
+    return cube_dates, tickers, cube
+
+def get_correlation_cube(conn, tickers, window=None, decay=None, step=1, use_cache=True):
+    """Cubo de correlações (datas, tickers, cubo) derivado do de covariâncias"""
+    dates, tickers, cube = get_covariance_cube(conn, tickers, window, decay, step, use_cache)
+    return dates, tickers, covariance_to_correlation(np.asarray(cube))
+
+def load_basket_tickers(conn, basket_name=None):
+    """Tickers de uma cesta (ou de todas) presentes em dados_historicos"""
+    cursor = conn.cursor()
+    
+    try:
+        if basket_name:
+            cursor.execute("SELECT ativos FROM cestas WHERE nome = %s", (basket_name,))
+        else:
+            cursor.execute("SELECT ativos FROM cestas")
+        
+        tickers = set()
+        for (assets,) in cursor.fetchall():
+            tickers.update(assets.keys() if isinstance(assets, dict) else assets or [])
+        
+        cursor.execute("SELECT DISTINCT ticker FROM controle_carga WHERE ticker = ANY(%s)", (sorted(tickers),))
+        loaded = {row[0] for row in cursor.fetchall()}
+        conn.rollback()
+    finally:
+        cursor.close()
+    
+    return sorted(tickers & loaded) if loaded else sorted(tickers)
+
+def main(argv=None):
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Cubo de covariancia/correlacao movel entre ativos')
+    parser.add_argument('--tickers', nargs='+', help='Tickers (padrao: ativos de todas as cestas)')
+    parser.add_argument('--cesta', help='Usar os ativos de uma cesta')
+    parser.add_argument('--windows', type=int, nargs='*', default=[63],
+                        help='Janelas deslizantes em pregoes')
+    parser.add_argument('--decay', type=float, nargs='*', default=[],
+                        help='Decaimentos EWMA (ex.: 0.94)')
+    parser.add_argument('--step', type=int, default=1, help='Emitir uma matriz a cada N pregoes')
+    parser.add_argument('--no-cache', action='store_true', help='Ignorar o cache em disco')
+    parser.add_argument('--clear-cache', action='store_true', help='Apagar o cache e sair')
+    args = parser.parse_args(argv if argv is not None else [])
+    
+    if args.clear_cache:
+        print(f"OK: {clear_cache()} cubos removidos de {get_cache_dir()}")
+        return 0
+    
+    try:
+        conn = get_postgres_connection()
+        print("OK: Conectado ao PostgreSQL")
+        
+        tickers = args.tickers or load_basket_tickers(conn, args.cesta)
+        if not tickers:
+            print("ERRO: Nenhum ticker encontrado")
+            return 1
+        
+        variants = [{'window': w} for w in args.windows] + [{'decay': d} for d in args.decay]
+        for variant in variants:
+            start = time.time()
+            dates, names, cube = get_covariance_cube(conn, tickers, step=args.step,
+                                                     use_cache=not args.no_cache, **variant)
+            label = ', '.join(f"{k}={v}" for k, v in variant.items())
+            period = f"{dates[0]} a {dates[-1]}" if len(dates) else "sem datas"
+            print(f"OK: {label}: {cube.shape[0]} datas x {len(names)} ativos ({period}) "
+                  f"em {time.time() - start:.2f}s")
+        
+        conn.close()
+    
+    except Exception as e:
+        print(f"ERRO: Erro ao calcular o cubo de covariancia: {e}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -4,25 +4,388 @@ Script para criar o schema do banco PostgreSQL local
 baseado na estrutura do Supabase
 """
 
-import psycopg2
 import os
+import re
+import time
+import json
+import hashlib
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+from data_access import get_postgres_connection
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
-def get_postgres_connection():
-    """Cria conexão com PostgreSQL local"""
-    return psycopg2.connect(
-        host=os.getenv('POSTGRES_HOST', 'localhost'),
-        port=os.getenv('POSTGRES_PORT', '5432'),
-        database=os.getenv('POSTGRES_DB', 'paridaderisco'),
-        user=os.getenv('POSTGRES_USER', 'postgres'),
-        password=os.getenv('POSTGRES_PASSWORD', 'postgres')
+# Layouts suportados para a tabela dados_historicos:
+#   heap  - tabela única (padrão, comportamento original)
+#   range - particionada por ano na coluna data
+#   list  - particionada por ticker
+SCHEMA_LAYOUTS = ('heap', 'range', 'list')
+
+# Limite de identificadores do PostgreSQL (NAMEDATALEN - 1)
+MAX_IDENTIFIER_LENGTH = 63
+
+def get_schema_layout():
+    """Retorna o layout configurado para dados_historicos (SCHEMA_LAYOUT)"""
+    layout = os.getenv('SCHEMA_LAYOUT', 'heap').strip().lower()
+    
+    if layout not in SCHEMA_LAYOUTS:
+        raise ValueError(
+            f"SCHEMA_LAYOUT invalido: '{layout}' (use: {', '.join(SCHEMA_LAYOUTS)})"
+        )
+    
+    return layout
+
+def is_bulk_load():
+    """Indica se o modo de carga em massa está ativo (BULK_LOAD)"""
+    return os.getenv('BULK_LOAD', 'false').strip().lower() == 'true'
+
+def get_dados_historicos_ddl(layout='heap'):
+    """Retorna o DDL de dados_historicos para o layout informado"""
+    if layout == 'range':
+        partition_clause = " PARTITION BY RANGE (data)"
+    elif layout == 'list':
+        partition_clause = " PARTITION BY LIST (ticker)"
+    else:
+        partition_clause = ""
+    
+    return f"""
+        CREATE TABLE IF NOT EXISTS dados_historicos (
+            id SERIAL,
+            ticker VARCHAR(20) NOT NULL,
+            nome_ativo VARCHAR(255),
+            data DATE NOT NULL,
+            abertura DECIMAL(15,8),
+            maxima DECIMAL(15,8),
+            minima DECIMAL(15,8),
+            fechamento DECIMAL(15,8),
+            fechamento_ajustado DECIMAL(15,8),
+            volume BIGINT,
+            retorno_diario DECIMAL(15,8),
+            mm20 DECIMAL(15,8),
+            bb2s DECIMAL(15,8),
+            bb2i DECIMAL(15,8),
+            pico DECIMAL(15,8),
+            drawdown DECIMAL(15,8),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        ){partition_clause}
+        """
+
+def get_constraint_definitions(layout='heap'):
+    """Retorna as constraints de cada tabela como (tabela, nome, definição)
+    
+    As tabelas são criadas sem constraints e estas são adicionadas em
+    seguida; no modo bulk, somente após a carga dos dados.
+    """
+    # Em tabelas particionadas a chave primária precisa conter a chave de partição
+    dados_historicos_pk = {
+        'heap': 'PRIMARY KEY (id)',
+        'range': 'PRIMARY KEY (id, data)',
+        'list': 'PRIMARY KEY (id, ticker)',
+    }[layout]
+    
+    return [
+        ('ativos', 'ativos_pkey', 'PRIMARY KEY (id)'),
+        ('ativos', 'ativos_ticker_key', 'UNIQUE (ticker)'),
+        ('dados_historicos', 'dados_historicos_pkey', dados_historicos_pk),
+        ('dados_historicos', 'dados_historicos_ticker_data_key', 'UNIQUE (ticker, data)'),
+        ('cestas', 'cestas_pkey', 'PRIMARY KEY (id)'),
+        ('transacoes', 'transacoes_pkey', 'PRIMARY KEY (id)'),
+        ('transacoes', 'transacoes_type_check', "CHECK (type IN ('buy', 'sell'))"),
+        ('investment_funds', 'investment_funds_pkey', 'PRIMARY KEY (id)'),
+        ('cash_balance', 'cash_balance_pkey', 'PRIMARY KEY (id)'),
+    ]
+
+def get_index_commands(layout='heap'):
+    """Retorna os comandos de criação de índices para o layout informado"""
+    if layout == 'heap':
+        dados_historicos_indexes = [
+            "CREATE INDEX IF NOT EXISTS idx_dados_historicos_ticker ON dados_historicos(ticker)",
+            "CREATE INDEX IF NOT EXISTS idx_dados_historicos_data ON dados_historicos(data)",
+            "CREATE INDEX IF NOT EXISTS idx_dados_historicos_ticker_data ON dados_historicos(ticker, data)",
+        ]
+    else:
+        # UNIQUE(ticker, data) já atende buscas por ticker e por ticker + data;
+        # para intervalos de datas basta um BRIN, já que cada partição é
+        # carregada em ordem cronológica
+        dados_historicos_indexes = [
+            "CREATE INDEX IF NOT EXISTS idx_dados_historicos_data_brin ON dados_historicos USING brin (data)",
+        ]
+    
+    return dados_historicos_indexes + [
+        "CREATE INDEX IF NOT EXISTS idx_ativos_ticker ON ativos(ticker)",
+        "CREATE INDEX IF NOT EXISTS idx_transacoes_ativo_id ON transacoes(ativo_id)",
+        "CREATE INDEX IF NOT EXISTS idx_transacoes_asset ON transacoes(asset)",
+        "CREATE INDEX IF NOT EXISTS idx_transacoes_date ON transacoes(date)"
+    ]
+
+def get_partition_name(value):
+    """Gera nome de partição seguro a partir de um ano ou ticker
+    
+    Se o valor precisou ser normalizado (maiúsculas, '.', '-'...), um hash
+    curto do valor original evita colisões (BRK-B e BRK.B); o nome nunca
+    passa de MAX_IDENTIFIER_LENGTH, para o PostgreSQL não truncá-lo.
+    """
+    value = str(value)
+    slug = re.sub(r'[^a-z0-9]+', '_', value.lower()).strip('_')
+    name = "dados_historicos_" + slug
+    
+    if slug == value and len(name) <= MAX_IDENTIFIER_LENGTH:
+        return name
+    
+    digest = hashlib.sha1(value.encode('utf-8')).hexdigest()[:8]
+    return f"{name[:MAX_IDENTIFIER_LENGTH - len(digest) - 1]}_{digest}"
+
+def load_partition_tickers(data_dir="migration/data"):
+    """Carrega a lista de tickers a partir do ativos.json extraído
+    
+    Antes da extração a lista é vazia; as partições que faltarem são criadas
+    pela carga (create_ticker_partitions).
+    """
+    filename = f"{data_dir}/ativos.json"
+    
+    if not os.path.exists(filename):
+        return []
+    
+    with open(filename, 'r', encoding='utf-8') as f:
+        return sorted({record['ticker'] for record in json.load(f) if record.get('ticker')})
+
+def build_ticker_partition_commands(tickers, existing):
+    """Comandos (sql, parâmetros) que criam as partições por ticker que faltam
+    
+    existing são os nomes das partições já anexadas a dados_historicos.
+    Retorna (tickers sem partição, comandos); sem tickers faltando, nenhum comando.
+    """
+    default = get_partition_name('default')
+    missing = [t for t in sorted(set(tickers)) if get_partition_name(f't_{t}') not in existing]
+    if not missing:
+        return missing, []
+    
+    has_default = default in existing
+    commands = []
+    if has_default:
+        commands.append((f"ALTER TABLE dados_historicos DETACH PARTITION {default}", None))
+    
+    commands.extend(
+        (f"CREATE TABLE {get_partition_name(f't_{ticker}')} "
+         f"PARTITION OF dados_historicos FOR VALUES IN (%s)", (ticker,))
+        for ticker in missing
     )
+    
+    if has_default:
+        commands.extend([
+            (f"INSERT INTO dados_historicos SELECT * FROM {default} WHERE ticker = ANY(%s)", (missing,)),
+            (f"DELETE FROM {default} WHERE ticker = ANY(%s)", (missing,)),
+            (f"ALTER TABLE dados_historicos ATTACH PARTITION {default} DEFAULT", None),
+        ])
+    
+    return missing, commands
+
+def create_ticker_partitions(conn, tickers):
+    """Cria as partições por ticker que faltam em dados_historicos (layout list)
+    
+    Linhas desses tickers que já estejam na partição padrão impediriam o
+    CREATE ... PARTITION OF: a partição padrão é destacada, as novas são
+    criadas, as linhas migram pela tabela pai e a padrão é anexada de novo,
+    tudo em uma transação. Retorna o número de partições criadas.
+    """
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'dados_historicos'::regclass
+        """)
+        existing = {row[0] for row in cursor.fetchall()}
+        missing, commands = build_ticker_partition_commands(tickers, existing)
+        
+        if not missing:
+            conn.rollback()
+            return 0
+        
+        moved = 0
+        for command, params in commands:
+            cursor.execute(command, params)
+            if command.startswith('INSERT'):
+                moved = cursor.rowcount
+        
+        conn.commit()
+        print(f"  OK: {len(missing)} particoes por ticker criadas ({moved} linhas movidas da particao padrao)")
+        return len(missing)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def create_partitions(conn, layout, tickers=None):
+    """Cria as partições de dados_historicos (por ano ou por ticker)"""
+    if layout == 'heap':
+        return
+    
+    cursor = conn.cursor()
+    
+    try:
+        if layout == 'range':
+            start_year = int(os.getenv('PARTITION_START_YEAR', 2000))
+            end_year = int(os.getenv('PARTITION_END_YEAR', date.today().year + 1))
+            
+            for year in range(start_year, end_year + 1):
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {get_partition_name(f'y{year}')} "
+                    f"PARTITION OF dados_historicos FOR VALUES FROM (%s) TO (%s)",
+                    (date(year, 1, 1), date(year + 1, 1, 1))
+                )
+            print(f"  OK: {end_year - start_year + 1} particoes anuais ({start_year}-{end_year})")
+        else:
+            if tickers is None:
+                tickers = load_partition_tickers()
+            
+            create_ticker_partitions(conn, tickers)
+        
+        # Partição padrão para datas/tickers fora das faixas conhecidas
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {get_partition_name('default')} "
+            f"PARTITION OF dados_historicos DEFAULT"
+        )
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
 
-def create_database_schema(conn):
-    """Cria todas as tabelas necessárias"""
+def add_constraints(conn, layout=None, tables=None):
+    """Adiciona as constraints que ainda não existem (idempotente)"""
+    if layout is None:
+        layout = get_schema_layout()
+    
+    cursor = conn.cursor()
+    added = 0
+    
+    try:
+        for table, name, definition in get_constraint_definitions(layout):
+            if tables is not None and table not in tables:
+                continue
+            
+            cursor.execute(
+                "SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s",
+                (table, name)
+            )
+            if cursor.fetchone():
+                continue
+            
+            if definition.startswith('CHECK'):
+                # CHECK entra como NOT VALID e é validada em seguida, sem
+                # reescrever a tabela
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID")
+                cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+            else:
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+            added += 1
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    
+    return added
+
+def create_indexes(conn, layout=None):
+    """Cria os índices (executar após a carga nos layouts particionados)"""
+    if layout is None:
+        layout = get_schema_layout()
+    
+    cursor = conn.cursor()
+    index_commands = get_index_commands(layout)
+    
+    try:
+        print("Criando índices...")
+        for i, command in enumerate(index_commands, 1):
+            cursor.execute(command)
+            print(f"  OK: Indice {i}/{len(index_commands)} criado")
+        
+        # Atualizar estatísticas para o planner usar os novos índices
+        cursor.execute("ANALYZE dados_historicos")
+        
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"ERRO: Erro ao criar indices: {e}")
+        raise
+    finally:
+        cursor.close()
+
+def build_table_constraints_and_indexes(table, layout):
+    """Adiciona constraints e índices de uma tabela em conexão própria"""
+    conn = get_postgres_connection()
+    cursor = conn.cursor()
+    
+    try:
+        # Ordenação em memória e workers paralelos na construção de cada índice
+        cursor.execute("SET maintenance_work_mem = %s", (os.getenv('BULK_MAINTENANCE_WORK_MEM', '512MB'),))
+        cursor.execute("SET max_parallel_maintenance_workers = %s",
+                       (int(os.getenv('BULK_PARALLEL_WORKERS', 4)),))
+        
+        start = time.time()
+        added = add_constraints(conn, layout, [table])
+        
+        index_commands = [c for c in get_index_commands(layout) if f" ON {table}" in c]
+        for command in index_commands:
+            cursor.execute(command)
+        
+        cursor.execute(f"ANALYZE {table}")
+        conn.commit()
+        
+        return table, added, len(index_commands), time.time() - start
+    finally:
+        cursor.close()
+        conn.close()
+
+def build_constraints_and_indexes(layout=None, max_workers=None):
+    """Constrói constraints e índices após a carga, uma tabela por thread
+    
+    CREATE INDEX em tabelas diferentes roda em paralelo; dentro de cada
+    tabela o PostgreSQL ainda usa max_parallel_maintenance_workers.
+    """
+    if layout is None:
+        layout = get_schema_layout()
+    
+    tables = list(dict.fromkeys(table for table, _, _ in get_constraint_definitions(layout)))
+    if max_workers is None:
+        max_workers = int(os.getenv('BULK_INDEX_THREADS', len(tables)))
+    
+    print(f"Construindo constraints e indices ({max_workers} threads)...")
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(build_table_constraints_and_indexes, table, layout)
+                   for table in tables]
+        
+        for future in as_completed(futures):
+            table, added, indexes, elapsed = future.result()
+            print(f"  OK: {table}: {added} constraints, {indexes} indices em {elapsed:.2f}s")
+
+def create_database_schema(conn, layout=None, with_indexes=None, tickers=None,
+                           with_constraints=None):
+    """Cria todas as tabelas necessárias
+    
+    Nos layouts particionados os índices não são criados aqui por padrão:
+    devem ser construídos após a carga com create_indexes(). No modo bulk
+    as tabelas ficam sem constraints e índices até build_constraints_and_indexes().
+    """
+    if layout is None:
+        layout = get_schema_layout()
+    if with_constraints is None:
+        with_constraints = not is_bulk_load()
+    if with_indexes is None:
+        with_indexes = layout == 'heap' and with_constraints
+    
     cursor = conn.cursor()
     
     # SQL para criar as tabelas
@@ -30,8 +393,8 @@ def create_database_schema(conn):
         # Tabela de ativos
         """
         CREATE TABLE IF NOT EXISTS ativos (
-            id SERIAL PRIMARY KEY,
-            ticker VARCHAR(20) UNIQUE NOT NULL,
+            id SERIAL,
+            ticker VARCHAR(20) NOT NULL,
             nome VARCHAR(255) NOT NULL,
             preco_atual DECIMAL(15,8),
             data_atualizacao TIMESTAMP WITH TIME ZONE,
@@ -46,33 +409,12 @@ def create_database_schema(conn):
         """,
         
         # Tabela de dados históricos
-        """
-        CREATE TABLE IF NOT EXISTS dados_historicos (
-            id SERIAL PRIMARY KEY,
-            ticker VARCHAR(20) NOT NULL,
-            nome_ativo VARCHAR(255),
-            data DATE NOT NULL,
-            abertura DECIMAL(15,8),
-            maxima DECIMAL(15,8),
-            minima DECIMAL(15,8),
-            fechamento DECIMAL(15,8),
-            fechamento_ajustado DECIMAL(15,8),
-            volume BIGINT,
-            retorno_diario DECIMAL(15,8),
-            mm20 DECIMAL(15,8),
-            bb2s DECIMAL(15,8),
-            bb2i DECIMAL(15,8),
-            pico DECIMAL(15,8),
-            drawdown DECIMAL(15,8),
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(ticker, data)
-        )
-        """,
+        get_dados_historicos_ddl(layout),
         
         # Tabela de cestas
         """
         CREATE TABLE IF NOT EXISTS cestas (
-            id SERIAL PRIMARY KEY,
+            id SERIAL,
             nome VARCHAR(255) NOT NULL,
             descricao TEXT,
             ativos JSONB NOT NULL,
@@ -84,8 +426,8 @@ def create_database_schema(conn):
         # Tabela de transações
         """
         CREATE TABLE IF NOT EXISTS transacoes (
-            id SERIAL PRIMARY KEY,
-            type VARCHAR(10) NOT NULL CHECK (type IN ('buy', 'sell')),
+            id SERIAL,
+            type VARCHAR(10) NOT NULL,
             ativo_id INTEGER,
             asset VARCHAR(50),
             quantity DECIMAL(15,8) NOT NULL,
@@ -98,7 +440,7 @@ def create_database_schema(conn):
         # Tabela de fundos de investimento
         """
         CREATE TABLE IF NOT EXISTS investment_funds (
-            id SERIAL PRIMARY KEY,
+            id SERIAL,
             name VARCHAR(255) NOT NULL,
             initial_investment DECIMAL(15,2) NOT NULL,
             current_value DECIMAL(15,2) NOT NULL,
@@ -112,22 +454,26 @@ def create_database_schema(conn):
         # Tabela de saldo em caixa
         """
         CREATE TABLE IF NOT EXISTS cash_balance (
-            id SERIAL PRIMARY KEY,
+            id SERIAL,
             value DECIMAL(15,2) NOT NULL DEFAULT 0.00,
             last_update TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
         )
+        """,
+        
+        # Tabela de controle da carga (watermark por ticker). Fica fora do
+        # modo bulk: é atualizada com ON CONFLICT logo após cada carga
+        """
+        CREATE TABLE IF NOT EXISTS controle_carga (
+            ticker VARCHAR(20) PRIMARY KEY,
+            data_min DATE,
+            data_max DATE,
+            versao INTEGER NOT NULL DEFAULT 0,
+            pendente_desde DATE,
+            carregado_em TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            analytics_atualizado_em TIMESTAMP WITH TIME ZONE,
+            alinhado_em TIMESTAMP WITH TIME ZONE
+        )
         """
-    ]
-    
-    # Criar índices
-    index_commands = [
-        "CREATE INDEX IF NOT EXISTS idx_dados_historicos_ticker ON dados_historicos(ticker)",
-        "CREATE INDEX IF NOT EXISTS idx_dados_historicos_data ON dados_historicos(data)",
-        "CREATE INDEX IF NOT EXISTS idx_dados_historicos_ticker_data ON dados_historicos(ticker, data)",
-        "CREATE INDEX IF NOT EXISTS idx_ativos_ticker ON ativos(ticker)",
-        "CREATE INDEX IF NOT EXISTS idx_transacoes_ativo_id ON transacoes(ativo_id)",
-        "CREATE INDEX IF NOT EXISTS idx_transacoes_asset ON transacoes(asset)",
-        "CREATE INDEX IF NOT EXISTS idx_transacoes_date ON transacoes(date)"
     ]
     
     try:
@@ -136,12 +482,24 @@ def create_database_schema(conn):
             cursor.execute(command)
             print(f"  OK: Tabela {i}/{len(sql_commands)} criada")
         
-        print("\nCriando índices...")
-        for i, command in enumerate(index_commands, 1):
-            cursor.execute(command)
-            print(f"  OK: Indice {i}/{len(index_commands)} criado")
-        
         conn.commit()
+        
+        if layout != 'heap':
+            print(f"\nCriando particoes ({layout})...")
+            create_partitions(conn, layout, tickers)
+        
+        if with_constraints:
+            added = add_constraints(conn, layout)
+            print(f"\nOK: {added} constraints adicionadas")
+        else:
+            print("\nAVISO: Constraints adiadas para depois da carga (modo bulk)")
+        
+        if with_indexes:
+            print()
+            create_indexes(conn, layout)
+        else:
+            print("\nAVISO: Indices adiados para depois da carga (python migrate.py indexes)")
+        
         print("\nOK: Schema criado com sucesso!")
         
     except Exception as e:
@@ -154,14 +512,15 @@ def create_database_schema(conn):
 def main():
     """Função principal"""
     try:
-        print("Iniciando criacao do schema PostgreSQL...")
+        layout = get_schema_layout()
+        print(f"Iniciando criacao do schema PostgreSQL (layout: {layout})...")
         
         # Conectar ao PostgreSQL
         conn = get_postgres_connection()
         print("OK: Conectado ao PostgreSQL")
         
         # Criar schema
-        create_database_schema(conn)
+        create_database_schema(conn, layout)
         
         conn.close()
         print("OK: Migration de schema concluida!")
@@ -172,5 +531,21 @@ def main():
     
     return 0
 
+def indexes_main():
+    """Cria constraints e índices após a carga (modo bulk/layouts particionados)"""
+    try:
+        layout = get_schema_layout()
+        print(f"Iniciando criacao de constraints e indices (layout: {layout})...")
+        
+        build_constraints_and_indexes(layout)
+        
+        print("OK: Constraints e indices criados!")
+        
+    except Exception as e:
+        print(f"ERRO: Erro ao criar indices: {e}")
+        return 1
+    
+    return 0
+
 if __name__ == "__main__":
     exit(main())
\ No newline at end of file
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Acesso de leitura a dados_historicos para as análises em lote
+
+Leituras por ticker e intervalo de datas voltam como arrays NumPy, via
+um pool de conexões e um cache LRU local limitado em bytes. O cache é
+invalidado pelo watermark da migração: cada entrada guarda a versao do
+ticker em controle_carga, e uma nova carga do ticker descarta as entradas
+antigas na próxima consulta.
+
+Também é a fonte única da conexão com o PostgreSQL local para os demais
+scripts de análise (get_connection_params, get_postgres_connection); por
+isso NumPy e pandas só são importados nas leituras.
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.pool
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Colunas numéricas que podem ser lidas por intervalo
+RANGE_COLUMNS = ['abertura', 'maxima', 'minima', 'fechamento', 'fechamento_ajustado',
+                 'volume', 'retorno_diario']
+
+# Latências guardadas (por tipo) para as estatísticas
+LATENCY_SAMPLES = 10000
+
+def get_connection_params(prefix=''):
+    """Parâmetros de conexão do PostgreSQL local
+    
+    Com prefix (ex.: 'STAGING_'), lê {prefix}POSTGRES_* e usa as POSTGRES_*
+    como padrão de cada variável ausente.
+    """
+    defaults = dict(host=('HOST', 'localhost'), port=('PORT', '5432'), database=('DB', 'paridaderisco'),
+                    user=('USER', 'postgres'), password=('PASSWORD', 'postgres'))
+    return {
+        param: os.getenv(f'{prefix}POSTGRES_{name}', os.getenv(f'POSTGRES_{name}', default))
+        for param, (name, default) in defaults.items()
+    }
+
+def get_postgres_connection():
+    """Cria conexão com PostgreSQL local"""
+    return psycopg2.connect(**get_connection_params())
+
+def get_pool_size():
+    """Conexões mínimas/máximas do pool (DATA_POOL_MIN, DATA_POOL_MAX)"""
+    return int(os.getenv('DATA_POOL_MIN', 1)), int(os.getenv('DATA_POOL_MAX', 8))
+
+def get_cache_bytes():
+    """Tamanho máximo do cache em bytes (DATA_CACHE_MB)"""
+    return int(float(os.getenv('DATA_CACHE_MB', 256)) * 1024 * 1024)
+
+def get_version_ttl():
+    """Segundos entre releituras das versões de controle_carga (DATA_VERSION_TTL)"""
+    return float(os.getenv('DATA_VERSION_TTL', 5))
+
+def percentile_ms(samples, percentile):
+    """Percentil de uma lista de latências (s) em ms, ou None se vazia"""
+    if not samples:
+        return None
+    
+    import numpy as np
+    return round(float(np.percentile(np.fromiter(samples, dtype=np.float64), percentile)) * 1000, 3)
+
+class DataAccess:
+    """Leituras de dados_historicos por ticker e intervalo, com cache LRU
+    
+    Seguro para uso em threads: o pool entrega uma conexão por leitura (com
+    mais threads que conexões, as excedentes esperam) e o cache é protegido
+    por um lock. pool aceita um pool já criado (padrão: ThreadedConnectionPool
+    com get_connection_params).
+    """
+    
+    def __init__(self, max_bytes=None, version_ttl=None, min_connections=None, max_connections=None,
+                 pool=None):
+        default_min, default_max = get_pool_size()
+        max_connections = max_connections or default_max
+        self.pool = pool or psycopg2.pool.ThreadedConnectionPool(
+            min_connections or default_min, max_connections, **get_connection_params())
+        # getconn levanta PoolError além de maxconn em vez de bloquear
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self.max_bytes = get_cache_bytes() if max_bytes is None else max_bytes
+        self.version_ttl = get_version_ttl() if version_ttl is None else version_ttl
+        
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._versions = {}
+        self._versions_checked = None
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self._latencies = {'hit': deque(maxlen=LATENCY_SAMPLES), 'miss': deque(maxlen=LATENCY_SAMPLES)}
+    
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão do pool, esperando uma livre (sem transação aberta na devolução)"""
+        with self._slots:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+            finally:
+                conn.rollback()
+                self.pool.putconn(conn)
+    
+    def close(self):
+        """Fecha todas as conexões do pool"""
+        self.pool.closeall()
+    
+    def refresh_versions(self, force=False):
+        """Relê controle_carga.versao e descarta as entradas de tickers recarregados
+        
+        Sem force, a releitura acontece no máximo a cada version_ttl segundos.
+        """
+        now = time.monotonic()
+        if not force and self._versions_checked is not None \
+                and now - self._versions_checked < self.version_ttl:
+            return 0
+        
+        versions = self._read_versions()
+        
+        with self._lock:
+            changed = {ticker for ticker in versions.keys() | self._versions.keys()
+                       if versions.get(ticker) != self._versions.get(ticker)}
+            self._versions = versions
+            self._versions_checked = now
+            
+            stale = [key for key in self._entries if key[0] in changed]
+            for key in stale:
+                self._remove(key)
+            self._counters['invalidations'] += len(stale)
+        
+        return len(stale)
+    
+    def _read_versions(self):
+        """Lê {ticker: versao} de controle_carga"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT ticker, versao FROM controle_carga")
+            versions = dict(cursor.fetchall())
+            cursor.close()
+        return versions
+    
+    def read_range(self, ticker, start=None, end=None, columns=('fechamento',)):
+        """Lê um ticker entre start e end (inclusive) como {'data': ..., coluna: ...}
+        
+        Os arrays devolvidos são somente leitura (compartilhados com o cache).
+        """
+        columns = tuple(columns)
+        invalid = [c for c in columns if c not in RANGE_COLUMNS]
+        if invalid:
+            raise ValueError(f"Colunas invalidas: {', '.join(invalid)} (use: {', '.join(RANGE_COLUMNS)})")
+        
+        started = time.perf_counter()
+        self.refresh_versions()
+        key = (ticker, str(start) if start else None, str(end) if end else None, columns)
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, arrays, _ = entry
+                if version == self._versions.get(ticker):
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    self._latencies['hit'].append(time.perf_counter() - started)
+                    return arrays
+                
+                self._remove(key)
+                self._counters['invalidations'] += 1
+        
+        version, arrays = self._fetch(ticker, start, end, columns)
+        
+        with self._lock:
+            self._store(key, version, arrays)
+            self._counters['misses'] += 1
+            self._latencies['miss'].append(time.perf_counter() - started)
+        
+        return arrays
+    
+    def _fetch(self, ticker, start, end, columns):
+        """Busca no PostgreSQL (COPY) a versão do ticker e o intervalo pedido"""
+        conditions, params = ["ticker = %s"], [ticker]
+        if start:
+            conditions.append("data >= %s")
+            params.append(start)
+        if end:
+            conditions.append("data <= %s")
+            params.append(end)
+        
+        import numpy as np
+        import pandas as pd
+        
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # Versão lida antes dos dados: uma carga concorrente deixa a
+                # entrada com versão antiga, e ela é descartada depois
+                cursor.execute("SELECT versao FROM controle_carga WHERE ticker = %s", (ticker,))
+                row = cursor.fetchone()
+                version = row[0] if row else None
+                
+                query = cursor.mogrify(
+                    f"SELECT data, {', '.join(columns)} FROM dados_historicos "
+                    f"WHERE {' AND '.join(conditions)} ORDER BY data", params
+                ).decode()
+                buffer = io.BytesIO()
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer)
+            finally:
+                cursor.close()
+        
+        buffer.seek(0)
+        frame = pd.read_csv(buffer, dtype={c: 'float64' for c in columns}, parse_dates=['data'])
+        
+        arrays = {'data': frame['data'].to_numpy().astype('datetime64[D]')}
+        arrays.update({c: frame[c].to_numpy(dtype=np.float64) for c in columns})
+        for array in arrays.values():
+            array.setflags(write=False)
+        
+        return version, arrays
+    
+    def _store(self, key, version, arrays):
+        """Guarda uma entrada e remove as menos usadas até caber em max_bytes"""
+        size = sum(array.nbytes for array in arrays.values())
+        if size > self.max_bytes:
+            return
+        
+        if key in self._entries:
+            self._remove(key)
+        
+        self._entries[key] = (version, arrays, size)
+        self._bytes += size
+        
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters['evictions'] += 1
+    
+    def _remove(self, key):
+        """Remove uma entrada do cache"""
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+    
+    def clear(self):
+        """Esvazia o cache (as estatísticas são mantidas)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def stats(self):
+        """Taxa de acerto, tamanho do cache e latências (ms) de acertos e faltas"""
+        with self._lock:
+            counters = dict(self._counters)
+            lookups = counters['hits'] + counters['misses']
+            return dict(
+                counters,
+                taxa_acerto=round(counters['hits'] / lookups, 4) if lookups else None,
+                entradas=len(self._entries),
+                bytes=self._bytes,
+                latencia_acerto_p50_ms=percentile_ms(self._latencies['hit'], 50),
+                latencia_acerto_p95_ms=percentile_ms(self._latencies['hit'], 95),
+                latencia_falta_p50_ms=percentile_ms(self._latencies['miss'], 50),
+                latencia_falta_p95_ms=percentile_ms(self._latencies['miss'], 95),
+            )
+
+def main(argv=None):
+    """Função principal: repete uma leitura e exibe as estatísticas do cache"""
+    parser = argparse.ArgumentParser(description='Leitura de dados_historicos com cache local')
+    parser.add_argument('ticker', help='Ticker a ler')
+    parser.add_argument('--inicio', help='Data inicial (YYYY-MM-DD)')
+    parser.add_argument('--fim', help='Data final (YYYY-MM-DD)')
+    parser.add_argument('--colunas', nargs='+', default=['fechamento'], choices=RANGE_COLUMNS)
+    parser.add_argument('--repeat', type=int, default=10, help='Leituras repetidas')
+    args = parser.parse_args(argv if argv is not None else [])
+    
+    try:
+        data = DataAccess()
+        print("OK: Pool de conexoes criado")
+        
+        for _ in range(args.repeat):
+            arrays = data.read_range(args.ticker, args.inicio, args.fim, args.colunas)
+        
+        dates = arrays['data']
+        period = f"{dates[0]} a {dates[-1]}" if len(dates) else "sem dados"
+        print(f"OK: {args.ticker}: {len(dates)} linhas ({period})")
+        for name, value in data.stats().items():
+            print(f"   {name}: {value}")
+        
+        data.close()
+    
+    except Exception as e:
+        print(f"ERRO: Erro na leitura: {e}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
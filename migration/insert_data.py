@@ -4,26 +4,23 @@ Script para inserir dados extraídos no PostgreSQL local
 """
 
 import os
+import io
+import csv
 import json
+import time
+import queue
 import psycopg2
 import psycopg2.extras
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from tqdm import tqdm
 
+from data_access import get_connection_params, get_postgres_connection
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
-def get_postgres_connection():
-    """Cria conexão com PostgreSQL local"""
-    return psycopg2.connect(
-        host=os.getenv('POSTGRES_HOST', 'localhost'),
-        port=os.getenv('POSTGRES_PORT', '5432'),
-        database=os.getenv('POSTGRES_DB', 'paridaderisco'),
-        user=os.getenv('POSTGRES_USER', 'postgres'),
-        password=os.getenv('POSTGRES_PASSWORD', 'postgres')
-    )
-
 def load_json_data(table_name, data_dir="migration/data"):
     """Carrega dados JSON de uma tabela"""
     filename = f"{data_dir}/{table_name}.json"
@@ -141,6 +138,322 @@ def insert_table_data(conn, table_name, data):
     finally:
         cursor.close()
 
+def format_copy_value(value):
+    """Converte um valor Python para o formato CSV do COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def copy_records(cursor, target, columns, records, chunk_size=50000):
+    """Envia registros via COPY FROM STDIN em blocos"""
+    columns_str = ', '.join(columns)
+    
+    for i in range(0, len(records), chunk_size):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records[i:i+chunk_size]:
+            writer.writerow([format_copy_value(record.get(col)) for col in columns])
+        buffer.seek(0)
+        
+        cursor.copy_expert(
+            f"COPY {target} ({columns_str}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+
+def get_dedup_columns(table_name, columns):
+    """Retorna as colunas usadas para deduplicar no staging do modo bulk"""
+    conflict_columns = get_conflict_columns(table_name)
+    
+    if conflict_columns:
+        return conflict_columns
+    
+    return 'id' if 'id' in columns else None
+
+def build_staging_insert_query(table_name, staging, columns):
+    """Monta o INSERT ... SELECT que move o staging deduplicado para a tabela
+    
+    Mantém a primeira ocorrência de cada chave e ignora chaves já existentes,
+    como o ON CONFLICT DO NOTHING do modo padrão, mas sem depender de índices.
+    Com chave natural, o id também é deduplicado e comparado com a tabela,
+    para que a PRIMARY KEY construída depois da carga não falhe.
+    """
+    columns_str = ', '.join(columns)
+    dedup_columns = get_dedup_columns(table_name, columns)
+    
+    if not dedup_columns:
+        return f"INSERT INTO {table_name} ({columns_str}) SELECT {columns_str} FROM {staging}"
+    
+    keys = [col.strip() for col in dedup_columns.split(',')]
+    unique_keys = [keys]
+    if 'id' in columns and keys != ['id']:
+        unique_keys.append(['id'])
+    
+    # Uma passada de DISTINCT ON por chave única, sempre ficando com a
+    # primeira linha carregada
+    source = staging
+    for key in unique_keys:
+        key_str = ', '.join(key)
+        source = f"(SELECT DISTINCT ON ({key_str}) * FROM {source} s ORDER BY {key_str}, _load_order)"
+    
+    existing = ' AND '.join(
+        f"NOT EXISTS (SELECT 1 FROM {table_name} t WHERE ({', '.join(f't.{col}' for col in key)}) "
+        f"= ({', '.join(f's.{col}' for col in key)}))"
+        for key in unique_keys
+    )
+    query = f"""
+    INSERT INTO {table_name} ({columns_str})
+    SELECT {columns_str} FROM {source} s
+    WHERE {existing}
+    """
+    # Gravar em ordem cronológica mantém data correlacionada com a
+    # posição física (útil para o BRIN e para o planner)
+    if table_name == 'dados_historicos':
+        query += " ORDER BY data, ticker"
+    
+    return query
+
+def load_through_staging(cursor, table_name, columns, copy_into):
+    """Preenche um staging UNLOGGED com copy_into(staging) e move o conteúdo
+    deduplicado para a tabela; retorna a quantidade inserida"""
+    staging = f"{table_name}_staging"
+    
+    cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    cursor.execute(f"CREATE UNLOGGED TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS)")
+    cursor.execute(f"ALTER TABLE {staging} ADD COLUMN _load_order BIGSERIAL")
+    
+    copy_into(staging)
+    
+    cursor.execute(build_staging_insert_query(table_name, staging, columns))
+    inserted_count = cursor.rowcount
+    
+    cursor.execute(f"DROP TABLE {staging}")
+    
+    if 'id' in columns:
+        reset_serial_sequence(cursor, table_name)
+    
+    return inserted_count
+
+def bulk_load_table(conn, table_name, data):
+    """Carrega uma tabela sem índices via staging UNLOGGED + COPY
+    
+    O staging é deduplicado pela chave natural (ou id) e comparado com o
+    conteúdo já existente, de modo que a construção posterior das
+    constraints UNIQUE/PRIMARY KEY não falhe.
+    """
+    if not data:
+        print(f"AVISO: Nenhum dado para inserir na tabela {table_name}")
+        return
+    
+    print(f"Carregando {len(data)} registros na tabela '{table_name}' (bulk)...")
+    
+    cursor = conn.cursor()
+    
+    try:
+        prepared_data = prepare_data_for_postgres(data, table_name)
+        columns = list(prepared_data[0].keys())
+        
+        inserted_count = load_through_staging(
+            cursor, table_name, columns,
+            lambda staging: copy_records(cursor, staging, columns, prepared_data)
+        )
+        conn.commit()
+        
+        discarded = len(prepared_data) - inserted_count
+        print(f"OK: {inserted_count} registros inseridos em '{table_name}' "
+              f"({discarded} duplicados descartados)")
+        
+    except Exception as e:
+        conn.rollback()
+        print(f"ERRO: Erro ao carregar dados em {table_name}: {e}")
+        raise
+    finally:
+        cursor.close()
+
+def ensure_ticker_partitions(conn, tickers):
+    """No layout list, cria as partições dos tickers antes de carregar dados_historicos"""
+    from create_schema import get_schema_layout, create_ticker_partitions
+    
+    if get_schema_layout() != 'list':
+        return 0
+    
+    return create_ticker_partitions(conn, tickers)
+
+def compute_watermark_ranges(data):
+    """Retorna {ticker: [menor data, maior data]} dos registros carregados"""
+    ranges = {}
+    for record in data:
+        ticker, day = record.get('ticker'), record.get('data')
+        if not ticker or not day:
+            continue
+        day = str(day)[:10]
+        current = ranges.get(ticker)
+        if current is None:
+            ranges[ticker] = [day, day]
+        else:
+            current[0] = min(current[0], day)
+            current[1] = max(current[1], day)
+    
+    return ranges
+
+def update_load_watermarks(conn, data, ranges=None):
+    """Registra em controle_carga os tickers e datas tocados pela carga
+    
+    pendente_desde guarda a menor data carregada desde o último refresh
+    das tabelas de resumo; versao é incrementada a cada carga do ticker.
+    ranges já calculados (compute_watermark_ranges) dispensam data.
+    """
+    if ranges is None:
+        ranges = compute_watermark_ranges(data)
+    
+    if not ranges:
+        return 0
+    
+    cursor = conn.cursor()
+    
+    try:
+        write_load_watermarks(cursor, ranges)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    
+    print(f"OK: Watermark atualizado para {len(ranges)} tickers")
+    return len(ranges)
+
+def write_load_watermarks(cursor, ranges):
+    """Upsert de controle_carga na transação do cursor (sem commit)"""
+    psycopg2.extras.execute_values(cursor, """
+        INSERT INTO controle_carga (ticker, data_min, data_max, versao, pendente_desde, carregado_em)
+        VALUES %s
+        ON CONFLICT (ticker) DO UPDATE SET
+            data_min = LEAST(controle_carga.data_min, EXCLUDED.data_min),
+            data_max = GREATEST(controle_carga.data_max, EXCLUDED.data_max),
+            versao = controle_carga.versao + 1,
+            pendente_desde = LEAST(controle_carga.pendente_desde, EXCLUDED.pendente_desde),
+            carregado_em = EXCLUDED.carregado_em
+    """, [(ticker, first, last, 1, first, datetime.now().astimezone())
+          for ticker, (first, last) in ranges.items()])
+
+def get_table_columns(cursor, table_name):
+    """Retorna as colunas existentes na tabela de destino"""
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+    """, (table_name,))
+    return {row[0] for row in cursor.fetchall()}
+
+def build_sequence_reset_query(table_name, column='id'):
+    """SQL que ajusta a sequence SERIAL ao maior id presente (nada faz sem sequence)"""
+    return (f"SELECT setval(pg_get_serial_sequence('{table_name}', '{column}'), "
+            f"COALESCE(MAX({column}), 1), MAX({column}) IS NOT NULL) FROM {table_name}")
+
+def reset_serial_sequence(cursor, table_name, column='id'):
+    """Ajusta a sequence SERIAL ao maior id presente (ids vindos da origem)"""
+    cursor.execute(build_sequence_reset_query(table_name, column))
+
+def build_upsert_query(table_name, columns, key_columns):
+    """Monta o INSERT ... ON CONFLICT da carga idempotente; retorna (query, chaves)
+    
+    Com chave natural o id da linha existente é preservado: fica fora do SET
+    e da comparação, para uma origem renumerada não reescrever chaves primárias.
+    """
+    keys = [col.strip() for col in key_columns.split(',')]
+    update_columns = [col for col in columns if col not in keys and col != 'id']
+    columns_str = ', '.join(columns)
+    
+    if update_columns:
+        set_clause = ', '.join(f"{col} = EXCLUDED.{col}" for col in update_columns)
+        current_row = ', '.join(f"{table_name}.{col}" for col in update_columns)
+        incoming_row = ', '.join(f"EXCLUDED.{col}" for col in update_columns)
+        conflict_action = f"""DO UPDATE SET {set_clause}
+        WHERE ({current_row}) IS DISTINCT FROM ({incoming_row})"""
+    else:
+        conflict_action = "DO NOTHING"
+    
+    # xmax = 0 identifica linhas recém-inseridas (vs. atualizadas)
+    query = f"""
+    INSERT INTO {table_name} ({columns_str})
+    VALUES %s
+    ON CONFLICT ({key_columns}) {conflict_action}
+    RETURNING (xmax = 0), {', '.join(keys)}
+    """
+    
+    return query, keys
+
+def upsert_table_data(conn, table_name, data):
+    """Carga idempotente: insere ou atualiza por chave, só quando o conteúdo mudou
+    
+    A chave é a natural (get_conflict_columns) ou o id da origem. Linhas
+    idênticas às existentes não são reescritas, então reexecutar a carga
+    sem mudanças na origem não grava nada. Retorna as chaves das linhas
+    inseridas ou atualizadas.
+    """
+    if not data:
+        print(f"AVISO: Nenhum dado para inserir na tabela {table_name}")
+        return []
+    
+    print(f"Sincronizando {len(data)} registros na tabela '{table_name}' (idempotente)...")
+    
+    cursor = conn.cursor()
+    
+    try:
+        prepared_data = prepare_data_for_postgres(data, table_name)
+        
+        target_columns = get_table_columns(cursor, table_name)
+        columns = [col for col in prepared_data[0] if col in target_columns]
+        ignored = [col for col in prepared_data[0] if col not in target_columns]
+        if ignored:
+            print(f"AVISO: Colunas ignoradas em '{table_name}' (ausentes no destino): {', '.join(ignored)}")
+        
+        key_columns = get_dedup_columns(table_name, columns)
+        if not key_columns:
+            print(f"AVISO: '{table_name}' sem chave natural nem id, usando insercao simples")
+            insert_table_data(conn, table_name, data)
+            return []
+        
+        query, keys = build_upsert_query(table_name, columns, key_columns)
+        
+        batch_size = int(os.getenv('BATCH_SIZE', 1000))
+        inserted_count = 0
+        changed = []
+        
+        for i in tqdm(range(0, len(prepared_data), batch_size), desc=f"Sincronizando {table_name}"):
+            values = [
+                tuple(psycopg2.extras.Json(value) if isinstance(value, (dict, list)) else value
+                      for value in (record.get(col) for col in columns))
+                for record in prepared_data[i:i+batch_size]
+            ]
+            
+            rows = psycopg2.extras.execute_values(cursor, query, values, page_size=batch_size, fetch=True)
+            
+            for row in rows:
+                inserted_count += row[0]
+                changed.append(dict(zip(keys, row[1:])))
+        
+        # Ids preservados da origem não avançam a sequence SERIAL
+        if 'id' in columns:
+            reset_serial_sequence(cursor, table_name)
+        
+        conn.commit()
+        
+        updated_count = len(changed) - inserted_count
+        print(f"OK: '{table_name}': {inserted_count} inseridos, {updated_count} atualizados, "
+              f"{len(prepared_data) - len(changed)} inalterados")
+        return changed
+        
+    except Exception as e:
+        conn.rollback()
+        print(f"ERRO: Erro ao sincronizar dados em {table_name}: {e}")
+        raise
+    finally:
+        cursor.close()
+
 def get_conflict_columns(table_name):
     """Retorna colunas para ON CONFLICT baseado na tabela"""
     conflict_mapping = {
@@ -154,6 +467,215 @@ def get_conflict_columns(table_name):
     
     return conflict_mapping.get(table_name)
 
+def get_target_configs(names=None):
+    """Destinos da carga em leque (INSERT_TARGETS): [(nome, parâmetros de conexão)]
+    
+    Cada nome lê {NOME}_POSTGRES_HOST/PORT/DB/USER/PASSWORD, usando as
+    variáveis POSTGRES_* como padrão; o nome 'local' usa só as POSTGRES_*.
+    """
+    if names is None:
+        names = os.getenv('INSERT_TARGETS', '').split(',')
+    names = [name.strip() for name in names if name.strip()]
+    
+    configs = []
+    for name in names:
+        prefix = '' if name.lower() == 'local' else name.upper().replace('-', '_') + '_'
+        configs.append((name, get_connection_params(prefix)))
+    
+    return configs
+
+def get_target_retries():
+    """Tentativas por tabela em cada destino (INSERT_RETRIES)"""
+    return max(1, int(os.getenv('INSERT_RETRIES', 3)))
+
+def render_copy_payload(table_name, data):
+    """Prepara os registros uma única vez e serializa o CSV do COPY em bytes"""
+    prepared_data = prepare_data_for_postgres(data, table_name)
+    columns = list(prepared_data[0].keys())
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in prepared_data:
+        writer.writerow([format_copy_value(record.get(col)) for col in columns])
+    
+    return columns, buffer.getvalue().encode('utf-8')
+
+class ProgressReader:
+    """Envolve o arquivo lido pelo COPY e avança a barra de progresso do destino"""
+    
+    def __init__(self, fileobj, progress):
+        self.fileobj = fileobj
+        self.progress = progress
+        self.bytes_read = 0
+    
+    def read(self, size=-1):
+        chunk = self.fileobj.read(size)
+        self.advance(len(chunk))
+        return chunk
+    
+    def readline(self, size=-1):
+        line = self.fileobj.readline(size)
+        self.advance(len(line))
+        return line
+    
+    def advance(self, count):
+        self.bytes_read += count
+        self.progress.update(count)
+    
+    def rewind(self):
+        """Desconta da barra os bytes de uma tentativa desfeita"""
+        self.advance(-self.bytes_read)
+
+def load_payload(conn, table_name, columns, payload, progress, ranges=None):
+    """Carrega um CSV já serializado num destino (staging + COPY, uma transação)
+    
+    Com ranges, o watermark de controle_carga entra na mesma transação: ou a
+    tabela e o watermark são gravados juntos, ou nenhum dos dois.
+    """
+    cursor = conn.cursor()
+    columns_str = ', '.join(columns)
+    reader = ProgressReader(io.BytesIO(payload), progress)
+    
+    try:
+        inserted_count = load_through_staging(
+            cursor, table_name, columns,
+            lambda staging: cursor.copy_expert(
+                f"COPY {staging} ({columns_str}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                reader
+            )
+        )
+        if ranges:
+            write_load_watermarks(cursor, ranges)
+        conn.commit()
+        return inserted_count
+        
+    except Exception:
+        reader.rewind()
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        if not cursor.closed:
+            cursor.close()
+
+def load_target(name, config, tasks, position, retries):
+    """Consome a fila de tabelas de um destino com conexão, COPY e retentativas próprias
+    
+    Uma falha fica isolada no destino: a tabela é registrada como erro e as
+    seguintes continuam (reconectando se a conexão caiu). Um destino que
+    recusa a primeira conexão é dado como inacessível: as tabelas restantes
+    são drenadas da fila e registradas com o mesmo erro, sem novas tentativas.
+    Retorna ({tabela: inseridos ou exceção}, segundos).
+    """
+    results = {}
+    conn = None
+    unreachable = None
+    start_time = time.time()
+    progress = tqdm(desc=name, unit='B', unit_scale=True, position=position, leave=True)
+    
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            table, columns, payload, ranges = task
+            
+            if unreachable is not None:
+                results[table] = unreachable
+                continue
+            
+            progress.set_postfix_str(table)
+            
+            if conn is None:
+                try:
+                    conn = psycopg2.connect(**config)
+                except psycopg2.OperationalError as e:
+                    unreachable = results[table] = e
+                    progress.write(f"ERRO: [{name}] destino inacessível, tabelas restantes ignoradas: {e}")
+                    continue
+            
+            for attempt in range(1, retries + 1):
+                try:
+                    if conn.closed:
+                        conn = psycopg2.connect(**config)
+                    
+                    if ranges is not None:
+                        ensure_ticker_partitions(conn, ranges)
+                    
+                    # Carga e watermark são uma transação: repetir após falha não duplica linhas
+                    results[table] = load_payload(conn, table, columns, payload, progress, ranges)
+                    break
+                    
+                except Exception as e:
+                    if attempt == retries:
+                        results[table] = e
+                        progress.write(f"ERRO: [{name}] {table}: {e}")
+                    else:
+                        progress.write(f"AVISO: [{name}] {table}: tentativa {attempt}/{retries} falhou: {e}")
+                        if isinstance(e, psycopg2.OperationalError) and conn is not None:
+                            conn.close()
+                        time.sleep(min(2 ** (attempt - 1), 30))
+    finally:
+        progress.close()
+        if conn is not None and not conn.closed:
+            conn.close()
+    
+    return results, time.time() - start_time
+
+def fan_out_insert(tables, targets, data_dir="migration/data", retries=None):
+    """Carrega uma única extração em vários destinos ao mesmo tempo
+    
+    Cada JSON é lido e serializado uma vez; o mesmo CSV é entregue à fila de
+    cada destino, que o consome em sua própria thread. As filas são curtas
+    para limitar a memória, então o tempo total acompanha o destino mais
+    lento. Retorna {destino: ({tabela: inseridos ou exceção}, segundos)}.
+    """
+    retries = retries or get_target_retries()
+    task_queues = [queue.Queue(maxsize=2) for _ in targets]
+    
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        futures = [
+            executor.submit(load_target, name, config, tasks, position, retries)
+            for position, ((name, config), tasks) in enumerate(zip(targets, task_queues))
+        ]
+        
+        try:
+            for table in tables:
+                data = load_json_data(table, data_dir)
+                if not data:
+                    print(f"AVISO: Nenhum dado para inserir na tabela '{table}'")
+                    continue
+                
+                columns, payload = render_copy_payload(table, data)
+                ranges = compute_watermark_ranges(data) if table == 'dados_historicos' else None
+                del data
+                
+                for tasks in task_queues:
+                    tasks.put((table, columns, payload, ranges))
+        finally:
+            for tasks in task_queues:
+                tasks.put(None)
+        
+        return {name: future.result() for (name, _), future in zip(targets, futures)}
+
+def print_fan_out_summary(results):
+    """Exibe o resultado de cada destino da carga em leque; retorna se todos concluíram"""
+    all_ok = True
+    
+    for name, (tables, elapsed) in results.items():
+        failed = {table: error for table, error in tables.items() if isinstance(error, Exception)}
+        inserted = sum(count for count in tables.values() if not isinstance(count, Exception))
+        
+        if failed:
+            all_ok = False
+            print(f"ERRO: [{name}] {len(failed)}/{len(tables)} tabelas falharam ({elapsed:.2f}s)")
+            for table, error in failed.items():
+                print(f"   {table}: {error}")
+        else:
+            print(f"OK: [{name}] {len(tables)} tabelas, {inserted} registros inseridos ({elapsed:.2f}s)")
+    
+    return all_ok
+
 def insert_all_data():
     """Insere dados de todas as tabelas"""
     tables = [
@@ -165,8 +687,34 @@ def insert_all_data():
         'cash_balance'
     ]
     
+    bulk_load = os.getenv('BULK_LOAD', 'false').strip().lower() == 'true'
+    idempotent_load = os.getenv('IDEMPOTENT_LOAD', 'false').strip().lower() == 'true'
+    
+    targets = get_target_configs()
+    if targets:
+        print(f"Iniciando carga em leque para {len(targets)} destinos: "
+              f"{', '.join(name for name, _ in targets)}")
+        if bulk_load or idempotent_load:
+            print("AVISO: BULK_LOAD/IDEMPOTENT_LOAD ignorados na carga em leque (staging + COPY)")
+        
+        start_time = time.time()
+        results = fan_out_insert(tables, targets)
+        
+        print()
+        all_ok = print_fan_out_summary(results)
+        print(f"   Tempo de carga: {time.time() - start_time:.2f}s")
+        return all_ok
+    
+    if bulk_load:
+        load_table, mode = bulk_load_table, ' (modo bulk)'
+    elif idempotent_load:
+        load_table, mode = upsert_table_data, ' (modo idempotente)'
+    else:
+        load_table, mode = insert_table_data, ''
+    
     try:
-        print("Iniciando insercao de dados no PostgreSQL...")
+        print(f"Iniciando insercao de dados no PostgreSQL{mode}...")
+        start_time = time.time()
         
         # Conectar ao PostgreSQL
         conn = get_postgres_connection()
@@ -181,8 +729,15 @@ def insert_all_data():
                 data = load_json_data(table)
                 
                 if data:
-                    insert_table_data(conn, table, data)
+                    if table == 'dados_historicos':
+                        ensure_ticker_partitions(conn, {r['ticker'] for r in data if r.get('ticker')})
+                    
+                    changed = load_table(conn, table, data)
                     success_count += 1
+                    
+                    # No modo idempotente só as linhas alteradas entram no watermark
+                    if table == 'dados_historicos':
+                        update_load_watermarks(conn, changed if idempotent_load and not bulk_load else data)
                 else:
                     print(f"AVISO: Nenhum dado para inserir na tabela '{table}'")
                     
@@ -194,6 +749,10 @@ def insert_all_data():
         
         print(f"\nOK: Insercao concluida!")
         print(f"   Tabelas processadas: {success_count}/{len(tables)}")
+        print(f"   Tempo de carga: {time.time() - start_time:.2f}s")
+        
+        if bulk_load:
+            print("AVISO: Constraints e indices ainda nao existem: python migrate.py indexes")
         
         return success_count > 0
         
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 """
 Script principal de migração do Supabase para PostgreSQL local
+
+Os módulos de cada passo (supabase, pandas, asyncpg...) só são
+importados quando o passo é executado, para manter rápido o startup
+de subcomandos simples como `schema` ou `verify`.
 """
 
 import os
 import sys
 import argparse
+import importlib
 import time
 from datetime import datetime
 from dotenv import load_dotenv
@@ -13,9 +18,38 @@ from dotenv import load_dotenv
 # Adicionar diretório migration ao path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from create_schema import main as create_schema_main
-from extract_data import main as extract_data_main  
-from insert_data import main as insert_data_main
+# Passos disponíveis: subcomando -> (título, "módulo:função")
+STEPS = {
+    'schema': ("Criação do Schema", "create_schema:main"),
+    'extract': ("Extração de Dados", "extract_data:main"),
+    'insert': ("Inserção de Dados", "insert_data:main"),
+    'indexes': ("Criação dos Índices", "create_schema:indexes_main"),
+    'quality': ("Varredura de Qualidade", "scan_quality:main"),
+    'align': ("Alinhamento das Séries", "align_series:main"),
+    'analytics': ("Atualização dos Resumos", "refresh_analytics:main"),
+    'verify': ("Verificação da Migração", "verify_migration:main"),
+}
+
+# Substitutos dos passos no motor assíncrono (--async)
+ASYNC_STEPS = {
+    'extract': "async_engine:extract_main",
+    'insert': "async_engine:insert_main",
+    'extract-insert': "async_engine:main",
+}
+
+# Passos que acessam o Supabase (os demais só precisam do PostgreSQL)
+SUPABASE_STEPS = {'extract', 'verify', 'all'}
+
+def load_step_function(target):
+    """Importa sob demanda a função de um passo ("módulo:função")"""
+    module_name, function_name = target.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+def get_step_target(step, use_async=False):
+    """Retorna o "módulo:função" de um passo, considerando o motor async"""
+    if use_async and step in ASYNC_STEPS:
+        return ASYNC_STEPS[step]
+    return STEPS[step][1]
 
 def print_banner():
     """Exibe banner da migração"""
@@ -25,19 +59,20 @@ def print_banner():
     print(f"Data: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 60)
 
-def check_environment():
-    """Verifica se todas as variáveis de ambiente necessárias estão definidas"""
+def check_environment(step='all'):
+    """Verifica se as variáveis de ambiente necessárias ao passo estão definidas"""
     print("Verificando configuracoes...")
     
     required_vars = [
-        'SUPABASE_URL',
-        'SUPABASE_KEY', 
         'POSTGRES_HOST',
         'POSTGRES_DB',
         'POSTGRES_USER',
         'POSTGRES_PASSWORD'
     ]
     
+    if step in SUPABASE_STEPS:
+        required_vars = ['SUPABASE_URL', 'SUPABASE_KEY'] + required_vars
+    
     missing_vars = []
     for var in required_vars:
         if not os.getenv(var):
@@ -52,12 +87,18 @@ def check_environment():
     return True
 
 def run_step(step_name, step_function, skip_on_failure=False):
-    """Executa um passo da migração com tratamento de erro"""
+    """Executa um passo da migração com tratamento de erro
+    
+    step_function pode ser a função ou o "módulo:função" a importar.
+    """
     print(f"\n{'='*20} {step_name.upper()} {'='*20}")
     
     start_time = time.time()
     
     try:
+        if isinstance(step_function, str):
+            step_function = load_step_function(step_function)
+        
         result = step_function()
         
         if result == 0:
@@ -76,22 +117,44 @@ def run_step(step_name, step_function, skip_on_failure=False):
     
     return True
 
-def full_migration():
+def full_migration(use_async=False):
     """Executa migração completa"""
     print_banner()
     
     # Verificar ambiente
-    if not check_environment():
+    if not check_environment('all'):
         return 1
     
+    from create_schema import get_schema_layout, is_bulk_load
+    
     # Criar diretório de dados
     os.makedirs('migration/data', exist_ok=True)
     
-    steps = [
-        ("Criação do Schema", create_schema_main),
-        ("Extração de Dados", extract_data_main),
-        ("Inserção de Dados", insert_data_main)
-    ]
+    if use_async:
+        # Extração e carga sobrepostas no motor assíncrono
+        steps = [
+            ("Criação do Schema", get_step_target('schema')),
+            ("Extração e Inserção (async)", ASYNC_STEPS['extract-insert'])
+        ]
+    else:
+        steps = [
+            ("Criação do Schema", get_step_target('schema')),
+            ("Extração de Dados", get_step_target('extract')),
+            ("Inserção de Dados", get_step_target('insert'))
+        ]
+    
+    # No modo bulk e nos layouts particionados constraints/índices são
+    # construídos só após a carga
+    if is_bulk_load() or get_schema_layout() != 'heap':
+        steps.append(("Criação dos Índices", get_step_target('indexes')))
+    
+    # Varredura de qualidade dos tickers carregados (antes do refresh, que
+    # limpa as pendências de controle_carga) e alinhamento (watermark próprio)
+    steps.append(("Varredura de Qualidade", get_step_target('quality')))
+    steps.append(("Alinhamento das Séries", get_step_target('align')))
+    
+    # Estágio final: tabelas de resumo só dos tickers/meses tocados pela carga
+    steps.append(("Atualização dos Resumos", get_step_target('analytics')))
     
     for step_name, step_function in steps:
         if not run_step(step_name, step_function):
@@ -109,35 +172,59 @@ def full_migration():
     
     return 0
 
-def main():
-    """Função principal com argumentos de linha de comando"""
+def build_parser():
+    """Parser da linha de comando (subcomando ou --step, por compatibilidade)"""
     parser = argparse.ArgumentParser(description='Migração Supabase → PostgreSQL')
-    parser.add_argument('--step', choices=['schema', 'extract', 'insert', 'all'], 
-                       default='all', help='Passo específico para executar')
+    parser.add_argument('command', nargs='?', choices=list(STEPS) + ['all'],
+                       help='Passo a executar (padrão: all)')
+    parser.add_argument('--step', choices=list(STEPS) + ['all'],
+                       help='Forma antiga de escolher o passo (equivale ao subcomando)')
     parser.add_argument('--skip-checks', action='store_true', 
                        help='Pular verificações de ambiente')
-    
-    args = parser.parse_args()
+    parser.add_argument('--bulk-load', action='store_true',
+                       help='Carga em massa: tabelas sem constraints/índices até o fim da carga')
+    parser.add_argument('--idempotent', action='store_true',
+                       help='Carga idempotente: upsert por chave natural ou id, só linhas alteradas')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                       help='Usar o motor assíncrono (httpx + asyncpg) na extração e inserção')
+    parser.add_argument('--targets',
+                       help='Carga em leque: destinos separados por vírgula (ex.: local,staging); '
+                            'cada nome usa {NOME}_POSTGRES_*')
+    return parser
+
+def main(argv=None):
+    """Função principal: despacha o subcomando (ou --step, por compatibilidade)"""
+    args = build_parser().parse_args(argv)
+    step = args.step or args.command or 'all'
+    
+    if args.bulk_load:
+        os.environ['BULK_LOAD'] = 'true'
+    if args.idempotent:
+        os.environ['IDEMPOTENT_LOAD'] = 'true'
+    if args.targets:
+        os.environ['INSERT_TARGETS'] = args.targets
+        if args.use_async:
+            print("AVISO: A carga em leque usa a insercao padrao; --async ignorado")
+            args.use_async = False
     
     # Carregar variáveis de ambiente
     load_dotenv()
     
-    if not args.skip_checks and not check_environment():
+    # O motor async carrega como o modo bulk (staging + COPY), sem upsert
+    if args.use_async and step in ('all', 'insert') \
+            and os.getenv('IDEMPOTENT_LOAD', 'false').strip().lower() == 'true':
+        print("ERRO: --async nao suporta a carga idempotente (--idempotent/IDEMPOTENT_LOAD)")
         return 1
     
-    if args.step == 'all':
-        return full_migration()
-    elif args.step == 'schema':
-        print_banner()
-        return run_step("Criação do Schema", create_schema_main)
-    elif args.step == 'extract':
-        print_banner()
-        return run_step("Extração de Dados", extract_data_main)
-    elif args.step == 'insert':
-        print_banner()
-        return run_step("Inserção de Dados", insert_data_main)
+    if not args.skip_checks and not check_environment(step):
+        return 1
     
-    return 0
+    if step == 'all':
+        return full_migration(args.use_async)
+    
+    print_banner()
+    title = STEPS[step][0]
+    return 0 if run_step(title, get_step_target(step, args.use_async)) else 1
 
 if __name__ == "__main__":
     exit(main())
\ No newline at end of file
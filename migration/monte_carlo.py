@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Simulação de Monte Carlo de aposentadoria para uma cesta
+
+Os retornos mensais conjuntos dos ativos vêm dos níveis de dados_historicos
+alinhados por align_series (taxas como o CDI capitalizadas em índice) e são
+amostrados por bootstrap em blocos de meses (preserva a correlação entre
+ativos e parte da autocorrelação) ou por uma normal multivariada dos
+log-retornos. A carteira é rebalanceada mensalmente para os pesos da cesta.
+
+Cada lote de caminhos é simulado com operações de array sobre todos os
+caminhos e meses de uma vez (patrimônio em forma fechada via cumprod).
+Os lotes podem rodar em processos separados; as sementes derivam de
+SeedSequence por lote, então o resultado não depende do número de workers.
+
+Os parâmetros seguem o modelo SimulacaoAposentadoria do app: aportes
+mensais constantes até a aposentadoria e saques corrigidos pela inflação
+depois dela. Valores nominais, antes de IR.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from data_access import get_postgres_connection
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Percentis das bandas de patrimônio
+PERCENTILES = [5, 10, 25, 50, 75, 90, 95]
+
+# Meses mínimos de histórico conjunto para a simulação
+MIN_HISTORY_MONTHS = 36
+
+METHODS = ['bootstrap', 'parametrico']
+
+def get_workers():
+    """Processos da simulação (MC_WORKERS, padrão: CPUs disponíveis)"""
+    return max(1, int(os.getenv('MC_WORKERS', os.cpu_count() or 1)))
+
+def get_chunk_paths():
+    """Caminhos por lote (MC_CHUNK_PATHS); fixa a partição das sementes"""
+    return max(1, int(os.getenv('MC_CHUNK_PATHS', 2000)))
+
+def load_basket_weights(conn, basket_name):
+    """Pesos normalizados {ticker: peso} de uma cesta"""
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("SELECT ativos FROM cestas WHERE nome = %s ORDER BY id LIMIT 1", (basket_name,))
+        row = cursor.fetchone()
+        conn.rollback()
+    finally:
+        cursor.close()
+    
+    if not row or not isinstance(row[0], dict) or not row[0]:
+        raise ValueError(f"Cesta '{basket_name}' nao encontrada ou sem pesos")
+    
+    weights = {ticker: float(weight) for ticker, weight in row[0].items() if float(weight) > 0}
+    total = sum(weights.values())
+    return {ticker: weight / total for ticker, weight in sorted(weights.items())}
+
+def compute_monthly_returns(dates, levels, tickers):
+    """Retornos mensais conjuntos (meses x tickers) de uma matriz de níveis diários
+    
+    Usa o último nível de cada mês e só os meses em que todos os tickers
+    têm retorno (período comum).
+    """
+    frame = pd.DataFrame(levels, index=pd.DatetimeIndex(dates), columns=list(tickers)).ffill()
+    monthly = frame.resample('ME').last().pct_change(fill_method=None).dropna(how='any')
+    return monthly.index.to_numpy().astype('datetime64[M]'), monthly.to_numpy(dtype=np.float64)
+
+def load_monthly_returns(conn, tickers):
+    """Retornos mensais conjuntos no período comum aos tickers
+    
+    Os níveis vêm de align_series.load_level_matrix: séries de taxa (CDI,
+    IPCA) entram capitalizadas em índice, não como a própria taxa.
+    """
+    from align_series import load_level_matrix
+    
+    months, returns = compute_monthly_returns(*load_level_matrix(conn, tickers), tickers)
+    
+    if len(months) < MIN_HISTORY_MONTHS:
+        raise ValueError(f"Historico conjunto insuficiente: {len(months)} meses "
+                         f"(minimo {MIN_HISTORY_MONTHS})")
+    
+    return months, returns
+
+def build_return_model(monthly_returns, weights, method='bootstrap', block_size=12):
+    """Modelo de amostragem dos retornos mensais da carteira
+    
+    bootstrap: blocos de meses históricos (retorno da carteira já agregado)
+    parametrico: normal multivariada dos log-retornos dos ativos
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    
+    if method == 'bootstrap':
+        return {
+            'metodo': method,
+            'retornos': monthly_returns @ weights,
+            'bloco': int(block_size),
+        }
+    
+    if method == 'parametrico':
+        log_returns = np.log1p(monthly_returns)
+        covariance = np.atleast_2d(np.cov(log_returns, rowvar=False))
+        # Jitter na diagonal para covariâncias semidefinidas (ativos colineares)
+        jitter = 1e-12 * np.eye(len(weights))
+        return {
+            'metodo': method,
+            'media': log_returns.mean(axis=0),
+            'cholesky': np.linalg.cholesky(covariance + jitter),
+            'pesos': weights,
+        }
+    
+    raise ValueError(f"Metodo invalido: {method} (use: {', '.join(METHODS)})")
+
+def build_cash_flows(plan):
+    """Fluxo mensal do plano: aportes (+) na acumulação, saques (-) na aposentadoria"""
+    accumulation_months = 12 * (plan['idade_aposentadoria'] - plan['idade_atual'])
+    total_months = accumulation_months + 12 * plan['periodo_usufruir']
+    month = np.arange(1, total_months + 1)
+    
+    inflation = plan.get('inflacao_anual', 0.0) / 100
+    withdrawal = plan['renda_anual'] / 12 * (1 + inflation) ** ((month - 1) / 12)
+    
+    return np.where(month <= accumulation_months, plan['aporte_mensal'], -withdrawal)
+
+def sample_bootstrap(rng, portfolio_returns, paths, months, block_size):
+    """Caminhos de retornos por bootstrap em blocos de meses consecutivos"""
+    block_size = max(1, min(block_size, len(portfolio_returns)))
+    blocks = -(-months // block_size)
+    starts = rng.integers(0, len(portfolio_returns) - block_size + 1, size=(paths, blocks))
+    index = (starts[:, :, None] + np.arange(block_size)).reshape(paths, -1)[:, :months]
+    return portfolio_returns[index]
+
+def sample_parametric(rng, mean, cholesky, weights, paths, months):
+    """Caminhos de retornos da carteira a partir de log-retornos normais correlacionados"""
+    normals = rng.standard_normal((paths, months, len(mean)))
+    return np.expm1(mean + normals @ cholesky.T) @ weights
+
+def simulate_chunk(task):
+    """Simula um lote de caminhos: (patrimônio anual, mês de esgotamento)
+    
+    W_t = W_{t-1}(1 + r_t) + f_t tem forma fechada G_t (W_0 + Σ f_k / G_k),
+    com G o crescimento acumulado; depois do esgotamento o patrimônio fica 0.
+    """
+    seed, paths, model, flows, initial_wealth = task
+    rng = np.random.default_rng(seed)
+    months = len(flows)
+    
+    if model['metodo'] == 'bootstrap':
+        returns = sample_bootstrap(rng, model['retornos'], paths, months, model['bloco'])
+    else:
+        returns = sample_parametric(rng, model['media'], model['cholesky'], model['pesos'], paths, months)
+    
+    growth = np.cumprod(1 + returns, axis=1)
+    wealth = growth * (initial_wealth + np.cumsum(flows / growth, axis=1))
+    
+    depleted = np.logical_or.accumulate(wealth < 0, axis=1)
+    wealth[depleted] = 0.0
+    
+    yearly = np.empty((paths, months // 12 + 1))
+    yearly[:, 0] = initial_wealth
+    yearly[:, 1:] = wealth[:, 11::12]
+    
+    ruin_month = np.where(depleted[:, -1], depleted.argmax(axis=1) + 1, 0)
+    return yearly, ruin_month
+
+def summarize_simulation(yearly, ruin_month, plan):
+    """Bandas de percentis por idade e estatísticas do plano"""
+    ages = plan['idade_atual'] + np.arange(yearly.shape[1])
+    bands = np.percentile(yearly, PERCENTILES, axis=0)
+    retirement_year = plan['idade_aposentadoria'] - plan['idade_atual']
+    failed = ruin_month > 0
+    
+    return {
+        'caminhos': int(len(yearly)),
+        'idades': ages.tolist(),
+        'percentis': {str(p): np.round(band, 2).tolist() for p, band in zip(PERCENTILES, bands)},
+        'patrimonio_aposentadoria': {str(p): round(float(band[retirement_year]), 2)
+                                     for p, band in zip(PERCENTILES, bands)},
+        'probabilidade_sucesso': round(float(1 - failed.mean()), 4),
+        'idade_esgotamento_mediana': (
+            round(float(plan['idade_atual'] + np.median(ruin_month[failed]) / 12), 1)
+            if failed.any() else None
+        ),
+    }
+
+def run_simulation(model, plan, paths=10000, seed=42, workers=None, chunk_paths=None):
+    """Executa a simulação em lotes (opcionalmente em processos) e resume"""
+    workers = workers or get_workers()
+    chunk_paths = chunk_paths or get_chunk_paths()
+    flows = build_cash_flows(plan)
+    
+    chunks = [chunk_paths] * (paths // chunk_paths)
+    if paths % chunk_paths:
+        chunks.append(paths % chunk_paths)
+    
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(s, size, model, flows, float(plan['patrimonio_inicial'])) for s, size in zip(seeds, chunks)]
+    
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            results = list(executor.map(simulate_chunk, tasks))
+    else:
+        results = [simulate_chunk(task) for task in tasks]
+    
+    yearly = np.concatenate([r[0] for r in results])
+    ruin_month = np.concatenate([r[1] for r in results])
+    return summarize_simulation(yearly, ruin_month, plan)
+
+def print_simulation(summary, every=5):
+    """Exibe as bandas de percentis a cada `every` anos"""
+    print(f"\nCaminhos: {summary['caminhos']} | "
+          f"Probabilidade de sucesso: {summary['probabilidade_sucesso'] * 100:.1f}%")
+    if summary['idade_esgotamento_mediana'] is not None:
+        print(f"Idade mediana de esgotamento (caminhos que falham): {summary['idade_esgotamento_mediana']}")
+    
+    shown = ['5', '25', '50', '75', '95']
+    print("-" * 80)
+    print(f"{'Idade':>6} " + " ".join(f"{'P' + p:>14}" for p in shown))
+    print("-" * 80)
+    for i, age in enumerate(summary['idades']):
+        if i % every == 0 or i == len(summary['idades']) - 1:
+            print(f"{age:>6} " + " ".join(f"{summary['percentis'][p][i]:>14,.0f}" for p in shown))
+    print("-" * 80)
+
+def main(argv=None):
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Simulacao de Monte Carlo de aposentadoria')
+    parser.add_argument('--cesta', required=True, help='Nome da cesta (pesos dos ativos)')
+    parser.add_argument('--idade-atual', type=int, required=True)
+    parser.add_argument('--idade-aposentadoria', type=int, required=True)
+    parser.add_argument('--periodo-usufruir', type=int, required=True, help='Anos de saques')
+    parser.add_argument('--patrimonio-inicial', type=float, default=0.0)
+    parser.add_argument('--aporte-mensal', type=float, default=0.0)
+    parser.add_argument('--renda-anual', type=float, required=True, help='Saque anual desejado (valor de hoje)')
+    parser.add_argument('--inflacao-anual', type=float, default=0.0, help='Inflacao anual em %% (ex.: 4.5)')
+    parser.add_argument('--metodo', choices=METHODS, default='bootstrap')
+    parser.add_argument('--bloco', type=int, default=12, help='Meses por bloco no bootstrap')
+    parser.add_argument('--caminhos', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, help='Processos (padrao: MC_WORKERS)')
+    parser.add_argument('--output', help='Salvar o resultado em JSON')
+    args = parser.parse_args(argv if argv is not None else [])
+    
+    plan = {
+        'idade_atual': args.idade_atual,
+        'idade_aposentadoria': args.idade_aposentadoria,
+        'periodo_usufruir': args.periodo_usufruir,
+        'patrimonio_inicial': args.patrimonio_inicial,
+        'aporte_mensal': args.aporte_mensal,
+        'renda_anual': args.renda_anual,
+        'inflacao_anual': args.inflacao_anual,
+    }
+    
+    try:
+        conn = get_postgres_connection()
+        print("OK: Conectado ao PostgreSQL")
+        
+        weights = load_basket_weights(conn, args.cesta)
+        months, monthly_returns = load_monthly_returns(conn, list(weights))
+        conn.close()
+        print(f"OK: {len(weights)} ativos, historico de {months[0]} a {months[-1]} ({len(months)} meses)")
+        
+        model = build_return_model(monthly_returns, list(weights.values()), args.metodo, args.bloco)
+        
+        start = time.time()
+        summary = run_simulation(model, plan, args.caminhos, args.seed, args.workers)
+        elapsed = time.time() - start
+        print(f"OK: {args.caminhos} caminhos em {elapsed:.2f}s ({args.caminhos / elapsed:,.0f} caminhos/s)")
+        
+        print_simulation(summary)
+        
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(dict(summary, plano=plan, pesos=weights, metodo=args.metodo),
+                          f, ensure_ascii=False, indent=2)
+            print(f"OK: Resultado salvo em {args.output}")
+    
+    except Exception as e:
+        print(f"ERRO: Erro na simulacao: {e}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
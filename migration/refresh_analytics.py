@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Script para criar e atualizar as tabelas de resumo (analytics)
+a partir de dados_historicos
+
+O refresh é incremental: só são recalculados os tickers e meses
+marcados como pendentes em controle_carga pela última carga.
+
+As séries de taxa (get_rate_tickers: CDI, IPCA...) guardam taxas em %, não
+níveis de preço: ficam fora das grades de retorno e da volatilidade (seus
+níveis capitalizados estão em dados_alinhados).
+"""
+
+import os
+import sys
+import time
+import argparse
+from dotenv import load_dotenv
+
+from data_access import get_postgres_connection
+from trading_calendar import get_rate_tickers
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Pregões por ano usados para anualizar a volatilidade
+TRADING_DAYS_PER_YEAR = 252
+
+def get_volatility_window():
+    """Janela (em pregões) da volatilidade móvel (ANALYTICS_VOL_WINDOW)"""
+    return int(os.getenv('ANALYTICS_VOL_WINDOW', 21))
+
+def create_analytics_tables(conn):
+    """Cria as tabelas de resumo"""
+    cursor = conn.cursor()
+    
+    sql_commands = [
+        # Último fechamento por ticker
+        """
+        CREATE TABLE IF NOT EXISTS resumo_ultimo_preco (
+            ticker VARCHAR(20) PRIMARY KEY,
+            data DATE NOT NULL,
+            fechamento DECIMAL(15,8),
+            fechamento_ajustado DECIMAL(15,8),
+            atualizado_em TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        
+        # Grade de retornos mensais (mes = primeiro dia do mês)
+        """
+        CREATE TABLE IF NOT EXISTS resumo_retorno_mensal (
+            ticker VARCHAR(20) NOT NULL,
+            mes DATE NOT NULL,
+            fechamento DECIMAL(15,8),
+            retorno DOUBLE PRECISION,
+            PRIMARY KEY (ticker, mes)
+        )
+        """,
+        
+        # Grade de retornos anuais (ano = primeiro dia do ano)
+        """
+        CREATE TABLE IF NOT EXISTS resumo_retorno_anual (
+            ticker VARCHAR(20) NOT NULL,
+            ano DATE NOT NULL,
+            fechamento DECIMAL(15,8),
+            retorno DOUBLE PRECISION,
+            PRIMARY KEY (ticker, ano)
+        )
+        """,
+        
+        # Volatilidade móvel anualizada por ticker
+        """
+        CREATE TABLE IF NOT EXISTS resumo_volatilidade (
+            ticker VARCHAR(20) NOT NULL,
+            data DATE NOT NULL,
+            janela INTEGER NOT NULL,
+            volatilidade DOUBLE PRECISION,
+            PRIMARY KEY (ticker, janela, data)
+        )
+        """
+    ]
+    
+    try:
+        for command in sql_commands:
+            cursor.execute(command)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def load_pending_tickers(cursor, full_refresh=False):
+    """Monta a tabela temporária _pendentes (ticker, desde, inicio_janela, taxa)"""
+    window = get_volatility_window()
+    
+    if full_refresh:
+        source = "SELECT ticker, MIN(data) AS desde FROM dados_historicos GROUP BY ticker"
+    else:
+        source = "SELECT ticker, pendente_desde AS desde FROM controle_carga WHERE pendente_desde IS NOT NULL"
+    
+    cursor.execute("DROP TABLE IF EXISTS _pendentes")
+    # inicio_janela: pregões anteriores a `desde` necessários para o
+    # retorno e a volatilidade móvel da primeira data recalculada
+    cursor.execute(f"""
+        CREATE TEMP TABLE _pendentes AS
+        SELECT p.ticker, p.desde,
+               COALESCE((
+                   SELECT d.data FROM dados_historicos d
+                   WHERE d.ticker = p.ticker AND d.data < p.desde
+                   ORDER BY d.data DESC
+                   OFFSET %s LIMIT 1
+               ), '-infinity'::date) AS inicio_janela,
+               p.ticker = ANY(%s) AS taxa
+        FROM ({source}) p
+    """, (window, list(get_rate_tickers())))
+    cursor.execute("ANALYZE _pendentes")
+    
+    cursor.execute("SELECT COUNT(*), MIN(desde) FROM _pendentes")
+    return cursor.fetchone()
+
+def refresh_latest_prices(cursor):
+    """Atualiza o último fechamento dos tickers pendentes"""
+    cursor.execute("""
+        INSERT INTO resumo_ultimo_preco (ticker, data, fechamento, fechamento_ajustado, atualizado_em)
+        SELECT DISTINCT ON (d.ticker)
+               d.ticker, d.data, d.fechamento, d.fechamento_ajustado, CURRENT_TIMESTAMP
+        FROM dados_historicos d
+        JOIN _pendentes p ON p.ticker = d.ticker
+        WHERE d.data >= p.desde
+        ORDER BY d.ticker, d.data DESC
+        ON CONFLICT (ticker) DO UPDATE SET
+            data = EXCLUDED.data,
+            fechamento = EXCLUDED.fechamento,
+            fechamento_ajustado = EXCLUDED.fechamento_ajustado,
+            atualizado_em = EXCLUDED.atualizado_em
+        WHERE EXCLUDED.data >= resumo_ultimo_preco.data
+    """)
+    return cursor.rowcount
+
+def refresh_period_returns(cursor, table, period_column, period):
+    """Recalcula a grade de retornos (mês/ano) a partir do período pendente
+    
+    Inclui o período anterior a `desde` apenas como base do primeiro retorno.
+    """
+    cursor.execute(f"""
+        WITH fechamentos AS (
+            SELECT DISTINCT ON (d.ticker, date_trunc('{period}', d.data))
+                   d.ticker,
+                   date_trunc('{period}', d.data)::date AS periodo,
+                   COALESCE(d.fechamento_ajustado, d.fechamento) AS fechamento
+            FROM dados_historicos d
+            JOIN _pendentes p ON p.ticker = d.ticker AND NOT p.taxa
+            WHERE d.data >= date_trunc('{period}', p.desde) - interval '1 {period}'
+            ORDER BY d.ticker, date_trunc('{period}', d.data), d.data DESC
+        ), retornos AS (
+            SELECT ticker, periodo, fechamento,
+                   fechamento / NULLIF(LAG(fechamento) OVER (PARTITION BY ticker ORDER BY periodo), 0) - 1
+                       AS retorno
+            FROM fechamentos
+        )
+        INSERT INTO {table} (ticker, {period_column}, fechamento, retorno)
+        SELECT r.ticker, r.periodo, r.fechamento, r.retorno
+        FROM retornos r
+        JOIN _pendentes p ON p.ticker = r.ticker
+        WHERE r.periodo >= date_trunc('{period}', p.desde)
+        ON CONFLICT (ticker, {period_column}) DO UPDATE SET
+            fechamento = EXCLUDED.fechamento,
+            retorno = EXCLUDED.retorno
+    """)
+    return cursor.rowcount
+
+def refresh_volatility(cursor):
+    """Recalcula a volatilidade móvel anualizada a partir de `desde`"""
+    window = get_volatility_window()
+    
+    cursor.execute(f"""
+        WITH base AS (
+            SELECT d.ticker, d.data,
+                   COALESCE(d.fechamento_ajustado, d.fechamento) /
+                       NULLIF(LAG(COALESCE(d.fechamento_ajustado, d.fechamento))
+                              OVER (PARTITION BY d.ticker ORDER BY d.data), 0) - 1 AS retorno
+            FROM dados_historicos d
+            JOIN _pendentes p ON p.ticker = d.ticker AND NOT p.taxa
+            WHERE d.data >= p.inicio_janela
+        ), janelas AS (
+            SELECT ticker, data,
+                   stddev_samp(retorno) OVER w * sqrt({TRADING_DAYS_PER_YEAR}) AS volatilidade,
+                   COUNT(retorno) OVER w AS observacoes
+            FROM base
+            WINDOW w AS (PARTITION BY ticker ORDER BY data ROWS BETWEEN {window - 1} PRECEDING AND CURRENT ROW)
+        )
+        INSERT INTO resumo_volatilidade (ticker, data, janela, volatilidade)
+        SELECT j.ticker, j.data, {window}, j.volatilidade
+        FROM janelas j
+        JOIN _pendentes p ON p.ticker = j.ticker
+        WHERE j.data >= p.desde AND j.observacoes = {window}
+        ON CONFLICT (ticker, janela, data) DO UPDATE SET
+            volatilidade = EXCLUDED.volatilidade
+    """)
+    return cursor.rowcount
+
+def purge_rate_series(cursor):
+    """Remove das grades de retorno e da volatilidade as séries de taxa pendentes"""
+    removed = 0
+    for table in ['resumo_retorno_mensal', 'resumo_retorno_anual', 'resumo_volatilidade']:
+        cursor.execute(f"""
+            DELETE FROM {table} t
+            USING _pendentes p
+            WHERE t.ticker = p.ticker AND p.taxa
+        """)
+        removed += cursor.rowcount
+    return removed
+
+def refresh_analytics(conn, full_refresh=False):
+    """Atualiza todas as tabelas de resumo em uma única transação"""
+    create_analytics_tables(conn)
+    cursor = conn.cursor()
+    
+    try:
+        pending, since = load_pending_tickers(cursor, full_refresh)
+        
+        if not pending:
+            print("OK: Nenhum ticker pendente, tabelas de resumo ja atualizadas")
+            conn.commit()
+            return 0
+        
+        print(f"Atualizando resumos de {pending} tickers (desde {since})...")
+        
+        steps = [
+            ("resumo_ultimo_preco", lambda: refresh_latest_prices(cursor)),
+            ("resumo_retorno_mensal", lambda: refresh_period_returns(
+                cursor, 'resumo_retorno_mensal', 'mes', 'month')),
+            ("resumo_retorno_anual", lambda: refresh_period_returns(
+                cursor, 'resumo_retorno_anual', 'ano', 'year')),
+            ("resumo_volatilidade", lambda: refresh_volatility(cursor)),
+            ("series de taxa (removidas)", lambda: purge_rate_series(cursor)),
+        ]
+        
+        for table, step in steps:
+            start = time.time()
+            rows = step()
+            print(f"  OK: {table}: {rows} linhas em {time.time() - start:.2f}s")
+        
+        cursor.execute("""
+            UPDATE controle_carga c
+            SET pendente_desde = NULL, analytics_atualizado_em = CURRENT_TIMESTAMP
+            FROM _pendentes p
+            WHERE c.ticker = p.ticker
+        """)
+        cursor.execute("DROP TABLE _pendentes")
+        
+        conn.commit()
+        return pending
+    
+    except Exception as e:
+        conn.rollback()
+        print(f"ERRO: Erro ao atualizar resumos: {e}")
+        raise
+    finally:
+        cursor.close()
+
+def main(argv=None):
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Atualiza as tabelas de resumo (analytics)')
+    parser.add_argument('--full', action='store_true',
+                        help='Recalcular todos os tickers, ignorando controle_carga')
+    args = parser.parse_args(argv if argv is not None else [])
+    
+    try:
+        print("Iniciando atualizacao das tabelas de resumo...")
+        
+        conn = get_postgres_connection()
+        print("OK: Conectado ao PostgreSQL")
+        
+        refresh_analytics(conn, args.full)
+        
+        conn.close()
+        print("OK: Tabelas de resumo atualizadas!")
+    
+    except Exception as e:
+        print(f"ERRO: Erro na atualizacao dos resumos: {e}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Script para varrer a qualidade de dados_historicos
+
+As verificações são colunares (NumPy) sobre todos os tickers do lote de
+uma vez: pregões ausentes em relação ao calendário, linhas fora do
+calendário, dias duplicados, fechamentos nulos ou não positivos, OHLC
+inconsistente e outliers de retorno_diario por z-score.
+
+As séries de taxa (get_rate_tickers: CDI, IPCA...) guardam taxas em %, não
+preços: as lacunas são medidas no calendário do seu período (dias úteis
+bancários ou meses) e as verificações de preço (fechamento, OHLC e
+outliers de retorno) não se aplicam a elas.
+
+Os dados vêm do PostgreSQL via COPY em lotes de tickers e são lidos
+direto em colunas, sem montar objetos Python por linha. O relatório
+guarda só contagens por ticker e alguns exemplos de cada verificação.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from data_access import get_postgres_connection
+from trading_calendar import business_days, calendar_kind_for_ticker, get_rate_tickers
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Colunas lidas de dados_historicos e seus tipos
+SCAN_COLUMNS = ['ticker', 'data', 'abertura', 'maxima', 'minima', 'fechamento', 'retorno_diario']
+SCAN_DTYPES = {
+    'ticker': str,
+    'abertura': 'float64',
+    'maxima': 'float64',
+    'minima': 'float64',
+    'fechamento': 'float64',
+    'retorno_diario': 'float64',
+}
+
+# Verificações disponíveis e sua descrição no relatório
+CHECKS = {
+    'lacuna': "Pregoes (ou meses, nas taxas mensais) ausentes em relacao ao calendario",
+    'fora_calendario': "Linhas em fim de semana, feriado ou fora do dia 1 (taxas mensais)",
+    'duplicado': "Mais de uma linha para o mesmo ticker e data",
+    'fechamento_invalido': "Fechamento nulo, zero ou negativo",
+    'ohlc_inconsistente': "minima > maxima ou abertura/fechamento fora de [minima, maxima]",
+    'outlier_retorno': "retorno_diario com |z-score| acima do limite",
+}
+
+# Observações mínimas por ticker para calcular o z-score
+MIN_ZSCORE_OBSERVATIONS = 30
+
+# Tolerância relativa na comparação de abertura/fechamento com minima/maxima
+OHLC_TOLERANCE = 1e-6
+
+REPORT_PATH = 'migration/data/quality_report.json'
+
+def get_zscore_threshold():
+    """Limite de |z-score| de retorno_diario (QUALITY_ZSCORE)"""
+    return float(os.getenv('QUALITY_ZSCORE', 6))
+
+def get_batch_tickers():
+    """Tickers lidos por COPY em cada lote da varredura (QUALITY_BATCH_TICKERS)"""
+    return max(1, int(os.getenv('QUALITY_BATCH_TICKERS', 200)))
+
+def get_fail_checks():
+    """Verificações que fazem o passo falhar quando encontram anomalias (QUALITY_FAIL_ON)"""
+    checks = {c.strip() for c in os.getenv('QUALITY_FAIL_ON', '').split(',') if c.strip()}
+    unknown = checks - set(CHECKS)
+    if unknown:
+        raise ValueError(f"QUALITY_FAIL_ON invalido: {', '.join(sorted(unknown))} "
+                         f"(use: {', '.join(CHECKS)})")
+    return checks
+
+def new_report(zscore_threshold):
+    """Relatório vazio com um contador por verificação"""
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'limite_zscore': zscore_threshold,
+        'linhas': 0,
+        'tickers': 0,
+        'verificacoes': {
+            check: {'descricao': description, 'total': 0, 'por_ticker': {}, 'exemplos': []}
+            for check, description in CHECKS.items()
+        },
+    }
+
+def shifted(values, fill):
+    """Desloca um array uma posição para frente (valor da linha anterior)"""
+    result = np.empty_like(values)
+    result[0] = fill
+    result[1:] = values[:-1]
+    return result
+
+def record_anomalies(report, check, mask, tickers, codes, dates, values=None,
+                     weights=None, max_examples=5):
+    """Acumula no relatório as linhas marcadas por uma verificação
+    
+    weights permite contar mais de uma anomalia por linha (pregões ausentes).
+    """
+    rows = np.flatnonzero(mask)
+    if not rows.size:
+        return
+    
+    entry = report['verificacoes'][check]
+    counts = np.bincount(codes[rows], weights=None if weights is None else weights[rows],
+                         minlength=len(tickers)).astype(np.int64)
+    
+    entry['total'] += int(counts.sum())
+    for code in np.flatnonzero(counts):
+        entry['por_ticker'][str(tickers[code])] = int(counts[code])
+    
+    for row in rows[:max(0, max_examples - len(entry['exemplos']))]:
+        example = {'ticker': str(tickers[codes[row]]), 'data': str(dates[row])}
+        if values is not None:
+            value = float(values[row])
+            example['valor'] = round(value, 8) if np.isfinite(value) else None
+        entry['exemplos'].append(example)
+
+def scan_frame(frame, report, zscore_threshold=6.0, max_examples=5, presorted=False,
+               rate_tickers=None):
+    """Aplica todas as verificações a um DataFrame com as colunas SCAN_COLUMNS
+    
+    Cada ticker precisa estar inteiro no frame (z-score e lacunas são por ticker).
+    rate_tickers é {ticker: periodo} (padrão: get_rate_tickers()).
+    """
+    if frame.empty:
+        return report
+    
+    rate_tickers = get_rate_tickers() if rate_tickers is None else rate_tickers
+    
+    if not presorted:
+        frame = frame.sort_values(['ticker', 'data'], kind='stable')
+    
+    codes, tickers = pd.factorize(frame['ticker'], sort=True)
+    dates = frame['data'].to_numpy().astype('datetime64[D]')
+    opening = frame['abertura'].to_numpy(dtype=np.float64)
+    high = frame['maxima'].to_numpy(dtype=np.float64)
+    low = frame['minima'].to_numpy(dtype=np.float64)
+    close = frame['fechamento'].to_numpy(dtype=np.float64)
+    returns = frame['retorno_diario'].to_numpy(dtype=np.float64)
+    num_rows, num_tickers = len(codes), len(tickers)
+    
+    # Linha anterior é do mesmo ticker
+    same_ticker = codes == shifted(codes, -1)
+    duplicated = same_ticker & (dates == shifted(dates, np.datetime64('NaT')))
+    
+    # Posição de cada data no calendário do seu ticker (b3, fx, bcb ou mensal)
+    kinds = np.array([calendar_kind_for_ticker(t, rate_tickers) for t in tickers])
+    row_kinds = kinds[codes]
+    price_row = np.isin(row_kinds, ['b3', 'fx'])
+    position = np.zeros(num_rows, dtype=np.int64)
+    on_calendar = np.ones(num_rows, dtype=bool)
+    for kind in np.unique(kinds):
+        rows = row_kinds == kind
+        calendar = business_days(dates[rows].min(), dates[rows].max(), kind)
+        kind_position = np.searchsorted(calendar, dates[rows])
+        position[rows] = kind_position
+        on_calendar[rows] = calendar[np.minimum(kind_position, len(calendar) - 1)] == dates[rows]
+    
+    # Pregões do calendário estritamente entre a linha anterior e a atual
+    missing = position - shifted(position, 0) - shifted(on_calendar, False)
+    missing = np.where(same_ticker, np.maximum(missing, 0), 0)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        invalid_close = price_row & ~(close > 0)
+        
+        tolerance = OHLC_TOLERANCE * np.abs(high)
+        inconsistent = price_row & ((low > high)
+                                    | (opening < low - tolerance) | (opening > high + tolerance)
+                                    | (close < low - tolerance) | (close > high + tolerance))
+        
+        # retorno_diario ausente: usa o retorno fechamento a fechamento
+        computed = close / shifted(close, np.nan) - 1
+        computed[~same_ticker | duplicated] = np.nan
+        returns = np.where(np.isnan(returns), computed, returns)
+        
+        # Média e desvio por ticker em duas passadas (bincount), sem groupby
+        valid = price_row & np.isfinite(returns)
+        observations = np.bincount(codes[valid], minlength=num_tickers)
+        mean = np.bincount(codes[valid], weights=returns[valid], minlength=num_tickers) \
+            / np.maximum(observations, 1)
+        deviation = np.where(valid, returns - mean[codes], 0.0)
+        std = np.sqrt(np.bincount(codes, weights=deviation ** 2, minlength=num_tickers)
+                      / np.maximum(observations - 1, 1))
+        zscore = deviation / std[codes]
+        outlier = (valid & (observations[codes] >= MIN_ZSCORE_OBSERVATIONS)
+                   & (std[codes] > 0) & (np.abs(zscore) > zscore_threshold))
+    
+    checks = [
+        ('lacuna', missing > 0, missing, missing),
+        ('fora_calendario', ~on_calendar, None, None),
+        ('duplicado', duplicated, close, None),
+        ('fechamento_invalido', invalid_close, close, None),
+        ('ohlc_inconsistente', inconsistent, close, None),
+        ('outlier_retorno', outlier, zscore, None),
+    ]
+    for check, mask, values, weights in checks:
+        record_anomalies(report, check, mask, tickers, codes, dates, values, weights, max_examples)
+    
+    report['linhas'] += num_rows
+    report['tickers'] += num_tickers
+    return report
+
+def read_copy_frame(cursor, query):
+    """Executa COPY (query) TO STDOUT em CSV e lê o resultado direto em colunas"""
+    buffer = io.BytesIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer)
+    buffer.seek(0)
+    return pd.read_csv(buffer, dtype=SCAN_DTYPES, parse_dates=['data'])
+
+def load_scan_tickers(cursor, full_scan=False):
+    """Tickers a varrer: pendentes em controle_carga ou todos (--full)"""
+    if full_scan:
+        cursor.execute("SELECT DISTINCT ticker FROM dados_historicos ORDER BY ticker")
+    else:
+        cursor.execute("""
+            SELECT ticker FROM controle_carga
+            WHERE pendente_desde IS NOT NULL
+            ORDER BY ticker
+        """)
+    return [row[0] for row in cursor.fetchall()]
+
+def iter_ticker_frames(conn, tickers, batch_size, columns=None):
+    """Lê o histórico completo dos tickers em lotes, um DataFrame por lote
+    
+    columns são expressões SQL (padrão: SCAN_COLUMNS).
+    """
+    cursor = conn.cursor()
+    columns = ', '.join(columns or SCAN_COLUMNS)
+    
+    try:
+        for i in range(0, len(tickers), batch_size):
+            query = cursor.mogrify(
+                f"SELECT {columns} FROM dados_historicos WHERE ticker = ANY(%s) ORDER BY ticker, data",
+                (tickers[i:i + batch_size],)
+            ).decode()
+            yield read_copy_frame(cursor, query)
+    finally:
+        cursor.close()
+
+def read_json_frame(path):
+    """Lê um JSON de dados_historicos (extração) nas colunas da varredura"""
+    frame = pd.read_json(path, orient='records', dtype=False, convert_dates=False)
+    frame = frame.reindex(columns=SCAN_COLUMNS)
+    frame['ticker'] = frame['ticker'].astype(str)
+    frame['data'] = pd.to_datetime(frame['data'].astype(str).str[:10])
+    for column in SCAN_COLUMNS[2:]:
+        frame[column] = pd.to_numeric(frame[column], errors='coerce')
+    return frame
+
+def scan_database(conn, full_scan=False, zscore_threshold=None, batch_size=None):
+    """Varre dados_historicos no PostgreSQL e retorna o relatório"""
+    zscore_threshold = zscore_threshold or get_zscore_threshold()
+    batch_size = batch_size or get_batch_tickers()
+    report = new_report(zscore_threshold)
+    
+    cursor = conn.cursor()
+    try:
+        tickers = load_scan_tickers(cursor, full_scan)
+    finally:
+        cursor.close()
+    
+    if not tickers:
+        print("OK: Nenhum ticker pendente para varrer")
+        return report
+    
+    print(f"Varrendo {len(tickers)} tickers em lotes de {batch_size}...")
+    for frame in iter_ticker_frames(conn, tickers, batch_size):
+        scan_frame(frame, report, zscore_threshold, presorted=True)
+    
+    conn.rollback()
+    return report
+
+def print_report(report, top=3):
+    """Exibe o resumo do relatório"""
+    print(f"Linhas: {report['linhas']} | Tickers: {report['tickers']} | "
+          f"Tempo: {report.get('tempo_s', 0):.2f}s")
+    
+    for check, entry in report['verificacoes'].items():
+        if not entry['total']:
+            print(f"  OK: {check}: 0")
+            continue
+        
+        worst = sorted(entry['por_ticker'].items(), key=lambda item: -item[1])[:top]
+        worst = ', '.join(f"{ticker}={count}" for ticker, count in worst)
+        print(f"  AVISO: {check}: {entry['total']} em {len(entry['por_ticker'])} tickers ({worst})")
+
+def save_report(report, path=REPORT_PATH):
+    """Salva o relatório em JSON"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"OK: Relatorio salvo em {path}")
+
+def main(argv=None):
+    """Função principal"""
+    parser = argparse.ArgumentParser(description='Varredura de qualidade de dados_historicos')
+    parser.add_argument('--full', action='store_true',
+                        help='Varrer todos os tickers, ignorando controle_carga')
+    parser.add_argument('--json', metavar='ARQUIVO',
+                        help='Varrer um JSON extraído em vez do PostgreSQL')
+    parser.add_argument('--zscore', type=float, help='Limite de |z-score| (padrao: QUALITY_ZSCORE)')
+    parser.add_argument('--output', default=REPORT_PATH, help='Arquivo do relatorio')
+    args = parser.parse_args(argv if argv is not None else [])
+    
+    try:
+        fail_checks = get_fail_checks()
+        print("Iniciando varredura de qualidade...")
+        start = time.time()
+        
+        if args.json:
+            zscore_threshold = args.zscore or get_zscore_threshold()
+            report = scan_frame(read_json_frame(args.json), new_report(zscore_threshold), zscore_threshold)
+        else:
+            conn = get_postgres_connection()
+            print("OK: Conectado ao PostgreSQL")
+            report = scan_database(conn, args.full, args.zscore)
+            conn.close()
+        
+        report['tempo_s'] = round(time.time() - start, 3)
+        print_report(report)
+        save_report(report, args.output)
+    
+    except Exception as e:
+        print(f"ERRO: Erro na varredura de qualidade: {e}")
+        return 1
+    
+    failed = [check for check in fail_checks if report['verificacoes'][check]['total']]
+    if failed:
+        print(f"ERRO: Anomalias bloqueantes (QUALITY_FAIL_ON): {', '.join(sorted(failed))}")
+        return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Script para exportar/restaurar um snapshot binário do PostgreSQL local
+
+Cada tabela é exportada com COPY ... (FORMAT binary) para um arquivo
+gzip, com checksums e um manifest.json (contagem de linhas, hash do
+schema). A restauração confere os checksums de todos os arquivos em
+paralelo antes de tocar no banco e depois restaura todas as tabelas em
+uma única transação: uma falha desfaz tudo, sem misturar tabelas
+restauradas e antigas.
+"""
+
+import os
+import sys
+import gzip
+import json
+import zlib
+import hashlib
+import argparse
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from data_access import get_postgres_connection
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+class HashingWriter:
+    """Arquivo de escrita que acumula sha256 e tamanho do que passa por ele"""
+    
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+    
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+    
+    def flush(self):
+        return self.fileobj.flush()
+
+class HashingReader:
+    """Arquivo de leitura que acumula sha256 e tamanho do que foi lido"""
+    
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+    
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+    
+    def readline(self, size=-1):
+        data = self.fileobj.readline(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+def list_tables(cursor):
+    """Lista as tabelas do schema atual (sem partições nem staging)"""
+    cursor.execute("""
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+          AND c.relkind IN ('r', 'p')
+          AND NOT c.relispartition
+          AND c.relname NOT LIKE '%\\_staging'
+        ORDER BY c.relname
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+def get_table_columns(cursor, table):
+    """Retorna [(coluna, tipo)] na ordem física da tabela"""
+    cursor.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, (table,))
+    return [list(row) for row in cursor.fetchall()]
+
+def get_primary_key_columns(cursor, table):
+    """Retorna as colunas da chave primária (para exportar em ordem estável)"""
+    cursor.execute("""
+        SELECT a.attname
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = %s::regclass AND i.indisprimary
+        ORDER BY array_position(i.indkey::int2[], a.attnum)
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+def compute_schema_hash(table_columns):
+    """Hash do schema: tabelas, colunas e tipos em ordem"""
+    canonical = json.dumps(sorted(table_columns.items()), separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def get_copy_out_query(cursor, table, columns):
+    """COPY binário em ordem de chave primária (conteúdo determinístico)"""
+    columns_str = ', '.join(col for col, _ in columns)
+    order_by = get_primary_key_columns(cursor, table)
+    order_clause = f" ORDER BY {', '.join(order_by)}" if order_by else ""
+    return f"COPY (SELECT {columns_str} FROM {table}{order_clause}) TO STDOUT (FORMAT binary)"
+
+def open_snapshot_connection(snapshot_id):
+    """Abre conexão em transação REPEATABLE READ no snapshot informado"""
+    conn = get_postgres_connection()
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = conn.cursor()
+    cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+    cursor.close()
+    return conn
+
+def export_table(snapshot_id, table, columns, output_dir, compresslevel):
+    """Exporta uma tabela para <tabela>.copy.gz e retorna sua entrada no manifest"""
+    conn = open_snapshot_connection(snapshot_id)
+    cursor = conn.cursor()
+    filename = f"{table}.copy.gz"
+    
+    try:
+        start = time.time()
+        
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        rows = cursor.fetchone()[0]
+        
+        with open(os.path.join(output_dir, filename), 'wb') as raw:
+            file_hash = HashingWriter(raw)
+            with gzip.GzipFile(fileobj=file_hash, mode='wb', compresslevel=compresslevel, mtime=0) as gz:
+                content_hash = HashingWriter(gz)
+                cursor.copy_expert(get_copy_out_query(cursor, table, columns), content_hash)
+        
+        conn.rollback()
+        
+        return table, {
+            'file': filename,
+            'rows': rows,
+            'columns': columns,
+            'content_bytes': content_hash.size,
+            'content_sha256': content_hash.sha256.hexdigest(),
+            'file_bytes': file_hash.size,
+            'file_sha256': file_hash.sha256.hexdigest(),
+        }, time.time() - start
+    finally:
+        cursor.close()
+        conn.close()
+
+def export_snapshot(output_dir, max_workers=4, compresslevel=6):
+    """Exporta todas as tabelas em paralelo a partir de um snapshot consistente"""
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Transação que exporta o snapshot compartilhado pelas conexões paralelas
+    conn = get_postgres_connection()
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("SELECT pg_export_snapshot()")
+        snapshot_id = cursor.fetchone()[0]
+        
+        tables = list_tables(cursor)
+        table_columns = {table: get_table_columns(cursor, table) for table in tables}
+        
+        print(f"Exportando {len(tables)} tabelas ({max_workers} conexoes)...")
+        
+        entries = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(export_table, snapshot_id, table, table_columns[table],
+                                       output_dir, compresslevel)
+                       for table in tables]
+            
+            for future in as_completed(futures):
+                table, entry, elapsed = future.result()
+                entries[table] = entry
+                print(f"  OK: {table}: {entry['rows']} registros, "
+                      f"{entry['file_bytes'] / 1024 / 1024:.1f} MB em {elapsed:.2f}s")
+    finally:
+        cursor.close()
+        conn.close()
+    
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'created_at': datetime.now().astimezone().isoformat(),
+        'database': os.getenv('POSTGRES_DB', 'paridaderisco'),
+        'schema_hash': compute_schema_hash(table_columns),
+        'tables': dict(sorted(entries.items())),
+    }
+    
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    
+    print(f"OK: Snapshot salvo em: {output_dir}")
+    return manifest
+
+def load_manifest(snapshot_dir):
+    """Carrega o manifest.json de um snapshot"""
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Versao de manifest nao suportada: {manifest.get('version')}")
+    
+    return manifest
+
+def reset_sequences(cursor, table, columns):
+    """Ajusta as sequences SERIAL ao maior valor restaurado"""
+    for column, _ in columns:
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, column))
+        sequence = cursor.fetchone()[0]
+        if sequence:
+            cursor.execute(
+                f"SELECT setval(%s, COALESCE(MAX({column}), 1), MAX({column}) IS NOT NULL) FROM {table}",
+                (sequence,)
+            )
+
+def check_snapshot_file(snapshot_dir, table, entry):
+    """Confere os checksums do arquivo e do conteúdo de uma tabela do snapshot"""
+    with open(os.path.join(snapshot_dir, entry['file']), 'rb') as raw:
+        file_hash = HashingReader(raw)
+        with gzip.GzipFile(fileobj=file_hash, mode='rb') as gz:
+            content_hash = HashingReader(gz)
+            while content_hash.read(1024 * 1024):
+                pass
+        while file_hash.read(65536):
+            pass
+    
+    if file_hash.sha256.hexdigest() != entry['file_sha256']:
+        raise ValueError(f"checksum do arquivo {entry['file']} nao confere")
+    if content_hash.sha256.hexdigest() != entry['content_sha256']:
+        raise ValueError(f"checksum do conteudo de {table} nao confere")
+    
+    return table
+
+def check_snapshot_files(snapshot_dir, manifest, max_workers=4):
+    """Confere em paralelo os arquivos do snapshot; retorna {tabela: erro}"""
+    errors = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(check_snapshot_file, snapshot_dir, table, entry): table
+                   for table, entry in manifest['tables'].items()}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except (OSError, EOFError, ValueError, zlib.error) as e:
+                errors[futures[future]] = e
+    
+    return errors
+
+def restore_table(cursor, snapshot_dir, table, entry):
+    """Carrega uma tabela já truncada (COPY FROM) na transação do cursor"""
+    columns_str = ', '.join(col for col, _ in entry['columns'])
+    start = time.time()
+    
+    with open(os.path.join(snapshot_dir, entry['file']), 'rb') as raw:
+        file_hash = HashingReader(raw)
+        with gzip.GzipFile(fileobj=file_hash, mode='rb') as gz:
+            content_hash = HashingReader(gz)
+            cursor.copy_expert(f"COPY {table} ({columns_str}) FROM STDIN (FORMAT binary)", content_hash)
+        # Consumir o que sobrar do arquivo para fechar o checksum
+        while file_hash.read(65536):
+            pass
+    
+    # O arquivo pode ter mudado desde a conferência inicial
+    if file_hash.sha256.hexdigest() != entry['file_sha256']:
+        raise ValueError(f"checksum do arquivo {entry['file']} nao confere")
+    if content_hash.sha256.hexdigest() != entry['content_sha256']:
+        raise ValueError(f"checksum do conteudo de {table} nao confere")
+    
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    rows = cursor.fetchone()[0]
+    if rows != entry['rows']:
+        raise ValueError(f"{table}: {rows} registros restaurados, esperados {entry['rows']}")
+    
+    reset_sequences(cursor, table, entry['columns'])
+    return rows, time.time() - start
+
+def restore_snapshot(snapshot_dir, max_workers=4, force=False):
+    """Restaura um snapshot: confere os arquivos em paralelo e restaura tudo em uma transação"""
+    manifest = load_manifest(snapshot_dir)
+    tables = manifest['tables']
+    
+    print(f"Conferindo {len(tables)} arquivos ({max_workers} threads)...")
+    errors = check_snapshot_files(snapshot_dir, manifest, max_workers)
+    if errors:
+        for table, error in sorted(errors.items()):
+            print(f"  ERRO: {table}: {error}")
+        print("ERRO: Snapshot corrompido, nenhuma tabela foi alterada")
+        return False
+    
+    conn = get_postgres_connection()
+    cursor = conn.cursor()
+    
+    try:
+        existing = set(list_tables(cursor))
+        missing = [table for table in tables if table not in existing]
+        if missing:
+            raise ValueError(f"Tabelas ausentes no destino: {', '.join(missing)} "
+                             "(execute python migrate.py schema)")
+        
+        target_hash = compute_schema_hash({table: get_table_columns(cursor, table) for table in tables})
+        if target_hash != manifest['schema_hash']:
+            if not force:
+                raise ValueError("Schema do destino difere do snapshot (use --force para ignorar)")
+            print("AVISO: Schema do destino difere do snapshot")
+        
+        print(f"Restaurando {len(tables)} tabelas em uma transacao...")
+        
+        # TRUNCATE na mesma transação do COPY permite ao PostgreSQL pular o WAL
+        # da carga quando wal_level = minimal
+        cursor.execute(f"TRUNCATE {', '.join(tables)}")
+        
+        for table, entry in tables.items():
+            try:
+                rows, elapsed = restore_table(cursor, snapshot_dir, table, entry)
+            except Exception as e:
+                conn.rollback()
+                print(f"  ERRO: {table}: {e}")
+                print("ERRO: Restauracao desfeita, nenhuma tabela foi alterada")
+                return False
+            print(f"  OK: {table}: {rows} registros em {elapsed:.2f}s")
+        
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+def verify_snapshot(snapshot_dir, max_workers=4):
+    """Compara o conteúdo atual do banco com os hashes do snapshot"""
+    manifest = load_manifest(snapshot_dir)
+    
+    conn = get_postgres_connection()
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = conn.cursor()
+    
+    def hash_table(table, entry):
+        table_conn = open_snapshot_connection(snapshot_id)
+        table_cursor = table_conn.cursor()
+        try:
+            with open(os.devnull, 'wb') as devnull:
+                content_hash = HashingWriter(devnull)
+                table_cursor.copy_expert(
+                    get_copy_out_query(table_cursor, table, entry['columns']), content_hash
+                )
+            return table, content_hash.sha256.hexdigest() == entry['content_sha256']
+        finally:
+            table_cursor.close()
+            table_conn.close()
+    
+    try:
+        cursor.execute("SELECT pg_export_snapshot()")
+        snapshot_id = cursor.fetchone()[0]
+        
+        print(f"{'Tabela':<30} {'Status':<10}")
+        print("-" * 42)
+        
+        matches = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(hash_table, table, entry)
+                       for table, entry in manifest['tables'].items()]
+            for future in as_completed(futures):
+                table, ok = future.result()
+                matches += ok
+                print(f"{table:<30} {'OK' if ok else 'DIFF':<10}")
+    finally:
+        cursor.close()
+        conn.close()
+    
+    total = len(manifest['tables'])
+    print(f"\nResumo: {matches}/{total} tabelas identicas ao snapshot")
+    return matches == total
+
+def main(argv=None):
+    """Função principal com argumentos de linha de comando"""
+    parser = argparse.ArgumentParser(description='Snapshot binário do PostgreSQL local')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    export_parser = subparsers.add_parser('export', help='Exportar snapshot')
+    export_parser.add_argument('--output', default=None,
+                               help='Diretorio de saida (padrao: migration/snapshots/<data>)')
+    export_parser.add_argument('--compresslevel', type=int, default=6, help='Nivel do gzip (1-9)')
+    
+    restore_parser = subparsers.add_parser('restore', help='Restaurar snapshot')
+    restore_parser.add_argument('snapshot_dir', help='Diretorio do snapshot')
+    restore_parser.add_argument('--force', action='store_true', help='Ignorar diferenca de schema')
+    restore_parser.add_argument('--no-verify', action='store_true', help='Nao verificar apos restaurar')
+    
+    verify_parser = subparsers.add_parser('verify', help='Comparar banco com snapshot')
+    verify_parser.add_argument('snapshot_dir', help='Diretorio do snapshot')
+    
+    for subparser in (export_parser, restore_parser, verify_parser):
+        subparser.add_argument('--workers', type=int, default=int(os.getenv('SNAPSHOT_WORKERS', 4)),
+                               help='Conexoes (ou threads de conferencia, no restore) paralelas')
+    
+    args = parser.parse_args(argv)
+    
+    try:
+        start = time.time()
+        
+        if args.command == 'export':
+            output_dir = args.output or f"migration/snapshots/{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            export_snapshot(output_dir, args.workers, args.compresslevel)
+            success = True
+        elif args.command == 'restore':
+            success = restore_snapshot(args.snapshot_dir, args.workers, args.force)
+            if success and not args.no_verify:
+                print("\nVerificando hashes...")
+                success = verify_snapshot(args.snapshot_dir, args.workers)
+        else:
+            success = verify_snapshot(args.snapshot_dir, args.workers)
+        
+        print(f"{'OK' if success else 'ERRO'}: {args.command} em {time.time() - start:.2f}s")
+        return 0 if success else 1
+    
+    except Exception as e:
+        print(f"ERRO: Erro no snapshot: {e}")
+        return 1
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,6 @@
+"""Configuração dos testes: os scripts da migração são importados como módulos"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
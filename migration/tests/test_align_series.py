@@ -0,0 +1,84 @@
+"""Testes do alinhamento das séries ao calendário mestre"""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from align_series import align_frame, get_rate_tickers, load_align_tickers
+from trading_calendar import business_days
+
+def rate_frame(ticker, dates, rate):
+    return pd.DataFrame({'ticker': ticker, 'data': pd.DatetimeIndex(dates), 'fechamento': rate})
+
+def test_daily_rate_accrues_on_missing_business_days():
+    calendar = business_days('2023-01-02', '2023-12-29')
+    missing = np.random.default_rng(0).choice(np.arange(1, len(calendar) - 1), 20, replace=False)
+    frame = rate_frame('CDI', np.delete(calendar, missing), 0.0484)
+    
+    aligned = align_frame(frame, calendar, {'CDI': 'diaria'}, max_fill=0)
+    
+    assert len(aligned['nivel']) == len(calendar)
+    assert aligned['preenchido'].sum() == 20
+    assert aligned['nivel'][0] == pytest.approx(100.0)
+    assert aligned['nivel'][-1] == pytest.approx(100 * 1.000484 ** (len(calendar) - 1))
+
+def test_monthly_rate_compounds_to_the_monthly_rate():
+    calendar = business_days('2022-01-03', '2023-12-29')
+    frame = rate_frame('IPCA', pd.date_range('2022-01-01', '2023-12-01', freq='MS'), 0.5)
+    
+    aligned = align_frame(frame, calendar, {'IPCA': 'mensal'}, max_fill=0)
+    levels = pd.Series(aligned['nivel'], index=pd.DatetimeIndex(aligned['data']))
+    monthly = levels.resample('ME').last().pct_change().dropna()
+    
+    assert aligned['data'][-1] == calendar[-1]
+    assert np.allclose(monthly, 0.005)
+
+def test_annual_rate_quoted_as_daily_is_an_error():
+    calendar = business_days('2023-01-02', '2023-03-31')
+    frame = rate_frame('SELIC', calendar, 13.75)
+    
+    with pytest.raises(ValueError, match='SELIC:anual'):
+        align_frame(frame, calendar, {'SELIC': 'diaria'})
+    
+    aligned = align_frame(frame, calendar, {'SELIC': 'anual'}, max_fill=0)
+    assert aligned['tipos'] == ['taxa']
+    assert aligned['nivel'][-1] == pytest.approx(100 * 1.1375 ** ((len(calendar) - 1) / 252))
+
+def test_rate_tickers_periods(monkeypatch):
+    monkeypatch.setenv('ALIGN_RATE_TICKERS', 'CDI, IPCA:mensal,SELIC:anual')
+    assert get_rate_tickers() == {'CDI': 'diaria', 'IPCA': 'mensal', 'SELIC': 'anual'}
+    
+    monkeypatch.setenv('ALIGN_RATE_TICKERS', 'CDI:semanal')
+    with pytest.raises(ValueError):
+        get_rate_tickers()
+
+def test_prices_are_forward_filled():
+    calendar = business_days('2024-01-02', '2024-01-12')
+    frame = pd.DataFrame({'ticker': 'PETR4.SA', 'data': pd.DatetimeIndex(calendar[[0, 3]]),
+                          'fechamento': [10.0, 11.0]})
+    
+    aligned = align_frame(frame, calendar, {}, max_fill=2)
+    
+    assert aligned['tipos'] == ['preco']
+    assert aligned['nivel'].tolist() == [10.0, 10.0, 10.0, 11.0, 11.0, 11.0]
+    assert aligned['preenchido'].tolist() == [False, True, True, False, True, True]
+
+def test_alignment_watermark_survives_analytics_refresh():
+    # insert -> analytics (limpa pendente_desde) -> align: o alinhamento
+    # ainda precisa ver os tickers carregados depois do último alinhamento
+    cursor = sqlite3.connect(':memory:').cursor()
+    cursor.execute("""
+        CREATE TABLE controle_carga (
+            ticker TEXT PRIMARY KEY, pendente_desde TEXT,
+            carregado_em TEXT, analytics_atualizado_em TEXT, alinhado_em TEXT
+        )
+    """)
+    cursor.executemany("INSERT INTO controle_carga VALUES (?, NULL, ?, ?, ?)", [
+        ('NOVO.SA', '2024-05-02 10:00', '2024-05-02 10:05', None),
+        ('RECARREGADO.SA', '2024-05-02 10:00', '2024-05-02 10:05', '2024-05-01 18:00'),
+        ('ALINHADO.SA', '2024-05-01 10:00', '2024-05-01 10:05', '2024-05-01 18:00'),
+    ])
+    
+    assert load_align_tickers(cursor) == ['NOVO.SA', 'RECARREGADO.SA']
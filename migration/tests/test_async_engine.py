@@ -0,0 +1,56 @@
+"""Testes da paginação da extração assíncrona (PostgREST simulado com httpx.MockTransport)"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from async_engine import extract_table, parse_content_range_total, plan_pages
+
+def postgrest(rows, max_rows, with_total=True):
+    """Servidor PostgREST em memória que corta as respostas em max_rows"""
+    def handler(request):
+        start, end = (int(value) for value in request.headers['Range'].split('-'))
+        page = rows[start:min(end + 1, start + max_rows)]
+        total = len(rows) if with_total and 'count=exact' in request.headers.get('Prefer', '') else '*'
+        content_range = f"{start}-{start + len(page) - 1}/{total}" if page else f"*/{total}"
+        return httpx.Response(206, json=page, headers={'Content-Range': content_range})
+    return httpx.MockTransport(handler)
+
+def extract(transport, batch_size):
+    async def run():
+        async with httpx.AsyncClient(transport=transport, base_url='http://supabase/rest/v1') as client:
+            return await extract_table(client, asyncio.Semaphore(4), 'ativos', batch_size)
+    return asyncio.run(run())
+
+def test_parse_content_range_total():
+    assert parse_content_range_total('0-999/13065') == 13065
+    assert parse_content_range_total('*/0') == 0
+    assert parse_content_range_total('0-999/*') is None
+    assert parse_content_range_total('') is None
+    assert parse_content_range_total(None) is None
+
+def test_plan_pages():
+    assert plan_pages(1000, 2500, 1000) == [(1000, 1999), (2000, 2499)]
+    assert plan_pages(1000, 1000, 1000) == []
+    assert plan_pages(0, 5, 2) == [(0, 1), (2, 3), (4, 4)]
+
+@pytest.mark.parametrize('max_rows', [1000, 300, 7])
+def test_short_pages_are_repaged(max_rows):
+    rows = [{'id': i} for i in range(2345)]
+    assert extract(postgrest(rows, max_rows), batch_size=1000) == rows
+
+def test_without_total_pages_until_empty():
+    rows = [{'id': i} for i in range(250)]
+    assert extract(postgrest(rows, 100, with_total=False), batch_size=1000) == rows
+
+def test_missing_rows_fail_the_extraction():
+    rows = [{'id': i} for i in range(50)]
+    
+    def handler(request):
+        start, end = (int(value) for value in request.headers['Range'].split('-'))
+        page = rows[start:min(end + 1, 40)]
+        return httpx.Response(206, json=page, headers={'Content-Range': f"{start}-{end}/50"})
+    
+    with pytest.raises(ValueError, match='veio vazia'):
+        extract(httpx.MockTransport(handler), batch_size=20)
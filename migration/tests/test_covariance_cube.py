@@ -0,0 +1,74 @@
+"""Testes dos retornos e do cubo de covariância"""
+
+import numpy as np
+import pandas as pd
+
+from align_series import build_level_matrix
+from covariance_cube import compute_returns, rolling_covariance, ewma_covariance
+from trading_calendar import business_days
+
+def test_rate_ticker_returns_are_the_daily_rate():
+    calendar = business_days('2023-01-02', '2023-12-29')
+    prices = 10 * np.cumprod(1 + np.random.default_rng(1).normal(0, 0.01, len(calendar)))
+    frame = pd.concat([
+        pd.DataFrame({'ticker': 'CDI', 'data': pd.DatetimeIndex(calendar[::2]), 'fechamento': 0.05}),
+        pd.DataFrame({'ticker': 'BOVA11.SA', 'data': pd.DatetimeIndex(calendar), 'fechamento': prices}),
+    ], ignore_index=True)
+    
+    dates, levels = build_level_matrix(frame, ['BOVA11.SA', 'CDI'], {'CDI': 'diaria'})
+    returns = compute_returns(levels)
+    
+    assert len(dates) == len(calendar)
+    assert np.allclose(returns[:, 1], 0.0005)
+    assert np.allclose(returns[:, 0], prices[1:] / prices[:-1] - 1)
+    
+    cube, _ = rolling_covariance(returns, 63)
+    assert np.allclose(cube[:, 1, :], 0.0, atol=1e-15)
+    assert np.all(cube[:, 0, 0] > 0)
+
+def test_incremental_window_matches_direct_computation():
+    returns = np.random.default_rng(2).normal(0, 0.01, (600, 4))
+    
+    incremental, ends = rolling_covariance(returns, 50, step=1)
+    direct, _ = rolling_covariance(returns, 50, step=50)
+    
+    assert np.allclose(incremental[::50], direct)
+    assert np.allclose(incremental[-1], np.cov(returns[ends[-1] - 49:ends[-1] + 1], rowvar=False))
+
+def test_ewma_covariance_is_symmetric():
+    returns = np.random.default_rng(3).normal(0, 0.01, (300, 3))
+    cube, _ = ewma_covariance(returns, 0.94)
+    
+    assert np.allclose(cube, cube.transpose(0, 2, 1))
+    assert np.all(np.diagonal(cube, axis1=1, axis2=2) > 0)
+
+def test_windows_before_a_ticker_starts_are_not_zero_filled():
+    calendar = business_days('2023-01-02', '2023-12-29')
+    rng = np.random.default_rng(4)
+    prices = 10 * np.cumprod(1 + rng.normal(0, 0.01, (len(calendar), 2)), axis=0)
+    frame = pd.concat([
+        pd.DataFrame({'ticker': 'BOVA11.SA', 'data': pd.DatetimeIndex(calendar), 'fechamento': prices[:, 0]}),
+        pd.DataFrame({'ticker': 'NOVA3.SA', 'data': pd.DatetimeIndex(calendar[100:]), 'fechamento': prices[100:, 1]}),
+    ], ignore_index=True)
+    
+    _, levels = build_level_matrix(frame, ['BOVA11.SA', 'NOVA3.SA'], {})
+    returns = compute_returns(levels)
+    assert np.isnan(returns[:100, 1]).all() and np.isfinite(returns[100:]).all()
+    
+    incremental, ends = rolling_covariance(returns, 50, step=1)
+    direct, _ = rolling_covariance(returns, 50, step=50)
+    assert np.allclose(incremental[::50], direct, equal_nan=True)
+    
+    straddling = ends < 149
+    assert np.isnan(incremental[straddling][:, 1, :]).all()
+    assert np.isnan(incremental[straddling][:, 0, 1]).all()
+    for i in (0, len(ends) - 1):
+        expected = np.var(returns[ends[i] - 49:ends[i] + 1, 0], ddof=1)
+        assert np.isclose(incremental[i, 0, 0], expected)
+    
+    full = ends[~straddling][0]
+    assert np.allclose(incremental[~straddling][0], np.cov(returns[full - 49:full + 1], rowvar=False))
+    
+    ewma, ewma_ends = ewma_covariance(returns, 0.94, warmup=20)
+    assert np.isnan(ewma[ewma_ends < 120][:, 1, 1]).all()
+    assert np.isfinite(ewma[ewma_ends >= 120]).all()
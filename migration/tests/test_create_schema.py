@@ -0,0 +1,65 @@
+"""Testes do DDL de dados_historicos por layout"""
+
+import pytest
+
+from create_schema import (
+    MAX_IDENTIFIER_LENGTH, build_ticker_partition_commands, get_dados_historicos_ddl,
+    get_index_commands, get_partition_name
+)
+
+def dados_historicos_indexes(layout):
+    return [c for c in get_index_commands(layout) if ' ON dados_historicos' in c]
+
+def test_partition_names_do_not_collide():
+    names = {get_partition_name(f't_{ticker}') for ticker in ['BRK-B', 'BRK.B', 'brk_b', 'BRK_B']}
+    assert len(names) == 4
+
+def test_partition_names_fit_postgres_identifiers():
+    name = get_partition_name('t_' + 'X' * 80)
+    assert len(name) == MAX_IDENTIFIER_LENGTH
+    assert name != get_partition_name('t_' + 'X' * 81)
+
+def test_plain_partition_names_are_kept():
+    assert get_partition_name('y2020') == 'dados_historicos_y2020'
+    assert get_partition_name('default') == 'dados_historicos_default'
+
+@pytest.mark.parametrize('layout, clause', [
+    ('heap', None), ('range', 'PARTITION BY RANGE (data)'), ('list', 'PARTITION BY LIST (ticker)')
+])
+def test_dados_historicos_ddl_per_layout(layout, clause):
+    ddl = get_dados_historicos_ddl(layout)
+    if clause is None:
+        assert 'PARTITION BY' not in ddl
+    else:
+        assert ddl.rstrip().endswith(clause)
+
+def test_new_ticker_partitions_move_rows_out_of_default():
+    existing = {get_partition_name('t_PETR4.SA'), get_partition_name('default')}
+    missing, commands = build_ticker_partition_commands(['VALE3.SA', 'PETR4.SA', 'BRK-B'], existing)
+    sql = [command for command, _ in commands]
+    
+    assert missing == ['BRK-B', 'VALE3.SA']
+    assert sql[0] == 'ALTER TABLE dados_historicos DETACH PARTITION dados_historicos_default'
+    assert [params for command, params in commands if command.startswith('CREATE')] == [('BRK-B',), ('VALE3.SA',)]
+    assert sql[-3].startswith('INSERT INTO dados_historicos SELECT * FROM dados_historicos_default')
+    assert sql[-2].startswith('DELETE FROM dados_historicos_default')
+    assert sql[-1].endswith('ATTACH PARTITION dados_historicos_default DEFAULT')
+
+def test_ticker_partitions_without_default_only_create():
+    missing, commands = build_ticker_partition_commands(['VALE3.SA'], set())
+    
+    assert missing == ['VALE3.SA']
+    assert len(commands) == 1 and commands[0][0].startswith('CREATE TABLE')
+    assert build_ticker_partition_commands(['VALE3.SA'], {get_partition_name('t_VALE3.SA')}) == ([], [])
+
+def test_index_commands_per_layout():
+    heap = dados_historicos_indexes('heap')
+    assert len(heap) == 3 and not any('brin' in c for c in heap)
+    
+    for layout in ['range', 'list']:
+        assert dados_historicos_indexes(layout) == [
+            "CREATE INDEX IF NOT EXISTS idx_dados_historicos_data_brin ON dados_historicos USING brin (data)"
+        ]
+    
+    shared = [c for c in get_index_commands('heap') if ' ON dados_historicos' not in c]
+    assert all(c in get_index_commands(layout) for layout in ['range', 'list'] for c in shared)
@@ -0,0 +1,93 @@
+"""Testes do cache LRU de data_access (sem banco: leituras em memória)"""
+
+import numpy as np
+
+from data_access import DataAccess, get_connection_params
+
+ROWS = 10
+ENTRY_BYTES = 2 * ROWS * 8
+
+class MemoryDataAccess(DataAccess):
+    """DataAccess com controle_carga e dados_historicos em memória"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(pool=object(), max_connections=1, **kwargs)
+        self.db_versions = {}
+        self.fetches = 0
+    
+    def _read_versions(self):
+        return dict(self.db_versions)
+    
+    def _fetch(self, ticker, start, end, columns):
+        self.fetches += 1
+        arrays = {'data': np.zeros(ROWS, dtype='datetime64[D]')}
+        arrays.update({column: np.zeros(ROWS) for column in columns})
+        return self.db_versions.get(ticker), arrays
+
+def test_repeated_read_is_a_hit():
+    data = MemoryDataAccess(max_bytes=10 * ENTRY_BYTES, version_ttl=60)
+    first = data.read_range('PETR4.SA', '2020-01-01', '2020-12-31')
+    second = data.read_range('PETR4.SA', '2020-01-01', '2020-12-31')
+    
+    stats = data.stats()
+    assert second is first
+    assert data.fetches == 1
+    assert (stats['hits'], stats['misses'], stats['bytes']) == (1, 1, ENTRY_BYTES)
+
+def test_least_recently_used_entry_is_evicted_by_bytes():
+    data = MemoryDataAccess(max_bytes=2 * ENTRY_BYTES, version_ttl=60)
+    data.read_range('A')
+    data.read_range('B')
+    data.read_range('A')
+    data.read_range('C')
+    
+    assert data.stats()['evictions'] == 1
+    assert data.stats()['bytes'] == 2 * ENTRY_BYTES
+    
+    data.read_range('A')
+    assert data.fetches == 3
+    data.read_range('B')
+    assert data.fetches == 4
+
+def test_entry_larger_than_cache_is_not_stored():
+    data = MemoryDataAccess(max_bytes=ENTRY_BYTES - 1, version_ttl=60)
+    data.read_range('A')
+    data.read_range('A')
+    
+    assert data.fetches == 2
+    assert data.stats()['entradas'] == 0
+
+def test_new_load_version_invalidates_after_ttl():
+    data = MemoryDataAccess(max_bytes=10 * ENTRY_BYTES, version_ttl=60)
+    data.db_versions = {'A': 1, 'B': 1}
+    data.read_range('A')
+    data.read_range('B')
+    
+    # Dentro do TTL a versão não é relida: a entrada antiga ainda é servida
+    data.db_versions['A'] = 2
+    data.read_range('A')
+    assert data.fetches == 2
+    
+    assert data.refresh_versions(force=True) == 1
+    data.read_range('A')
+    data.read_range('B')
+    
+    assert data.fetches == 3
+    assert data.stats()['invalidations'] == 1
+
+def test_zero_ttl_rereads_versions_on_every_read():
+    data = MemoryDataAccess(max_bytes=10 * ENTRY_BYTES, version_ttl=0)
+    data.db_versions = {'A': 1}
+    data.read_range('A')
+    data.db_versions['A'] = 2
+    data.read_range('A')
+    
+    assert data.fetches == 2
+
+def test_target_params_fall_back_to_local(monkeypatch):
+    monkeypatch.setenv('POSTGRES_DB', 'local_db')
+    monkeypatch.setenv('STAGING_POSTGRES_HOST', 'staging.example')
+    
+    params = get_connection_params('STAGING_')
+    assert params['host'] == 'staging.example'
+    assert params['database'] == 'local_db'
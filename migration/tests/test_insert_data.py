@@ -0,0 +1,66 @@
+"""Testes das consultas montadas pela carga"""
+
+import io
+import queue
+
+from tqdm import tqdm
+
+from insert_data import (build_staging_insert_query, build_upsert_query, get_dedup_columns,
+                         load_target, ProgressReader)
+
+def set_clause(query):
+    return query.split('DO UPDATE SET', 1)[1].split('WHERE', 1)[0]
+
+def test_natural_key_upsert_preserves_existing_id():
+    columns = ['id', 'ticker', 'data', 'fechamento']
+    query, keys = build_upsert_query('dados_historicos', columns, get_dedup_columns('dados_historicos', columns))
+    
+    assert keys == ['ticker', 'data']
+    assert 'id = EXCLUDED.id' not in query
+    assert 'dados_historicos.id' not in query
+    assert 'fechamento = EXCLUDED.fechamento' in set_clause(query)
+
+def test_id_keyed_upsert_updates_other_columns():
+    columns = ['id', 'nome', 'ativos']
+    query, keys = build_upsert_query('cestas', columns, get_dedup_columns('cestas', columns))
+    
+    assert keys == ['id']
+    assert 'ON CONFLICT (id)' in query
+    assert set_clause(query).strip() == 'nome = EXCLUDED.nome, ativos = EXCLUDED.ativos'
+
+def test_staging_dedup_covers_natural_key_and_id():
+    query = build_staging_insert_query('dados_historicos', 'dados_historicos_staging',
+                                       ['id', 'ticker', 'data', 'fechamento'])
+    
+    assert 'DISTINCT ON (ticker, data)' in query
+    assert 'DISTINCT ON (id)' in query
+    assert 'WHERE (t.id) = (s.id)' in query
+    assert 'WHERE (t.ticker, t.data) = (s.ticker, s.data)' in query
+
+def test_staging_dedup_by_id_only_once():
+    query = build_staging_insert_query('cestas', 'cestas_staging', ['id', 'nome'])
+    
+    assert query.count('DISTINCT ON') == 1
+
+def test_progress_rewind_discounts_failed_attempt():
+    progress = tqdm(file=io.StringIO())
+    reader = ProgressReader(io.BytesIO(b'a,1\nb,2\n'), progress)
+    reader.readline()
+    reader.read()
+    
+    assert progress.n == 8
+    reader.rewind()
+    assert progress.n == 0
+
+def test_unreachable_target_fails_fast_for_every_table():
+    tasks = queue.Queue()
+    for table in ('ativos', 'cestas', 'transacoes'):
+        tasks.put((table, ['id'], b'1\n', None))
+    tasks.put(None)
+    config = dict(host='127.0.0.1', port=1, database='x', user='x', password='x', connect_timeout=2)
+    
+    results, elapsed = load_target('morto', config, tasks, 0, retries=3)
+    
+    assert list(results) == ['ativos', 'cestas', 'transacoes']
+    assert len({id(error) for error in results.values()}) == 1
+    assert elapsed < 1
@@ -0,0 +1,39 @@
+"""Testes do despacho de subcomandos de migrate.py (passos não são executados)"""
+
+import pytest
+
+import migrate
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    """Captura o passo que main() executaria"""
+    calls = []
+    monkeypatch.setattr(migrate, 'run_step', lambda title, target: calls.append((title, target)) or True)
+    monkeypatch.setattr(migrate, 'full_migration', lambda use_async=False: calls.append(('all', use_async)) or 0)
+    monkeypatch.delenv('IDEMPOTENT_LOAD', raising=False)
+    return calls
+
+@pytest.mark.parametrize('argv', [['analytics'], ['--step', 'analytics']])
+def test_subcommand_and_step_flag_dispatch_the_same_step(dispatched, argv):
+    assert migrate.main(argv + ['--skip-checks']) == 0
+    assert dispatched == [("Atualização dos Resumos", "refresh_analytics:main")]
+
+def test_default_is_full_migration(dispatched):
+    assert migrate.main(['--skip-checks', '--async']) == 0
+    assert dispatched == [('all', True)]
+
+def test_async_swaps_only_extract_and_insert(dispatched):
+    migrate.main(['extract', '--async', '--skip-checks'])
+    migrate.main(['quality', '--async', '--skip-checks'])
+    
+    assert [target for _, target in dispatched] == ["async_engine:extract_main", "scan_quality:main"]
+
+def test_async_idempotent_load_is_refused(dispatched, monkeypatch):
+    monkeypatch.setattr(migrate.os, 'environ', dict(migrate.os.environ))
+    
+    assert migrate.main(['insert', '--async', '--idempotent', '--skip-checks']) == 1
+    assert dispatched == []
+
+def test_unknown_step_is_rejected():
+    with pytest.raises(SystemExit):
+        migrate.build_parser().parse_args(['deploy'])
@@ -0,0 +1,44 @@
+"""Testes dos retornos mensais e da simulação de Monte Carlo"""
+
+import numpy as np
+import pandas as pd
+
+from align_series import build_level_matrix
+from monte_carlo import build_cash_flows, build_return_model, compute_monthly_returns, simulate_chunk
+from trading_calendar import business_days
+
+def test_constant_cdi_gives_positive_monthly_returns():
+    calendar = business_days('2020-01-02', '2023-12-29')
+    frame = pd.DataFrame({'ticker': 'CDI', 'data': pd.DatetimeIndex(calendar), 'fechamento': 0.0411})
+    
+    months, returns = compute_monthly_returns(*build_level_matrix(frame, ['CDI'], {'CDI': 'diaria'}), ['CDI'])
+    
+    # Um passo de 0,0411% por dia útil do mês (a taxa de um dia rende no seguinte)
+    month_index = calendar.astype('datetime64[M]')
+    steps = np.array([np.sum(month_index == month) for month in months])
+    
+    assert len(months) == 47
+    assert np.all(returns[:, 0] > 0)
+    assert np.allclose(returns[:, 0], 1.000411 ** steps - 1)
+
+def test_constant_monthly_cdi_gives_constant_monthly_return():
+    frame = pd.DataFrame({'ticker': 'CDI_MENSAL', 'data': pd.date_range('2020-01-01', '2023-12-01', freq='MS'),
+                          'fechamento': 0.9})
+    
+    _, returns = compute_monthly_returns(
+        *build_level_matrix(frame, ['CDI_MENSAL'], {'CDI_MENSAL': 'mensal'}), ['CDI_MENSAL'])
+    
+    assert np.allclose(returns[:, 0], 0.009)
+
+def test_riskless_plan_matches_closed_form():
+    plan = {'idade_atual': 30, 'idade_aposentadoria': 31, 'periodo_usufruir': 1,
+            'aporte_mensal': 100.0, 'renda_anual': 0.0}
+    model = build_return_model(np.full((24, 1), 0.01), [1.0], 'bootstrap')
+    
+    yearly, ruin_month = simulate_chunk((1, 3, model, build_cash_flows(plan), 1000.0))
+    
+    wealth = 1000.0
+    for _ in range(12):
+        wealth = wealth * 1.01 + 100.0
+    assert np.allclose(yearly[:, 1], wealth)
+    assert not ruin_month.any()
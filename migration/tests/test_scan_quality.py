@@ -0,0 +1,105 @@
+"""Testes da varredura de qualidade"""
+
+import numpy as np
+import pandas as pd
+
+from scan_quality import new_report, scan_frame
+from trading_calendar import business_days
+
+def price_frame(ticker, dates, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 20 * np.cumprod(1 + rng.normal(0, 0.01, len(dates)))
+    return pd.DataFrame({
+        'ticker': ticker,
+        'data': pd.DatetimeIndex(dates),
+        'abertura': close,
+        'maxima': close * 1.01,
+        'minima': close * 0.99,
+        'fechamento': close,
+        'retorno_diario': np.nan,
+    })
+
+def totals(report):
+    return {check: entry['total'] for check, entry in report['verificacoes'].items()}
+
+def test_clean_history_has_no_anomalies():
+    # Inclui 25/01, 09/07 e 20/11 de anos até 2021 (B3 fechada em São Paulo)
+    frame = pd.concat([
+        price_frame('PETR4.SA', business_days('2015-01-02', '2023-12-28')),
+        price_frame('USDBRL=X', business_days('2015-01-02', '2023-12-28', 'fx'), seed=1),
+    ], ignore_index=True)
+    
+    report = scan_frame(frame, new_report(6.0))
+    
+    assert report['linhas'] == len(frame)
+    assert report['tickers'] == 2
+    assert all(total == 0 for total in totals(report).values())
+
+def test_sao_paulo_closure_is_not_a_gap():
+    days = pd.bdate_range('2021-01-18', '2021-01-29')
+    frame = price_frame('PETR4.SA', days[days != pd.Timestamp('2021-01-25')])
+    
+    report = scan_frame(frame, new_report(6.0))
+    
+    assert totals(report)['lacuna'] == 0
+    assert totals(report)['fora_calendario'] == 0
+
+def test_each_check_is_detected():
+    days = business_days('2023-01-02', '2023-12-28')
+    frame = price_frame('VALE3.SA', np.delete(days, [10, 11, 12]))
+    
+    frame.loc[20, 'fechamento'] = -1.0
+    frame.loc[30, 'minima'] = frame.loc[30, 'maxima'] * 2
+    frame.loc[40, 'retorno_diario'] = 0.9
+    weekend = frame.iloc[[50]].assign(data=pd.Timestamp('2023-06-03'))
+    duplicate = frame.iloc[[60]]
+    frame = pd.concat([frame, weekend, duplicate], ignore_index=True)
+    
+    report = scan_frame(frame, new_report(6.0))
+    found = totals(report)
+    
+    assert found['lacuna'] == 3
+    assert found['fora_calendario'] == 1
+    assert found['duplicado'] == 1
+    assert found['fechamento_invalido'] == 1
+    assert found['ohlc_inconsistente'] == 2
+    assert found['outlier_retorno'] >= 1
+    assert report['verificacoes']['lacuna']['por_ticker'] == {'VALE3.SA': 3}
+
+def rate_frame(ticker, dates, rates):
+    rates = np.asarray(rates, dtype=np.float64)
+    return pd.DataFrame({
+        'ticker': ticker,
+        'data': pd.DatetimeIndex(dates),
+        'abertura': np.nan,
+        'maxima': np.nan,
+        'minima': np.nan,
+        'fechamento': rates,
+        'retorno_diario': np.nan,
+    })
+
+RATES = {'CDI': 'diaria', 'IPCA': 'mensal'}
+
+def test_rate_series_use_their_own_calendar():
+    months = pd.date_range('2020-01-01', '2023-12-01', freq='MS')
+    ipca = np.where(np.arange(len(months)) % 7 == 0, -0.2, 0.4)
+    cdi_days = business_days('2020-01-02', '2023-12-29', 'bcb')
+    frame = pd.concat([
+        rate_frame('IPCA', months, ipca),
+        rate_frame('CDI', cdi_days, np.full(len(cdi_days), 0.045)),
+    ], ignore_index=True)
+    
+    report = scan_frame(frame, new_report(6.0), rate_tickers=RATES)
+    
+    # Dias de banco com B3 fechada (25/01/2021, 24/12) são dias de CDI
+    assert np.datetime64('2021-01-25') in cdi_days
+    assert all(total == 0 for total in totals(report).values())
+
+def test_missing_month_is_one_gap():
+    months = pd.date_range('2022-01-01', '2022-12-01', freq='MS')
+    frame = rate_frame('IPCA', months.delete(5), np.full(11, 0.5))
+    
+    report = scan_frame(frame, new_report(6.0), rate_tickers=RATES)
+    
+    assert totals(report)['lacuna'] == 1
+    assert totals(report)['fora_calendario'] == 0
@@ -0,0 +1,75 @@
+"""Testes do manifest e da conferência de checksums do snapshot (sem banco)"""
+
+import gzip
+import hashlib
+import json
+
+import pytest
+
+from snapshot import (MANIFEST_FILE, MANIFEST_VERSION, check_snapshot_files,
+                      compute_schema_hash, load_manifest)
+
+def write_table_file(snapshot_dir, table, content):
+    """Grava <tabela>.copy.gz como export_table e retorna a entrada do manifest"""
+    filename = f"{table}.copy.gz"
+    compressed = gzip.compress(content, mtime=0)
+    (snapshot_dir / filename).write_bytes(compressed)
+    return {
+        'file': filename,
+        'rows': 1,
+        'columns': [['id', 'integer']],
+        'content_bytes': len(content),
+        'content_sha256': hashlib.sha256(content).hexdigest(),
+        'file_bytes': len(compressed),
+        'file_sha256': hashlib.sha256(compressed).hexdigest(),
+    }
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    tables = {
+        'ativos': write_table_file(tmp_path, 'ativos', b'PGCOPY ativos' * 100),
+        'cestas': write_table_file(tmp_path, 'cestas', b'PGCOPY cestas' * 100),
+    }
+    manifest = {'version': MANIFEST_VERSION, 'schema_hash': 'x', 'tables': tables}
+    (tmp_path / MANIFEST_FILE).write_text(json.dumps(manifest), encoding='utf-8')
+    return tmp_path
+
+def test_intact_snapshot_passes(snapshot_dir):
+    assert check_snapshot_files(snapshot_dir, load_manifest(snapshot_dir)) == {}
+
+def test_corrupted_file_is_reported(snapshot_dir):
+    path = snapshot_dir / 'cestas.copy.gz'
+    data = bytearray(path.read_bytes())
+    data[-10] ^= 0xFF
+    path.write_bytes(bytes(data))
+    
+    errors = check_snapshot_files(snapshot_dir, load_manifest(snapshot_dir))
+    assert list(errors) == ['cestas']
+
+def test_recompressed_file_with_other_content_is_reported(snapshot_dir):
+    manifest = load_manifest(snapshot_dir)
+    entry = write_table_file(snapshot_dir, 'ativos', b'outro conteudo')
+    manifest['tables']['ativos']['file_sha256'] = entry['file_sha256']
+    
+    errors = check_snapshot_files(snapshot_dir, manifest)
+    assert 'conteudo de ativos' in str(errors['ativos'])
+
+def test_missing_file_is_reported(snapshot_dir):
+    (snapshot_dir / 'ativos.copy.gz').unlink()
+    assert list(check_snapshot_files(snapshot_dir, load_manifest(snapshot_dir))) == ['ativos']
+
+def test_unsupported_manifest_version(snapshot_dir):
+    manifest = json.loads((snapshot_dir / MANIFEST_FILE).read_text(encoding='utf-8'))
+    manifest['version'] = MANIFEST_VERSION + 1
+    (snapshot_dir / MANIFEST_FILE).write_text(json.dumps(manifest), encoding='utf-8')
+    
+    with pytest.raises(ValueError, match='Versao de manifest'):
+        load_manifest(snapshot_dir)
+
+def test_schema_hash_ignores_table_order_but_not_types():
+    columns = {'ativos': [['id', 'integer']], 'cestas': [['id', 'integer'], ['nome', 'text']]}
+    reordered = dict(reversed(list(columns.items())))
+    retyped = dict(columns, ativos=[['id', 'bigint']])
+    
+    assert compute_schema_hash(columns) == compute_schema_hash(reordered)
+    assert compute_schema_hash(columns) != compute_schema_hash(retyped)
@@ -0,0 +1,63 @@
+"""Testes dos calendários de dias úteis"""
+
+from datetime import date
+
+import numpy as np
+
+from trading_calendar import b3_holidays, business_days, calendar_kind_for_ticker, easter_sunday
+
+def is_b3_business_day(day):
+    return np.datetime64(day, 'D') in business_days(day, day)
+
+def test_easter_sunday():
+    assert easter_sunday(2019) == date(2019, 4, 21)
+    assert easter_sunday(2024) == date(2024, 3, 31)
+    assert easter_sunday(2025) == date(2025, 4, 20)
+
+def test_moving_holidays():
+    holidays = b3_holidays(2024, 2024)
+    for day in ['2024-02-12', '2024-02-13', '2024-03-29', '2024-05-30']:
+        assert np.datetime64(day) in holidays
+    
+    # Quarta-feira de Cinzas tem pregão (a partir da tarde)
+    assert is_b3_business_day(date(2024, 2, 14))
+
+def test_sao_paulo_closures_until_2021():
+    assert not is_b3_business_day(date(2021, 1, 25))
+    assert not is_b3_business_day(date(2020, 7, 9))
+    assert not is_b3_business_day(date(2019, 11, 20))
+    assert is_b3_business_day(date(2003, 11, 20))
+    
+    assert is_b3_business_day(date(2022, 1, 25))
+    assert is_b3_business_day(date(2022, 7, 8))
+    assert is_b3_business_day(date(2023, 11, 20))
+
+def test_black_consciousness_day_is_national_from_2024():
+    assert not is_b3_business_day(date(2024, 11, 20))
+    assert not is_b3_business_day(date(2025, 11, 20))
+
+def test_year_end_closures():
+    assert not is_b3_business_day(date(2020, 12, 24))
+    assert not is_b3_business_day(date(2020, 12, 31))
+    assert is_b3_business_day(date(2020, 12, 30))
+
+def test_fx_calendar_ignores_b3_holidays():
+    days = business_days(date(2024, 2, 12), date(2024, 2, 18), 'fx')
+    assert len(days) == 5
+    assert calendar_kind_for_ticker('USDBRL=X') == 'fx'
+    assert calendar_kind_for_ticker('PETR4.SA') == 'b3'
+
+def test_rate_calendars():
+    rates = {'CDI': 'diaria', 'SELIC': 'anual', 'IPCA': 'mensal'}
+    assert calendar_kind_for_ticker('CDI', rates) == 'bcb'
+    assert calendar_kind_for_ticker('SELIC', rates) == 'bcb'
+    assert calendar_kind_for_ticker('IPCA', rates) == 'mensal'
+    assert calendar_kind_for_ticker('PETR4.SA', rates) == 'b3'
+    
+    bank_days = business_days(date(2021, 12, 20), date(2022, 1, 3), 'bcb')
+    assert np.datetime64('2021-12-24') in bank_days
+    assert np.datetime64('2021-12-31') in bank_days
+    assert np.datetime64('2021-12-25') not in bank_days
+    
+    months = business_days(date(2024, 1, 15), date(2024, 4, 1), 'mensal')
+    assert list(months.astype(str)) == ['2024-02-01', '2024-03-01', '2024-04-01']
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Calendários de dias úteis usados pelas etapas de qualidade e alinhamento
+
+- b3: dias úteis da B3 (fins de semana, feriados nacionais, Carnaval,
+  Sexta-feira Santa, Corpus Christi, 24/12, 31/12 e, até 2021, os
+  feriados de São Paulo)
+- fx: dias úteis simples (seg-sex), para câmbio como USDBRL=X
+- bcb: dias úteis bancários nacionais, para as taxas diárias do Banco
+  Central (CDI)
+- mensal: primeiro dia de cada mês, para as taxas mensais (IPCA)
+
+As séries de taxa são configuradas em ALIGN_RATE_TICKERS (get_rate_tickers).
+"""
+
+import os
+from datetime import date, timedelta
+import numpy as np
+
+# Períodos aceitos para as séries de taxa em ALIGN_RATE_TICKERS
+RATE_PERIODS = ['diaria', 'mensal', 'anual']
+
+# Séries de taxa do app (financialDataFetcher): CDI diário e CDI/IPCA mensais
+DEFAULT_RATE_TICKERS = 'CDI:diaria,CDI_MENSAL:mensal,IPCA:mensal'
+
+# Feriados nacionais de data fixa (mês, dia)
+NATIONAL_FIXED_HOLIDAYS = [
+    (1, 1),    # Confraternização Universal
+    (4, 21),   # Tiradentes
+    (5, 1),    # Dia do Trabalho
+    (9, 7),    # Independência
+    (10, 12),  # Nossa Senhora Aparecida
+    (11, 2),   # Finados
+    (11, 15),  # Proclamação da República
+    (12, 25),  # Natal
+]
+
+# Dias sem pregão na B3 além dos feriados nacionais (mês, dia)
+B3_FIXED_CLOSURES = [
+    (12, 24),  # Véspera de Natal
+    (12, 31),  # Último dia do ano
+]
+
+# Consciência Negra é feriado nacional a partir de 2024 (Lei 14.759/2023)
+BLACK_CONSCIOUSNESS_DAY_SINCE = 2024
+
+# Feriados de São Paulo em que a B3 fechou até 2021 (mês, dia, primeiro ano,
+# último ano); None = sem limite
+B3_SAO_PAULO_HOLIDAYS = [
+    (1, 25, None, 2021),   # Aniversário de São Paulo
+    (7, 9, 1997, 2021),    # Revolução Constitucionalista (feriado estadual)
+    (11, 20, 2004, 2021),  # Consciência Negra (feriado municipal)
+]
+
+def easter_sunday(year):
+    """Domingo de Páscoa (algoritmo gregoriano anônimo)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def b3_holidays(start_year, end_year):
+    """Feriados da B3 entre os anos informados (inclusive)"""
+    closures = []
+    
+    for year in range(start_year, end_year + 1):
+        closures.extend(date(year, month, day) for month, day in B3_FIXED_CLOSURES)
+        closures.extend(
+            date(year, month, day) for month, day, first, last in B3_SAO_PAULO_HOLIDAYS
+            if (first is None or year >= first) and (last is None or year <= last)
+        )
+    
+    return np.union1d(national_holidays(start_year, end_year),
+                      np.array(closures, dtype='datetime64[D]'))
+
+def national_holidays(start_year, end_year):
+    """Feriados bancários nacionais entre os anos informados (inclusive)"""
+    holidays = []
+    
+    for year in range(start_year, end_year + 1):
+        holidays.extend(date(year, month, day) for month, day in NATIONAL_FIXED_HOLIDAYS)
+        if year >= BLACK_CONSCIOUSNESS_DAY_SINCE:
+            holidays.append(date(year, 11, 20))
+        
+        easter = easter_sunday(year)
+        holidays.extend([
+            easter - timedelta(days=48),  # Carnaval (segunda)
+            easter - timedelta(days=47),  # Carnaval (terça)
+            easter - timedelta(days=2),   # Sexta-feira Santa
+            easter + timedelta(days=60),  # Corpus Christi
+        ])
+    
+    return np.array(sorted(holidays), dtype='datetime64[D]')
+
+def get_rate_tickers():
+    """Tickers cujo fechamento é uma taxa em %, com o período de cada um
+    
+    ALIGN_RATE_TICKERS lista TICKER[:periodo] separados por vírgula
+    (periodo: diaria, mensal ou anual; padrão diaria). Retorna {ticker: periodo}.
+    """
+    rate_tickers = {}
+    
+    for entry in os.getenv('ALIGN_RATE_TICKERS', DEFAULT_RATE_TICKERS).split(','):
+        ticker, _, period = entry.strip().partition(':')
+        if not ticker:
+            continue
+        period = period.strip() or 'diaria'
+        if period not in RATE_PERIODS:
+            raise ValueError(f"Periodo invalido para {ticker} em ALIGN_RATE_TICKERS: {period} "
+                             f"(use: {', '.join(RATE_PERIODS)})")
+        rate_tickers[ticker] = period
+    
+    return rate_tickers
+
+def calendar_kind_for_ticker(ticker, rate_tickers=None):
+    """Calendário de um ticker
+    
+    Séries de taxa (rate_tickers, {ticker: periodo}) usam 'mensal' ou 'bcb';
+    câmbio (sufixo =X) usa 'fx' e os demais, 'b3'.
+    """
+    period = (rate_tickers or {}).get(ticker)
+    if period is not None:
+        return 'mensal' if period == 'mensal' else 'bcb'
+    return 'fx' if str(ticker).endswith('=X') else 'b3'
+
+def business_days(start, end, kind='b3'):
+    """Dias do calendário kind entre start e end (inclusive) como datetime64[D] ordenado"""
+    start = np.datetime64(start, 'D')
+    end = np.datetime64(end, 'D')
+    days = np.arange(start, end + np.timedelta64(1, 'D'), dtype='datetime64[D]')
+    
+    if kind == 'fx':
+        return days[np.is_busday(days)]
+    if kind == 'mensal':
+        return days[days == days.astype('datetime64[M]').astype('datetime64[D]')]
+    
+    first_year = int(str(start)[:4])
+    last_year = int(str(end)[:4])
+    holidays = national_holidays if kind == 'bcb' else b3_holidays
+    return days[np.is_busday(days, holidays=holidays(first_year, last_year))]
@@ -4,26 +4,19 @@ Script para verificar se a migração foi bem-sucedida
 """
 
 import os
-import psycopg2
-from supabase import create_client
 from dotenv import load_dotenv
 from datetime import datetime
 
+from data_access import get_postgres_connection
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
-def get_postgres_connection():
-    """Cria conexão com PostgreSQL local"""
-    return psycopg2.connect(
-        host=os.getenv('POSTGRES_HOST', 'localhost'),
-        port=os.getenv('POSTGRES_PORT', '5432'),
-        database=os.getenv('POSTGRES_DB', 'paridaderisco'),
-        user=os.getenv('POSTGRES_USER', 'postgres'),
-        password=os.getenv('POSTGRES_PASSWORD', 'postgres')
-    )
-
 def get_supabase_client():
     """Cria cliente do Supabase"""
+    # Import tardio: só a comparação de contagens precisa do cliente supabase
+    from supabase import create_client
+    
     url = os.getenv('SUPABASE_URL')
     key = os.getenv('SUPABASE_KEY')
     